@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+音訊讀取共用工具
+scp 解析、路徑解析，以及與 AudioDataset 相同的 soundfile + librosa 前處理
+(讀取 → 轉單聲道 → 重取樣到 target_sample_rate → 峰值正規化)
+"""
+
+import os
+import math
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+
+def read_scp(scp_path):
+    """
+    讀取 scp 檔 (每行 "uttid path")
+
+    Returns:
+        dict: uttid → 路徑字串 (保持檔案順序)
+    """
+    entries = {}
+    with open(scp_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            uttid, path = line.split(maxsplit=1)
+            entries[uttid] = path
+    return entries
+
+
+def resolve_audio_path(path, scp_path=None, root=None):
+    """
+    解析 scp 中的相對路徑
+
+    指定 root 時以 root 為基準；否則依序嘗試目前目錄、scp 所在目錄及其上兩層，
+    回傳第一個存在的路徑 (都不存在時回傳以目前目錄為基準的路徑)
+    """
+    path = Path(path)
+    if path.is_absolute():
+        return path
+    if root is not None:
+        return Path(root) / path
+
+    candidates = [Path(os.getcwd()) / path]
+    if scp_path is not None:
+        scp_dir = Path(scp_path).resolve().parent
+        candidates += [scp_dir / path, scp_dir.parent / path, scp_dir.parent.parent / path]
+    for candidate in candidates:
+        if candidate.exists():
+            return candidate
+    return candidates[0]
+
+
+def read_paired_scp(clean_scp_path, noisy_scp_path, root=None):
+    """
+    讀取成對的 clean/noisy scp，只保留兩邊都有的 uttid (依 clean scp 順序)
+
+    Returns:
+        list: (uttid, clean_path, noisy_path)
+    """
+    clean = read_scp(clean_scp_path)
+    noisy = read_scp(noisy_scp_path)
+    return [
+        (uttid,
+         resolve_audio_path(clean[uttid], clean_scp_path, root),
+         resolve_audio_path(noisy[uttid], noisy_scp_path, root))
+        for uttid in clean if uttid in noisy
+    ]
+
+
+def to_mono(audio):
+    """多聲道音訊取平均轉為單聲道"""
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return audio
+
+
+def normalize_waveform(audio, eps=1e-8):
+    """峰值正規化到 [-1, 1]"""
+    peak = np.max(np.abs(audio)) if audio.size > 0 else 0.0
+    if peak > eps:
+        audio = audio / peak
+    return audio
+
+
+def resample_waveform(audio, orig_sr, target_sr, backend='librosa'):
+    """
+    重取樣一維 (或 (N, T)) numpy 波形
+
+    Args:
+        backend: 'librosa' (soxr_hq，與 AudioDataset 相同) 或 'torch'
+                 (torch_resampler 的快取濾波器組，誤差見該模組說明)
+    """
+    if orig_sr == target_sr:
+        return audio
+    if backend == 'torch':
+        import torch
+        from torch_resampler import resample
+        return resample(torch.from_numpy(np.ascontiguousarray(audio)), orig_sr, target_sr).numpy()
+    if backend != 'librosa':
+        raise ValueError(f"不支援的重取樣後端: {backend}")
+    import librosa
+    return librosa.resample(audio, orig_sr=orig_sr, target_sr=target_sr)
+
+
+def load_waveform(path, target_sample_rate=16000, normalize=True, backend='librosa'):
+    """
+    讀取並前處理一個音訊檔 (同 AudioDataset 的 soundfile + librosa 流程)
+
+    Returns:
+        np.ndarray: float32 一維波形
+    """
+    audio, sr = sf.read(str(path), dtype='float32')
+    audio = to_mono(audio)
+    audio = resample_waveform(audio, sr, target_sample_rate, backend)
+    if normalize:
+        audio = normalize_waveform(audio)
+    return np.ascontiguousarray(audio, dtype=np.float32)
+
+
+def resample_alignment_step(orig_sr, target_sr):
+    """原始取樣率下的對齊步長：起點為此步長的倍數時，對應的目標取樣點為整數"""
+    return orig_sr // math.gcd(orig_sr, target_sr)
+
+
+def read_resampled_segment(path, start, length, target_sample_rate=16000,
+                           orig_sr=None, num_frames=None, margin_ms=8.0):
+    """
+    只讀取並重取樣檔案中的一段
+
+    以目標取樣率的 [start, start + length) 為準，換算回原始取樣率後，
+    前後各多讀 margin_ms 毫秒讓重取樣濾波器的邊界效應落在裁掉的區段；
+    讀取起點對齊到 resample_alignment_step，確保切片位置精確到取樣點
+
+    Args:
+        path: 音訊檔路徑
+        start, length: 目標取樣率下的起點與長度
+        target_sample_rate: 目標取樣率
+        orig_sr, num_frames: 檔頭資訊 (None 時以 soundfile.info 讀取)
+        margin_ms: 重取樣邊界餘量
+
+    Returns:
+        np.ndarray: float32 單聲道波形，長度為 length (檔尾不足時補零)
+    """
+    if orig_sr is None or num_frames is None:
+        info = sf.info(str(path))
+        orig_sr, num_frames = info.samplerate, info.frames
+
+    if orig_sr == target_sample_rate:
+        audio, _ = sf.read(str(path), start=start, frames=length, dtype='float32',
+                           fill_value=0.0, always_2d=True)
+        return np.ascontiguousarray(to_mono(audio), dtype=np.float32)
+
+    import librosa
+    step = resample_alignment_step(orig_sr, target_sample_rate)
+    margin = int(math.ceil(margin_ms * orig_sr / 1000))
+    src_start = start * orig_sr / target_sample_rate
+    src_end = (start + length) * orig_sr / target_sample_rate
+    read_start = max(0, int((src_start - margin) // step) * step)
+    read_end = min(num_frames, int(math.ceil(src_end)) + margin)
+
+    audio, _ = sf.read(str(path), start=read_start, stop=max(read_start, read_end),
+                       dtype='float32', always_2d=True)
+    audio = to_mono(audio)
+    if audio.shape[0] > 0:
+        audio = librosa.resample(audio, orig_sr=orig_sr, target_sr=target_sample_rate)
+
+    offset = start - read_start * target_sample_rate // orig_sr
+    segment = audio[offset:offset + length]
+    if segment.shape[0] < length:
+        segment = np.pad(segment, (0, length - segment.shape[0]))
+    return np.ascontiguousarray(segment, dtype=np.float32)
+
+
+def file_peak(path, target_sample_rate=None, block_frames=65536):
+    """
+    計算檔案的絕對值峰值
+
+    target_sample_rate 為 None 時以原始取樣率逐段掃描 (不需整檔載入)；
+    否則計算重取樣後的峰值，與 load_waveform 的正規化結果一致
+    """
+    if target_sample_rate is not None and sf.info(str(path)).samplerate != target_sample_rate:
+        audio = load_waveform(path, target_sample_rate, normalize=False)
+        return float(np.max(np.abs(audio))) if audio.size else 0.0
+    peak = 0.0
+    for block in sf.blocks(str(path), blocksize=block_frames, dtype='float32', always_2d=True):
+        peak = max(peak, float(np.max(np.abs(to_mono(block)))) if block.size else 0.0)
+    return peak
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+背景音訊寫入池
+將 sf.write 移到背景執行緒，推理迴圈只需把 CPU 陣列交給寫入池即可繼續，
+以待寫入位元組數作為背壓上限，避免記憶體無限增長
+"""
+
+import queue
+import threading
+
+import numpy as np
+import soundfile as sf
+
+from waveform_envelope import MIN_ENVELOPE_SAMPLES, build_envelope, write_envelope
+
+
+class AudioWriterPool:
+    """
+    有上限的佇列式 WAV 寫入池
+
+    使用方式:
+        with AudioWriterPool(num_workers=4) as writer:
+            writer.submit(path, audio, 16000)
+        # 離開 with 時會等待所有檔案寫完；寫入失敗列在 writer.errors
+
+    Args:
+        num_workers: 寫入執行緒數；0 表示在呼叫端同步寫入
+        max_pending_bytes: 尚未寫完的音訊資料上限，超過時 submit() 會阻塞
+        write_envelopes: 每個 WAV 寫完後在旁邊寫出 min/max 包絡 (waveform_envelope)；
+                         短於 MIN_ENVELOPE_SAMPLES 的音訊略過，繪圖時直接讀取原始樣本
+    """
+
+    def __init__(self, num_workers=4, max_pending_bytes=256 * 1024 * 1024, write_envelopes=False):
+        self.num_workers = num_workers
+        self.max_pending_bytes = max_pending_bytes
+        self.write_envelopes = write_envelopes
+        self.errors = []  # (path, exception)
+        self.num_written = 0
+
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending_bytes = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'audio-writer-{k}', daemon=True)
+            for k in range(num_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def submit(self, path, data, sample_rate, callback=None, **kwargs):
+        """
+        排入一個寫入工作
+
+        寫入池會取得 data 的所有權：若 data 是其他陣列或張量的 view，會先複製一份，
+        呼叫端之後修改原緩衝區不會影響寫出的內容
+
+        Args:
+            callback: 寫入成功後在寫入執行緒中呼叫 callback(path) (例如記錄進度)
+        """
+        if self._closed:
+            raise RuntimeError("AudioWriterPool 已關閉")
+
+        data = np.asarray(data)
+        if not data.flags.owndata:
+            data = data.copy()
+
+        if self.num_workers == 0:
+            self._write(path, data, sample_rate, callback, kwargs)
+            return
+
+        # 背壓：等待待寫入資料降到上限以下 (單一超大檔案仍允許寫入)
+        with self._cond:
+            while self._pending_bytes > 0 and self._pending_bytes + data.nbytes > self.max_pending_bytes:
+                self._cond.wait()
+            self._pending_bytes += data.nbytes
+        self._queue.put((path, data, sample_rate, callback, kwargs))
+
+    def close(self):
+        """等待所有寫入完成並停止執行緒，回傳寫入失敗清單"""
+        if self._closed:
+            return self.errors
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.errors
+
+    @property
+    def pending_bytes(self):
+        with self._cond:
+            return self._pending_bytes
+
+    def _write(self, path, data, sample_rate, callback, kwargs):
+        try:
+            sf.write(path, data, sample_rate, **kwargs)
+            if self.write_envelopes and len(data) >= MIN_ENVELOPE_SAMPLES:
+                write_envelope(path, build_envelope(data, sample_rate))
+        except Exception as e:
+            with self._cond:
+                self.errors.append((path, e))
+        else:
+            with self._cond:
+                self.num_written += 1
+            if callback is not None:
+                try:
+                    callback(path)
+                except Exception as e:
+                    with self._cond:
+                        self.errors.append((path, e))
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            path, data, sample_rate, callback, kwargs = job
+            try:
+                self._write(path, data, sample_rate, callback, kwargs)
+            finally:
+                # 即使寫入執行緒發生非預期錯誤也要釋放額度，避免 submit() 永久阻塞
+                with self._cond:
+                    self._pending_bytes -= data.nbytes
+                    self._cond.notify_all()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+長度分桶批次推理工具
+將長度相近的音訊分到同一個 bucket，補零成批次後一次前向傳播，
+推理後再依每個樣本的原始長度切回
+"""
+
+import torch
+
+
+def iter_length_buckets(items, batch_size=None, max_batch_samples=None,
+                        length_tolerance=0, max_pending=None):
+    """
+    將樣本依長度分桶並逐批產生
+
+    Args:
+        items: 可迭代物件，每個元素為 (key, waveform, *extra)，
+               waveform 為一維張量或陣列，長度取最後一維
+        batch_size: 每批最多樣本數 (None 表示不限制)
+        max_batch_samples: 每批補零後的總取樣點數上限 (None 表示不限制)
+        length_tolerance: 同一 bucket 內允許的長度差 (取樣點)；
+                          0 表示只有長度完全相同的樣本才會合併，結果與逐樣本推理一致
+        max_pending: 所有 bucket 暫存樣本總數上限，超過時先送出最大的 bucket
+                     (None 表示 batch_size 的 8 倍)
+
+    Yields:
+        list: 同一 bucket 的樣本 (保持 items 中的原始元素)
+    """
+    if batch_size is None and max_batch_samples is None:
+        raise ValueError("batch_size 與 max_batch_samples 至少需要指定一個")
+    if max_pending is None:
+        max_pending = 8 * (batch_size or 32)
+
+    width = length_tolerance + 1
+    buckets = {}
+    num_pending = 0
+
+    for item in items:
+        length = item[1].shape[-1]
+        bucket_key = length // width
+        bucket = buckets.setdefault(bucket_key, [])
+
+        # 加入後若超過取樣點預算，先送出目前的 bucket
+        if bucket and max_batch_samples is not None:
+            padded_len = max(length, max(b[1].shape[-1] for b in bucket))
+            if (len(bucket) + 1) * padded_len > max_batch_samples:
+                yield bucket
+                num_pending -= len(bucket)
+                bucket = buckets[bucket_key] = []
+
+        bucket.append(item)
+        num_pending += 1
+
+        if batch_size is not None and len(bucket) >= batch_size:
+            yield buckets.pop(bucket_key)
+            num_pending -= len(bucket)
+        elif num_pending > max_pending:
+            # 長度分散時避免暫存過多樣本
+            largest_key = max(buckets, key=lambda k: len(buckets[k]))
+            largest = buckets.pop(largest_key)
+            num_pending -= len(largest)
+            yield largest
+
+    for bucket_key in sorted(buckets):
+        if buckets[bucket_key]:
+            yield buckets[bucket_key]
+
+
+def pad_batch(waveforms, device=None):
+    """
+    將多個一維波形補零成 (B, T_max) 批次
+
+    Returns:
+        batch: (B, T_max) 張量
+        lengths: (B,) 每個樣本的原始長度
+    """
+    waveforms = [torch.as_tensor(w).reshape(-1) for w in waveforms]
+    lengths = torch.tensor([w.shape[0] for w in waveforms], dtype=torch.long)
+    batch = waveforms[0].new_zeros((len(waveforms), int(lengths.max())))
+    for b, w in enumerate(waveforms):
+        batch[b, :w.shape[0]] = w
+    if device is not None:
+        batch = batch.to(device)
+    return batch, lengths
+
+
+def unpad_batch(outputs, lengths):
+    """
+    依原始長度切回每個樣本的輸出
+
+    Args:
+        outputs: 模型輸出 (B, T) 或 (B, n_srcs, T)，多聲源時取第一個
+        lengths: (B,) 原始長度
+
+    Returns:
+        list: 每個樣本的一維輸出張量
+    """
+    if outputs.dim() == 3:
+        outputs = outputs[:, 0]
+    return [outputs[b, :min(int(n), outputs.shape[-1])] for b, n in enumerate(lengths)]
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+TF-GridNetV2 模型規模的即時因子 (RTF) 基準測試
+依訓練配置建立模型，對 emb_dim / n_layers / n_heads / lstm_hidden_units / 音訊長度的組合
+在 CPU 上量測前向 (可選反向) 延遲、RTF、吞吐量與峰值 RSS
+
+- 每個組合在獨立子行程中執行，峰值 RSS (ru_maxrss) 不會被前一個組合墊高
+- 結果寫成帶 schema_version 與環境資訊的 JSON；指定 --baseline 時逐組合比較，
+  延遲或峰值 RSS 超過容許比例即標為退步並以結束碼 1 結束 (可用於 CI)
+
+使用方式:
+    python scripts/benchmark_rtf.py                                           # 預設網格 (配置值與建議的放大值)
+    python scripts/benchmark_rtf.py --emb-dims 128 --n-layers 4 --audio-lengths 8000 16000 32000 --backward
+    python scripts/benchmark_rtf.py --baseline experiments/benchmarks/rtf_baseline.json
+    python scripts/benchmark_rtf.py --update-baseline experiments/benchmarks/rtf_baseline.json
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import platform
+import argparse
+import itertools
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+SCHEMA_VERSION = 1
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+# 比較基準時用來對應組合的欄位
+POINT_KEYS = ('emb_dim', 'n_layers', 'n_heads', 'lstm_hidden_units', 'audio_length', 'batch_size', 'backward')
+
+
+def _peak_rss_mb():
+    """本行程的峰值 RSS (MB)；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _latency_stats(seconds):
+    seconds = np.asarray(seconds, dtype=np.float64) * 1e3
+    return {
+        'mean_ms': round(float(seconds.mean()), 3),
+        'p50_ms': round(float(np.percentile(seconds, 50)), 3),
+        'p95_ms': round(float(np.percentile(seconds, 95)), 3),
+        'min_ms': round(float(seconds.min()), 3),
+    }
+
+
+def apply_point(config, point):
+    """將網格中的一個組合套用到配置副本"""
+    config = copy.deepcopy(config)
+    architecture = config['model']['architecture']
+    architecture['emb_dim'] = point['emb_dim']
+    architecture['n_layers'] = point['n_layers']
+    architecture['n_heads'] = point['n_heads']
+    architecture['lstm_hidden_units'] = point['lstm_hidden_units']
+    config['data']['preprocessing']['max_audio_length'] = point['audio_length']
+    return config
+
+
+def measure_point(config, point, warmup=1, iterations=5, seed=0):
+    """
+    量測單一組合 (在子行程中執行)
+
+    Returns:
+        dict: 組合參數、參數量、forward (與 backward) 延遲、RTF、吞吐量、峰值 RSS
+    """
+    import torch
+    from evaluate_best_model import build_model
+
+    torch.manual_seed(seed)
+    rss_before = _peak_rss_mb()
+    config = apply_point(config, point)
+    sample_rate = config['data']['preprocessing']['target_sample_rate']
+    device = torch.device('cpu')
+    # 反向傳播依訓練配置決定是否使用 gradient checkpointing (與訓練時的記憶體/時間取捨一致)
+    checkpointing = point['backward'] and config['model']['architecture'].get('use_gradient_checkpointing', False)
+    model = build_model(config, device, gradient_checkpointing=checkpointing)
+    num_params = sum(p.numel() for p in model.parameters())
+    noisy = torch.randn(point['batch_size'], point['audio_length']) * 0.1
+    audio_seconds = point['batch_size'] * point['audio_length'] / sample_rate
+
+    model.eval()
+    forward_times = []
+    with torch.inference_mode():
+        for k in range(warmup + iterations):
+            start = time.perf_counter()
+            model(noisy)
+            if k >= warmup:
+                forward_times.append(time.perf_counter() - start)
+
+    result = dict(point)
+    forward = _latency_stats(forward_times)
+    result.update({
+        'num_params': num_params,
+        'gradient_checkpointing': bool(checkpointing),
+        'forward': forward,
+        'rtf': round(forward['p50_ms'] / 1e3 / audio_seconds, 5),
+        'throughput_audio_s_per_s': round(audio_seconds / (forward['p50_ms'] / 1e3), 3),
+    })
+
+    if point['backward']:
+        model.train()
+        target = torch.randn(point['batch_size'], point['audio_length']) * 0.1
+        backward_times = []
+        for k in range(warmup + iterations):
+            model.zero_grad(set_to_none=True)
+            start = time.perf_counter()
+            estimate = model(noisy).squeeze(1)[..., :target.shape[-1]]
+            loss = (estimate - target[..., :estimate.shape[-1]]).pow(2).mean()
+            loss.backward()
+            if k >= warmup:
+                backward_times.append(time.perf_counter() - start)
+        # forward + backward 的總時間 (即一次訓練步驟，不含 optimizer)
+        result['train_step'] = _latency_stats(backward_times)
+        result['train_rtf'] = round(result['train_step']['p50_ms'] / 1e3 / audio_seconds, 5)
+
+    result['rss_before_mb'] = round(rss_before, 1)
+    result['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+    return result
+
+
+def _worker(args):
+    """子行程進入點：量測一個組合，結果以單行 JSON 輸出到 stdout"""
+    import yaml
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    result = measure_point(config, json.loads(args.point), args.warmup, args.iterations)
+    print(RESULT_PREFIX + json.dumps(result), flush=True)
+
+
+def build_grid(config, emb_dims=None, n_layers=None, n_heads=None, lstm_hidden_units=None,
+               audio_lengths=None, batch_size=1, backward=False):
+    """
+    展開測試網格，未指定的維度使用配置中的值
+
+    Returns:
+        list[dict]: 每個組合的參數
+    """
+    architecture = config['model']['architecture']
+    grid = itertools.product(
+        emb_dims or [architecture['emb_dim']],
+        n_layers or [architecture['n_layers']],
+        n_heads or [architecture['n_heads']],
+        lstm_hidden_units or [architecture['lstm_hidden_units']],
+        audio_lengths or [config['data']['preprocessing']['max_audio_length']],
+    )
+    return [{'emb_dim': e, 'n_layers': l, 'n_heads': h, 'lstm_hidden_units': u,
+             'audio_length': a, 'batch_size': batch_size, 'backward': backward}
+            for e, l, h, u, a in grid]
+
+
+def run_point(config_path, point, threads=None, warmup=1, iterations=5, timeout=None):
+    """在子行程中量測一個組合，失敗時回傳含 error 的 dict"""
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES='')
+    if threads:
+        env.update({'OMP_NUM_THREADS': str(threads), 'MKL_NUM_THREADS': str(threads)})
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--config', config_path,
+               '--point', json.dumps(point), '--warmup', str(warmup), '--iterations', str(iterations)]
+    if threads:
+        command += ['--threads', str(threads)]
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, env=env, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return dict(point, error=f'timeout ({timeout}s)')
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    message = (completed.stderr.strip().splitlines() or ['unknown error'])[-1]
+    return dict(point, error=message)
+
+
+def environment_info():
+    """基準比較需要的環境資訊 (版本、CPU、執行緒數、git commit)"""
+    import torch
+
+    info = {
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch_threads': torch.get_num_threads(),
+    }
+    try:
+        info['git_commit'] = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        info['git_commit'] = None
+    return info
+
+
+def point_key(result):
+    return tuple(result.get(key) for key in POINT_KEYS)
+
+
+def compare_with_baseline(report, baseline, tolerance=0.10, rss_tolerance=0.10):
+    """
+    逐組合比較 p50 延遲與峰值 RSS
+
+    Returns:
+        list[dict]: 每個兩邊都有的組合一筆 (含 regressions 列表，空列表表示沒有退步)
+    """
+    if baseline.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(f"基準檔 schema_version {baseline.get('schema_version')} 與目前版本 {SCHEMA_VERSION} 不同")
+    reference = {point_key(r): r for r in baseline['results'] if 'error' not in r}
+    comparisons = []
+    for result in report['results']:
+        base = reference.get(point_key(result))
+        if base is None or 'error' in result:
+            continue
+        metrics = [('forward_p50_ms', result['forward']['p50_ms'], base['forward']['p50_ms'], tolerance),
+                   ('peak_rss_mb', result['peak_rss_mb'], base['peak_rss_mb'], rss_tolerance)]
+        if 'train_step' in result and 'train_step' in base:
+            metrics.append(('train_step_p50_ms', result['train_step']['p50_ms'],
+                            base['train_step']['p50_ms'], tolerance))
+        entry = {'point': {key: result[key] for key in POINT_KEYS}, 'metrics': {}, 'regressions': []}
+        for name, current, previous, limit in metrics:
+            ratio = current / previous if previous else float('inf')
+            entry['metrics'][name] = {'current': current, 'baseline': previous, 'ratio': round(ratio, 4)}
+            if ratio > 1 + limit:
+                entry['regressions'].append(name)
+        comparisons.append(entry)
+    return comparisons
+
+
+def print_report(report):
+    print("\n" + "=" * 100)
+    print(f"⏱️  RTF 基準測試 (CPU, {report['environment']['torch_threads']} 執行緒, "
+          f"torch {report['environment']['torch']})")
+    print("=" * 100)
+    print(f"{'emb':>5} {'層':>3} {'頭':>3} {'LSTM':>5} {'長度':>7} {'參數量':>10} "
+          f"{'fwd p50(ms)':>12} {'fwd p95(ms)':>12} {'RTF':>8} {'train(ms)':>10} {'峰值RSS(MB)':>12}")
+    print("-" * 100)
+    for r in report['results']:
+        prefix = (f"{r['emb_dim']:>5} {r['n_layers']:>3} {r['n_heads']:>3} {r['lstm_hidden_units']:>5} "
+                  f"{r['audio_length']:>7}")
+        if 'error' in r:
+            print(f"{prefix}  ❌ {r['error']}")
+            continue
+        train = f"{r['train_step']['p50_ms']:>10.1f}" if 'train_step' in r else f"{'-':>10}"
+        print(f"{prefix} {r['num_params']:>10,} {r['forward']['p50_ms']:>12.1f} {r['forward']['p95_ms']:>12.1f} "
+              f"{r['rtf']:>8.4f} {train} {r['peak_rss_mb']:>12.1f}")
+    print("=" * 100)
+
+
+def print_comparisons(comparisons, baseline_path):
+    print(f"\n📏 與基準比較: {baseline_path}")
+    if not comparisons:
+        print("   ⚠️ 沒有可對應的組合")
+        return
+    for entry in comparisons:
+        p = entry['point']
+        label = f"emb={p['emb_dim']} L={p['n_layers']} H={p['n_heads']} U={p['lstm_hidden_units']} len={p['audio_length']}"
+        details = ', '.join(f"{name} {m['baseline']}→{m['current']} ({(m['ratio'] - 1) * 100:+.1f}%)"
+                            for name, m in entry['metrics'].items())
+        mark = '❌ 退步' if entry['regressions'] else '✅'
+        print(f"   {mark} {label}: {details}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TF-GridNetV2 模型規模的 RTF 基準測試 (CPU)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑 (未指定的網格維度使用其中的值)')
+    parser.add_argument('--emb-dims', type=int, nargs='+', default=[128, 256],
+                       help='emb_dim 列表 (default: 128 256)')
+    parser.add_argument('--n-layers', type=int, nargs='+', default=[4, 8],
+                       help='n_layers 列表 (default: 4 8)')
+    parser.add_argument('--n-heads', type=int, nargs='+', default=[4, 8],
+                       help='n_heads 列表 (default: 4 8)')
+    parser.add_argument('--lstm-hidden-units', type=int, nargs='+', default=None,
+                       help='lstm_hidden_units 列表 (default: 配置值)')
+    parser.add_argument('--audio-lengths', type=int, nargs='+', default=[8000, 32000],
+                       help='輸入長度 (取樣點) 列表 (default: 8000 32000)')
+    parser.add_argument('--batch-size', type=int, default=1, help='批次大小 (default: 1)')
+    parser.add_argument('--backward', action='store_true', help='同時量測 forward + backward (訓練步驟)')
+    parser.add_argument('--warmup', type=int, default=1, help='暖機次數 (default: 1)')
+    parser.add_argument('--iterations', type=int, default=5, help='量測次數 (default: 5)')
+    parser.add_argument('--threads', type=int, default=None, help='torch/OMP 執行緒數 (default: torch 預設)')
+    parser.add_argument('--timeout', type=float, default=None, help='每個組合的時間上限秒數 (default: 不限制)')
+    parser.add_argument('--output-dir', type=str, default='/workspace/experiments/benchmarks',
+                       help='結果 JSON 輸出目錄 (default: /workspace/experiments/benchmarks)')
+    parser.add_argument('--baseline', type=str, default=None, help='比較用的基準 JSON')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                       help='延遲超過基準的容許比例 (default: 0.10)')
+    parser.add_argument('--rss-tolerance', type=float, default=0.10,
+                       help='峰值 RSS 超過基準的容許比例 (default: 0.10)')
+    parser.add_argument('--update-baseline', type=str, default=None,
+                       help='將本次結果另存為基準 JSON')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--point', type=str, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        sys.exit(0)
+
+    import yaml
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    grid = build_grid(config, args.emb_dims, args.n_layers, args.n_heads, args.lstm_hidden_units,
+                      args.audio_lengths, args.batch_size, args.backward)
+
+    print("=" * 100)
+    print(f"🧪 RTF 基準測試: {len(grid)} 個組合 (暖機 {args.warmup} 次, 量測 {args.iterations} 次)")
+    print("=" * 100)
+    results = []
+    for k, point in enumerate(grid):
+        start = time.perf_counter()
+        result = run_point(args.config, point, args.threads, args.warmup, args.iterations, args.timeout)
+        status = f"❌ {result['error']}" if 'error' in result else f"RTF {result['rtf']:.4f}"
+        print(f"   [{k + 1}/{len(grid)}] emb={point['emb_dim']} L={point['n_layers']} H={point['n_heads']} "
+              f"U={point['lstm_hidden_units']} len={point['audio_length']}: {status} "
+              f"({time.perf_counter() - start:.1f}s)")
+        results.append(result)
+
+    report = {
+        'schema_version': SCHEMA_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'config': str(args.config),
+        'settings': {'warmup': args.warmup, 'iterations': args.iterations, 'threads': args.threads,
+                     'batch_size': args.batch_size, 'backward': args.backward},
+        'environment': environment_info(),
+        'results': results,
+    }
+    if args.threads:
+        report['environment']['torch_threads'] = args.threads
+    print_report(report)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        comparisons = compare_with_baseline(report, baseline, args.tolerance, args.rss_tolerance)
+        report['baseline'] = {'path': str(args.baseline), 'created': baseline.get('created'),
+                              'git_commit': baseline.get('environment', {}).get('git_commit'),
+                              'comparisons': comparisons}
+        print_comparisons(comparisons, args.baseline)
+        if baseline.get('environment', {}).get('torch_threads') != report['environment']['torch_threads']:
+            print("   ⚠️ 執行緒數與基準不同，延遲比較僅供參考")
+        if any(entry['regressions'] for entry in comparisons):
+            exit_code = 1
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"rtf_benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, 'w') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 結果已保存: {output_path}")
+    if args.update_baseline:
+        Path(args.update_baseline).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.update_baseline, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📌 已更新基準: {args.update_baseline}")
+    sys.exit(exit_code)
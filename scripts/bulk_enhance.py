@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+離線大量語音增強 (不需要 clean 參考)
+evaluate_model 需要成對的 clean/noisy scp；此工具只讀取 noisy 音訊 (scp 或目錄)，
+輸出增強後的 WAV，適合處理整批錄音:
+
+- 解碼 (soundfile + 重取樣 + 峰值正規化) 在行程池中預取，在途工作數有上限
+- 解碼完成的樣本依長度分桶，桶滿 (批次大小或取樣點預算) 或最舊樣本等待超過 --max-wait 秒時送出，
+  慢速儲存裝置不會讓部分填滿的批次無限等待
+- 超過 --max-length 的長錄音改用 chunked_inference 分段推理，記憶體與長度無關
+- 輸出經 AudioWriterPool 背景寫入 (待寫入資料有上限)，每個檔案寫完後立即附加到 progress.jsonl；
+  中斷後以相同指令重新執行即從未完成的檔案繼續
+
+輸出目錄:
+    <output-dir>/<uttid>.wav   增強音訊 (目錄輸入時保留子目錄結構)
+    <output-dir>/progress.jsonl 完成/失敗紀錄 (續跑依據)
+    <output-dir>/job.json       工作設定與最後一次執行的統計
+    <output-dir>/enhanced.scp   已完成檔案清單 (依輸入順序)
+
+使用方式:
+    python scripts/bulk_enhance.py --checkpoint ckpt.pth --input-scp data/scp/test_noisy.scp --output-dir enhanced/
+    python scripts/bulk_enhance.py --checkpoint ckpt.bundle.pt --input-dir recordings/ --output-dir enhanced/ --batch-size 16
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool, TimeoutError as PoolTimeout
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import read_scp, resolve_audio_path, to_mono, normalize_waveform, resample_waveform
+from streaming_stats import RunningStats
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg')
+PROGRESS_FILE = 'progress.jsonl'
+JOB_FILE = 'job.json'
+
+
+def list_inputs(input_scp=None, input_dir=None, root=None):
+    """
+    建立輸入清單
+
+    Returns:
+        list: (uttid, 路徑)；目錄輸入時 uttid 為不含副檔名的相對路徑
+    """
+    if input_scp is not None:
+        return [(uttid, resolve_audio_path(path, input_scp, root))
+                for uttid, path in read_scp(input_scp).items()]
+    input_dir = Path(input_dir)
+    items = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                path = Path(dirpath) / name
+                items.append((path.relative_to(input_dir).with_suffix('').as_posix(), path))
+    return items
+
+
+def decode_audio(job):
+    """
+    讀取並前處理一個檔案 (在行程池中執行)
+
+    Returns:
+        (uttid, 波形, 正規化前峰值, 錯誤訊息)；失敗時波形為 None
+    """
+    uttid, path, target_sample_rate, normalize, backend = job
+    try:
+        audio, sr = sf.read(str(path), dtype='float32')
+        audio = resample_waveform(to_mono(audio), sr, target_sample_rate, backend)
+        peak = float(np.max(np.abs(audio))) if audio.size > 0 else 0.0
+        if normalize:
+            audio = normalize_waveform(audio)
+        return uttid, np.ascontiguousarray(audio, dtype=np.float32), peak, None
+    except Exception as e:
+        return uttid, None, 0.0, str(e)
+
+
+class _InlineResult:
+    """num_workers=0 時模擬 AsyncResult (在主行程解碼)"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self, timeout=None):
+        return self.value
+
+
+class TimeoutBatchScheduler:
+    """
+    長度分桶 + 逾時送出的批次排程
+
+    與 batched_inference.iter_length_buckets 相同的分桶規則，另外記錄每個桶最舊樣本的加入時間，
+    超過 max_wait 秒即使未滿也送出
+
+    Args:
+        batch_size: 每批最多樣本數
+        max_batch_samples: 每批補零後總取樣點數上限 (None 表示不限制)
+        length_tolerance: 同一桶內允許的長度差 (取樣點)
+        max_wait: 桶內最舊樣本的最長等待秒數
+        max_pending: 所有桶暫存樣本總數上限，超過時先送出最大的桶
+    """
+
+    def __init__(self, batch_size=8, max_batch_samples=None, length_tolerance=1600, max_wait=2.0,
+                 max_pending=None):
+        self.batch_size = batch_size
+        self.max_batch_samples = max_batch_samples
+        self.width = length_tolerance + 1
+        self.max_wait = max_wait
+        self.max_pending = max_pending or 8 * batch_size
+        self.buckets = {}  # key → (最舊樣本加入時間, [樣本])
+        self.num_pending = 0
+
+    def add(self, item, now):
+        """加入一個樣本 (uttid, 波形, ...)，回傳需要立即執行的批次"""
+        length = item[1].shape[-1]
+        key = length // self.width
+        ready = []
+        if key in self.buckets and self.max_batch_samples is not None:
+            bucket = self.buckets[key][1]
+            padded_len = max(length, max(b[1].shape[-1] for b in bucket))
+            if (len(bucket) + 1) * padded_len > self.max_batch_samples:
+                ready.append(self._pop(key))
+        self.buckets.setdefault(key, (now, []))[1].append(item)
+        self.num_pending += 1
+        if len(self.buckets[key][1]) >= self.batch_size:
+            ready.append(self._pop(key))
+        elif self.num_pending > self.max_pending:
+            ready.append(self._pop(max(self.buckets, key=lambda k: len(self.buckets[k][1]))))
+        return ready
+
+    def expired(self, now):
+        """回傳最舊樣本已等待超過 max_wait 的批次"""
+        keys = [k for k, (added, _) in self.buckets.items() if now - added >= self.max_wait]
+        return [self._pop(k) for k in keys]
+
+    def time_to_deadline(self, now):
+        """距離下一個桶逾時的秒數 (沒有暫存樣本時為 None)"""
+        if not self.buckets:
+            return None
+        return max(0.0, min(added for added, _ in self.buckets.values()) + self.max_wait - now)
+
+    def flush(self):
+        return [self._pop(k) for k in sorted(self.buckets)]
+
+    def _pop(self, key):
+        batch = self.buckets.pop(key)[1]
+        self.num_pending -= len(batch)
+        return batch
+
+
+class ProgressLog:
+    """
+    附加寫入的進度紀錄 (每行一個 JSON)，寫入執行緒與主迴圈共用
+
+    續跑時讀取既有紀錄，status 為 done 的 uttid 視為已完成；截斷的最後一行會被忽略
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        self.num_failed = 0
+        if self.path.exists():
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get('status') == 'done':
+                        self.done.add(record['uttid'])
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', buffering=1)
+
+    def mark(self, uttid, status='done', error=None):
+        record = {'uttid': uttid, 'status': status}
+        if error is not None:
+            record['error'] = error
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            if status == 'done':
+                self.done.add(uttid)
+            else:
+                self.num_failed += 1
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def check_job(output_dir, job, restart=False):
+    """
+    比對既有的 job.json，設定不同時拒絕續跑 (restart=True 時清除進度重新開始)
+
+    Returns:
+        bool: 是否為續跑
+    """
+    job_path = Path(output_dir) / JOB_FILE
+    progress_path = Path(output_dir) / PROGRESS_FILE
+    if restart and progress_path.exists():
+        progress_path.unlink()
+    if not job_path.exists() or not progress_path.exists():
+        return False
+    with open(job_path, 'r') as f:
+        previous = json.load(f)
+    keys = ('checkpoint', 'input', 'sample_rate', 'normalize', 'restore_level')
+    changed = [k for k in keys if previous.get(k) != job.get(k)]
+    if changed:
+        raise ValueError(f"輸出目錄已有不同設定的工作 ({', '.join(changed)} 不同)，"
+                         f"請改用其他 --output-dir 或加上 --restart")
+    return True
+
+
+def bulk_enhance(checkpoint_path, config_path, output_dir, input_scp=None, input_dir=None, root=None,
+                 batch_size=8, max_batch_samples=None, length_tolerance=1600, max_wait=2.0,
+                 max_length=None, num_workers=4, prefetch=None, resample_backend='librosa',
+                 restore_level=True, writer_workers=4, writer_max_pending_mb=256, subtype='PCM_16',
+                 restart=False, report_every=30.0):
+    """
+    大量增強音訊檔案，可中斷後續跑
+
+    Args:
+        checkpoint_path: 檢查點或 .bundle.pt
+        config_path: 訓練配置檔路徑 (取樣率、正規化與 STFT 參數)
+        output_dir: 輸出目錄 (同時存放進度紀錄)
+        input_scp, input_dir: 輸入 scp 或目錄 (擇一)
+        batch_size, max_batch_samples, length_tolerance: 長度分桶的批次設定
+        max_wait: 部分填滿的批次最長等待秒數
+        max_length: 超過此長度 (取樣點) 的檔案改用分段推理 (None 表示整段推理)
+        num_workers: 解碼行程數 (0 表示在主行程解碼)
+        prefetch: 在途解碼工作上限 (None 表示 4 * batch_size)
+        restore_level: 輸出乘回輸入的原始峰值 (只在配置啟用峰值正規化時有作用)
+        subtype: 輸出 WAV 格式
+        restart: 清除既有進度重新開始
+        report_every: 進度輸出間隔秒數
+
+    Returns:
+        dict: 本次執行的統計
+    """
+    import yaml
+    import torch
+    from evaluate_best_model import build_model, load_checkpoint_weights
+    from inference_bundle import is_bundle, load_bundle
+    from batched_inference import pad_batch, unpad_batch
+    from chunked_inference import ChunkedInference
+    from audio_writer import AudioWriterPool
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    preprocessing = config['data']['preprocessing']
+    sample_rate = preprocessing['target_sample_rate']
+    normalize = preprocessing.get('normalize_audio', True)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    job = {
+        'checkpoint': str(checkpoint_path),
+        'input': str(input_scp or input_dir),
+        'sample_rate': sample_rate,
+        'normalize': normalize,
+        'restore_level': restore_level,
+    }
+    resumed = check_job(output_dir, job, restart)
+    with open(output_dir / JOB_FILE, 'w') as f:
+        json.dump(job, f, indent=2)
+
+    inputs = list_inputs(input_scp, input_dir, root)
+    progress = ProgressLog(output_dir / PROGRESS_FILE)
+    todo = [(uttid, path) for uttid, path in inputs
+            if uttid not in progress.done or not (output_dir / f"{uttid}.wav").exists()]
+    print(f"\n📂 {len(inputs)} 個檔案，" + (f"續跑：已完成 {len(inputs) - len(todo)}，" if resumed else "")
+          + f"待處理 {len(todo)}")
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    if is_bundle(checkpoint_path):
+        model, _ = load_bundle(checkpoint_path, device)
+    else:
+        model = build_model(config, device)
+        load_checkpoint_weights(model, checkpoint_path, device)
+    model.eval()
+    chunked = None
+    if max_length is not None:
+        chunked = ChunkedInference.from_config(model, config, batch_size=batch_size)
+
+    scheduler = TimeoutBatchScheduler(batch_size, max_batch_samples, length_tolerance, max_wait)
+    writer = AudioWriterPool(num_workers=writer_workers, max_pending_bytes=writer_max_pending_mb * 1024 * 1024)
+    batch_sizes = RunningStats()
+    stats = {'files': 0, 'failed': 0, 'chunked': 0, 'audio_seconds': 0.0}
+    for uttid, _ in todo:
+        if '/' in uttid:
+            (output_dir / uttid).parent.mkdir(parents=True, exist_ok=True)
+
+    def fail(uttid, error):
+        stats['failed'] += 1
+        progress.mark(uttid, 'failed', error)
+        print(f"   ⚠️  {uttid} 失敗: {error}")
+
+    def submit(uttid, enhanced, peak):
+        enhanced = enhanced.cpu().numpy()
+        if normalize and restore_level and peak > 1e-8:
+            enhanced = enhanced * peak
+        writer.submit(output_dir / f"{uttid}.wav", enhanced, sample_rate, subtype=subtype,
+                      callback=lambda path, uttid=uttid: progress.mark(uttid))
+        stats['files'] += 1
+        stats['audio_seconds'] += enhanced.shape[0] / sample_rate
+
+    def run_batch(batch):
+        """前向傳播一批；失敗 (例如記憶體不足) 時逐一重試"""
+        try:
+            noisy, lengths = pad_batch([item[1] for item in batch], device=device)
+            outputs = unpad_batch(model(noisy), lengths)
+        except Exception as e:
+            if len(batch) == 1:
+                fail(batch[0][0], str(e))
+                return
+            print(f"   ⚠️  批次 ({len(batch)} 個樣本) 失敗，逐一重試: {e}")
+            for item in batch:
+                run_batch([item])
+            return
+        batch_sizes.update([len(batch)])
+        for item, enhanced in zip(batch, outputs):
+            submit(item[0], enhanced, item[2])
+
+    def run_chunked(item):
+        try:
+            enhanced = chunked.enhance(torch.from_numpy(item[1]))
+        except Exception as e:
+            fail(item[0], str(e))
+            return
+        stats['chunked'] += 1
+        submit(item[0], enhanced, item[2])
+
+    prefetch = prefetch or 4 * batch_size
+    jobs = iter((uttid, path, sample_rate, normalize, resample_backend) for uttid, path in todo)
+    pool = Pool(num_workers) if num_workers > 0 else None
+    in_flight = deque()
+    exhausted = False
+    completed = False
+    start = time.perf_counter()
+    next_report = start + report_every
+    print(f"🚀 開始增強 (batch_size={batch_size}, max_batch_samples={max_batch_samples}, "
+          f"max_wait={max_wait}s, 解碼行程 {num_workers})...")
+    try:
+        with torch.no_grad():
+            while True:
+                while not exhausted and len(in_flight) < prefetch:
+                    job_args = next(jobs, None)
+                    if job_args is None:
+                        exhausted = True
+                    elif pool is None:
+                        in_flight.append(_InlineResult(decode_audio(job_args)))
+                    else:
+                        in_flight.append(pool.apply_async(decode_audio, (job_args,)))
+                if not in_flight:
+                    break
+
+                # 等待最早送出的解碼結果，最多等到下一個桶逾時
+                timeout = scheduler.time_to_deadline(time.perf_counter())
+                try:
+                    uttid, audio, peak, error = in_flight[0].get(timeout)
+                    in_flight.popleft()
+                except PoolTimeout:
+                    audio = None
+                    error = None
+                now = time.perf_counter()
+                ready = []
+                if error is not None:
+                    fail(uttid, error)
+                elif audio is not None:
+                    if chunked is not None and audio.shape[0] > max_length:
+                        run_chunked((uttid, audio, peak))
+                    else:
+                        ready = scheduler.add((uttid, audio, peak), now)
+                for batch in ready + scheduler.expired(now):
+                    run_batch(batch)
+
+                if now >= next_report:
+                    elapsed = now - start
+                    print(f"   處理進度: {stats['files'] + stats['failed']}/{len(todo)} "
+                          f"({stats['audio_seconds'] / elapsed:.1f}x 即時, 平均批次 {batch_sizes.mean:.1f})")
+                    next_report = now + report_every
+
+            for batch in scheduler.flush():
+                run_batch(batch)
+        completed = True
+    except KeyboardInterrupt:
+        print("\n⏸️  已中斷，等待已送出的檔案寫完；以相同指令重新執行即可續跑")
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        write_errors = writer.close()
+        for path, e in write_errors:
+            progress.mark(Path(path).relative_to(output_dir).with_suffix('').as_posix(), 'failed', str(e))
+        progress.close()
+    elapsed = time.perf_counter() - start
+
+    done = progress.done
+    with open(output_dir / 'enhanced.scp', 'w') as f:
+        for uttid, _ in inputs:
+            if uttid in done:
+                f.write(f"{uttid} {(output_dir / f'{uttid}.wav').resolve()}\n")
+
+    report = {
+        'completed': completed,
+        'num_inputs': len(inputs),
+        'num_done': sum(1 for uttid, _ in inputs if uttid in done),
+        'num_processed': stats['files'] - len(write_errors),
+        'num_failed': stats['failed'] + len(write_errors),
+        'num_chunked': stats['chunked'],
+        'audio_seconds': round(stats['audio_seconds'], 3),
+        'seconds': round(elapsed, 3),
+        'throughput_x_realtime': round(stats['audio_seconds'] / elapsed, 3) if elapsed > 0 else None,
+        'mean_batch_size': round(batch_sizes.mean, 3),
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'output_dir': str(output_dir),
+    }
+    job['last_run'] = report
+    with open(output_dir / JOB_FILE, 'w') as f:
+        json.dump(job, f, indent=2)
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 80)
+    print("📊 大量增強結果")
+    print("=" * 80)
+    print(f"已完成:     {report['num_done']} / {report['num_inputs']}"
+          + ("" if report['completed'] else " (已中斷)"))
+    print(f"本次處理:   {report['num_processed']} (失敗 {report['num_failed']}, 分段推理 {report['num_chunked']})")
+    print(f"音訊長度:   {report['audio_seconds'] / 3600:.2f} 小時")
+    if report['throughput_x_realtime'] is not None:
+        print(f"吞吐量:     {report['throughput_x_realtime']:.1f}x 即時 ({report['seconds']:.1f} 秒, "
+              f"平均批次 {report['mean_batch_size']:.1f})")
+    print(f"💾 輸出目錄: {report['output_dir']}")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='離線大量語音增強 (可續跑)')
+    parser.add_argument('--checkpoint', type=str, required=True, help='檢查點路徑 (訓練檢查點或 .bundle.pt)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--input-scp', type=str, help='輸入 scp (每行 "uttid path")')
+    source.add_argument('--input-dir', type=str, help='輸入目錄 (遞迴尋找 wav/flac/ogg)')
+    parser.add_argument('--root', type=str, default=None, help='scp 相對路徑的根目錄')
+    parser.add_argument('--output-dir', type=str, required=True, help='輸出目錄')
+    parser.add_argument('--batch-size', type=int, default=8, help='批次大小 (default: 8)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批補零後總取樣點數上限 (default: 不限制)')
+    parser.add_argument('--length-tolerance', type=int, default=1600,
+                       help='同一批次內允許的長度差，補零會些微影響輸出 (default: 1600)')
+    parser.add_argument('--max-wait', type=float, default=2.0,
+                       help='部分填滿的批次最長等待秒數 (default: 2.0)')
+    parser.add_argument('--max-length', type=int, default=None,
+                       help='超過此取樣點數的檔案改用分段推理 (default: 整段推理)')
+    parser.add_argument('--num-workers', type=int, default=4, help='解碼行程數 (default: 4)')
+    parser.add_argument('--prefetch', type=int, default=None,
+                       help='在途解碼工作上限 (default: 4 * batch_size)')
+    parser.add_argument('--resample-backend', type=str, default='librosa', choices=['librosa', 'torch'],
+                       help='重取樣後端 (default: librosa)')
+    parser.add_argument('--no-restore-level', action='store_true',
+                       help='輸出保持正規化後的音量，不乘回輸入峰值')
+    parser.add_argument('--writer-workers', type=int, default=4,
+                       help='背景寫入音訊的執行緒數 (default: 4)')
+    parser.add_argument('--subtype', type=str, default='PCM_16', help='輸出 WAV 格式 (default: PCM_16)')
+    parser.add_argument('--restart', action='store_true', help='清除既有進度重新開始')
+    parser.add_argument('--report-every', type=float, default=30.0,
+                       help='進度輸出間隔秒數 (default: 30)')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.checkpoint):
+        print(f"❌ 找不到檢查點: {args.checkpoint}")
+        sys.exit(1)
+
+    try:
+        report = bulk_enhance(
+            args.checkpoint, args.config, args.output_dir, input_scp=args.input_scp,
+            input_dir=args.input_dir, root=args.root, batch_size=args.batch_size,
+            max_batch_samples=args.max_batch_samples, length_tolerance=args.length_tolerance,
+            max_wait=args.max_wait, max_length=args.max_length, num_workers=args.num_workers,
+            prefetch=args.prefetch, resample_backend=args.resample_backend,
+            restore_level=not args.no_restore_level, writer_workers=args.writer_workers,
+            subtype=args.subtype, restart=args.restart, report_every=args.report_every,
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print_report(report)
+    sys.exit(0 if report['completed'] and report['num_failed'] == 0 else 1)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+分段串流推理
+將長音訊切成與 STFT hop 對齊、彼此重疊的片段，批次送入模型後以交叉淡化 (cross-fade)
+重疊相加 (overlap-add)。模型記憶體只與片段長度有關，與錄音長度無關；
+檔案模式逐段讀寫，整體記憶體維持固定
+
+使用方式:
+    python scripts/chunked_inference.py --checkpoint ckpt.pth --input long.wav --output enhanced.wav
+    python scripts/chunked_inference.py --checkpoint ckpt.pth --input short.wav --output enhanced.wav --compare
+"""
+
+import math
+import argparse
+
+import numpy as np
+import soundfile as sf
+import torch
+
+
+def align_to_hop(num_samples, hop_length):
+    """向下對齊到 hop_length 的整數倍 (至少一個 hop)"""
+    return max(hop_length, (num_samples // hop_length) * hop_length)
+
+
+def crossfade_windows(overlap, dtype=torch.float32):
+    """
+    產生互補的淡入/淡出窗 (sin² / cos²)，兩者相加恆為 1
+
+    Returns:
+        fade_in, fade_out: 長度 overlap 的張量
+    """
+    n = torch.arange(overlap, dtype=torch.float64)
+    fade_in = torch.sin(math.pi * (n + 0.5) / (2 * overlap)) ** 2
+    return fade_in.to(dtype), (1.0 - fade_in).to(dtype)
+
+
+class ChunkedInference:
+    """
+    重疊片段批次推理引擎
+
+    Args:
+        model: 已載入權重的 TF-GridNetV2 (eval 模式)
+        chunk_size: 片段長度 (取樣點)，會向下對齊到 hop_length 的整數倍
+        overlap: 相鄰片段重疊長度，None 表示 max(n_fft, chunk_size // 4)；
+                 同樣對齊到 hop_length，且不得超過片段長度的一半
+        hop_length: STFT hop
+        n_fft: STFT 視窗長度 (重疊至少為一個視窗，避免邊界幀影響交叉淡化區段)
+        batch_size: 每次前向傳播的片段數
+        device: 推理設備，None 表示使用模型參數所在設備
+    """
+
+    def __init__(self, model, chunk_size=8000, overlap=None, hop_length=256, n_fft=512,
+                 batch_size=8, device=None):
+        self.model = model
+        self.hop_length = hop_length
+        self.chunk_size = align_to_hop(chunk_size, hop_length)
+        if overlap is None:
+            overlap = max(n_fft, self.chunk_size // 4)
+        self.overlap = align_to_hop(overlap, hop_length)
+        if self.overlap * 2 > self.chunk_size:
+            raise ValueError(f"overlap ({self.overlap}) 不得超過 chunk_size ({self.chunk_size}) 的一半")
+        self.stride = self.chunk_size - self.overlap
+        self.batch_size = batch_size
+        if device is None:
+            device = next(model.parameters()).device
+        self.device = device
+        self.fade_in, self.fade_out = crossfade_windows(self.overlap)
+
+    @classmethod
+    def from_config(cls, model, config, **kwargs):
+        """以訓練配置的 max_audio_length 與 STFT 參數建立引擎"""
+        kwargs.setdefault('chunk_size', config['data']['preprocessing']['max_audio_length'])
+        kwargs.setdefault('hop_length', config['model']['stft']['hop_length'])
+        kwargs.setdefault('n_fft', config['model']['stft']['n_fft'])
+        return cls(model, **kwargs)
+
+    def chunk_starts(self, num_samples):
+        """回傳覆蓋 num_samples 所需的片段起點"""
+        if num_samples <= self.chunk_size:
+            return [0]
+        num_chunks = math.ceil((num_samples - self.overlap) / self.stride)
+        return [k * self.stride for k in range(num_chunks)]
+
+    def iter_tensor_chunks(self, waveform):
+        """從記憶體中的一維波形產生片段 (最後一段補零；短於一個片段時不補零，與整段推理相同)"""
+        waveform = torch.as_tensor(waveform).reshape(-1)
+        if waveform.shape[0] <= self.chunk_size:
+            yield waveform
+            return
+        for start in self.chunk_starts(waveform.shape[0]):
+            chunk = waveform[start:start + self.chunk_size]
+            if chunk.shape[0] < self.chunk_size:
+                chunk = torch.nn.functional.pad(chunk, (0, self.chunk_size - chunk.shape[0]))
+            yield chunk
+
+    def iter_file_chunks(self, sound_file):
+        """從已開啟的 soundfile.SoundFile 逐段讀取片段 (多聲道取平均)"""
+        single = sound_file.frames <= self.chunk_size
+        for start in self.chunk_starts(sound_file.frames):
+            sound_file.seek(start)
+            chunk = sound_file.read(self.chunk_size, dtype='float32', always_2d=True,
+                                    fill_value=None if single else 0.0)
+            yield torch.from_numpy(chunk.mean(axis=1))
+
+    def forward_chunks(self, chunks):
+        """一次前向傳播一批等長片段，輸出裁切/補零到輸入長度並移回 CPU"""
+        batch = torch.stack(chunks).to(self.device)
+        length = batch.shape[-1]
+        outputs = self.model(batch)
+        if outputs.dim() == 3:
+            outputs = outputs[:, 0]
+        if outputs.shape[-1] < length:
+            outputs = torch.nn.functional.pad(outputs, (0, length - outputs.shape[-1]))
+        return outputs[:, :length].float().cpu()
+
+    def stream(self, chunks):
+        """
+        串流處理片段，依序產生已完成交叉淡化的輸出區段
+
+        每個片段的輸出會暫存到下一個片段到達後才定案，
+        如此最後一個片段的尾端不會被淡出
+        """
+        carry = None    # 上一個片段淡出後的尾端，等待與下一段相加
+        pending = None  # 最新片段的原始輸出
+
+        def finalize(output, is_last):
+            nonlocal carry
+            head = output[:self.overlap]
+            if carry is not None:
+                head = head * self.fade_in + carry
+            if is_last:
+                return torch.cat([head, output[self.overlap:]])
+            body = output[self.overlap:self.stride]
+            carry = output[self.stride:] * self.fade_out
+            return torch.cat([head, body])
+
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) < self.batch_size:
+                continue
+            for output in self.forward_chunks(batch):
+                if pending is not None:
+                    yield finalize(pending, is_last=False)
+                pending = output
+            batch = []
+
+        if batch:
+            for output in self.forward_chunks(batch):
+                if pending is not None:
+                    yield finalize(pending, is_last=False)
+                pending = output
+        if pending is not None:
+            yield finalize(pending, is_last=True)
+
+    @torch.no_grad()
+    def enhance(self, waveform):
+        """增強記憶體中的一維波形，回傳相同長度的 CPU 張量"""
+        waveform = torch.as_tensor(waveform).reshape(-1)
+        output = torch.cat(list(self.stream(self.iter_tensor_chunks(waveform))))
+        return output[:waveform.shape[0]]
+
+    @torch.no_grad()
+    def enhance_file(self, input_path, output_path, sample_rate=None, subtype=None):
+        """
+        逐段讀取 input_path 並寫出 output_path，記憶體用量與檔案長度無關
+
+        Args:
+            sample_rate: 模型預期取樣率，指定時會檢查輸入檔案
+            subtype: 輸出 WAV 格式 (None 使用 soundfile 預設)
+
+        Returns:
+            int: 寫出的取樣點數
+        """
+        with sf.SoundFile(input_path) as sound_file:
+            num_samples = sound_file.frames
+            if sample_rate is not None and sound_file.samplerate != sample_rate:
+                raise ValueError(f"輸入取樣率 {sound_file.samplerate} Hz 與模型 {sample_rate} Hz 不符")
+            remaining = num_samples
+            with sf.SoundFile(output_path, 'w', samplerate=sound_file.samplerate,
+                              channels=1, subtype=subtype) as out_file:
+                for segment in self.stream(self.iter_file_chunks(sound_file)):
+                    segment = segment[:remaining].numpy()
+                    out_file.write(segment)
+                    remaining -= segment.shape[0]
+        return num_samples
+
+    @torch.no_grad()
+    def compare_with_full(self, waveform):
+        """
+        比較分段推理與整段推理的輸出差異
+
+        Returns:
+            dict: max_abs_diff、snr_db (以整段推理為參考，差異視為雜訊) 與兩者長度
+        """
+        waveform = torch.as_tensor(waveform).reshape(-1)
+        chunked = self.enhance(waveform)
+        full = self.model(waveform.unsqueeze(0).to(self.device))
+        full = full.reshape(-1)[:waveform.shape[0]].float().cpu()
+        length = min(full.shape[0], chunked.shape[0])
+        diff = chunked[:length] - full[:length]
+        signal_energy = torch.sum(full[:length] ** 2).item()
+        noise_energy = torch.sum(diff ** 2).item()
+        return {
+            'max_abs_diff': diff.abs().max().item() if length > 0 else 0.0,
+            'snr_db': 10 * math.log10((signal_energy + 1e-12) / (noise_energy + 1e-12)),
+            'length': length,
+        }
+
+
+def main():
+    import yaml
+    from evaluate_best_model import build_model, load_checkpoint_weights
+    from inference_bundle import is_bundle, load_bundle
+
+    parser = argparse.ArgumentParser(description='分段串流推理 (適用任意長度錄音)')
+    parser.add_argument('--checkpoint', type=str, required=True, help='檢查點或推理權重包路徑')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--input', type=str, required=True, help='輸入 WAV 檔')
+    parser.add_argument('--output', type=str, required=True, help='輸出 WAV 檔')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                       help='片段長度 (default: 配置中的 max_audio_length)')
+    parser.add_argument('--overlap', type=int, default=None,
+                       help='片段重疊長度 (default: max(n_fft, chunk_size // 4))')
+    parser.add_argument('--batch-size', type=int, default=8, help='每次前向傳播的片段數 (default: 8)')
+    parser.add_argument('--compare', action='store_true',
+                       help='同時執行整段推理並回報差異 (需要整段音訊載入記憶體)')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    if is_bundle(args.checkpoint):
+        model, _ = load_bundle(args.checkpoint, device)
+    else:
+        model = build_model(config, device)
+        load_checkpoint_weights(model, args.checkpoint, device)
+
+    kwargs = {'overlap': args.overlap, 'batch_size': args.batch_size}
+    if args.chunk_size is not None:
+        kwargs['chunk_size'] = args.chunk_size
+    engine = ChunkedInference.from_config(model, config, **kwargs)
+    sample_rate = config['data']['preprocessing']['target_sample_rate']
+
+    print(f"\n🔪 片段長度 {engine.chunk_size} / 重疊 {engine.overlap} / 步長 {engine.stride} 取樣點")
+    num_samples = engine.enhance_file(args.input, args.output, sample_rate=sample_rate)
+    print(f"✅ 已輸出 {args.output} ({num_samples / sample_rate:.1f} 秒)")
+
+    if args.compare:
+        audio, _ = sf.read(args.input, dtype='float32', always_2d=True)
+        diff = engine.compare_with_full(torch.from_numpy(np.ascontiguousarray(audio.mean(axis=1))))
+        print(f"\n📏 與整段推理比較:")
+        print(f"   最大絕對差異: {diff['max_abs_diff']:.3e}")
+        print(f"   差異 SNR:     {diff['snr_db']:.2f} dB")
+
+
+if __name__ == '__main__':
+    main()
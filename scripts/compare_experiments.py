@@ -1,49 +1,41 @@
 #!/usr/bin/env python3
 """
 實驗比較腳本
-比較兩個實驗的評估結果
+比較兩個實驗的評估結果，或以 --exps 同時比較多個實驗
+
+多實驗比較以 uttid 雜湊索引對齊，所有實驗兩兩的逐樣本配對差異、
+bootstrap 信賴區間與配對檢定皆以矩陣運算完成 (50 個實驗 x 10 萬樣本亦可在數秒內完成)
 """
 
 import csv
-import json
+import math
+import time
 from pathlib import Path
 import argparse
 import numpy as np
 
+from result_store import load_results, load_run_metadata
+
 def load_experiment(exp_dir):
     """載入實驗資料"""
     exp_dir = Path(exp_dir)
     
-    # 載入 CSV
-    csv_path = exp_dir / 'evaluation_results.csv'
-    results = []
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            results.append({
-                'uttid': row['uttid'],
-                'si_snr_noisy': float(row['si_snr_noisy']),
-                'si_snr_enhanced': float(row['si_snr_enhanced']),
-                'improvement': float(row['improvement'])
-            })
-    
-    # 載入 metadata (如果存在)
-    metadata_path = exp_dir / 'metadata.json'
-    metadata = None
-    if metadata_path.exists():
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+    # 載入逐樣本結果 (欄式結果檔，舊結果退回 CSV)
+    columns = load_results(exp_dir, ['uttid', 'improvement'])
+    
+    # 載入 metadata (npz 內嵌或 metadata.json，都沒有時為 None)
+    metadata = load_run_metadata(exp_dir)
     
     return {
         'dir': exp_dir,
         'name': exp_dir.name,
-        'results': results,
+        'uttids': columns['uttid'],
+        'improvements': np.asarray(columns['improvement'], dtype=np.float64),
         'metadata': metadata
     }
 
-def compute_statistics(results):
+def compute_statistics(improvements):
     """計算統計資訊"""
-    improvements = [r['improvement'] for r in results]
     return {
         'count': len(improvements),
         'mean': np.mean(improvements),
@@ -55,6 +47,237 @@ def compute_statistics(results):
         'q75': np.percentile(improvements, 75)
     }
 
+def _uttid_hashes(uttids):
+    """
+    固定寬度 uttid 字串的 64 位元多項式雜湊 (向量化)
+
+    尾端補零的字元不影響結果，不同寬度的字串陣列可直接比較
+    """
+    uttids = np.ascontiguousarray(uttids, dtype=np.str_)
+    width = uttids.dtype.itemsize // 4
+    if len(uttids) == 0 or width == 0:
+        return np.zeros(len(uttids), dtype=np.uint64)
+    chars = uttids.view(np.uint32).reshape(len(uttids), width).astype(np.uint64)
+    # 1, P, P^2, ... (mod 2^64)
+    powers = np.ones(width, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for k in range(1, width):
+            powers[k] = powers[k - 1] * np.uint64(1000003)
+        return (chars * powers).sum(axis=1, dtype=np.uint64)
+
+def align_experiments(experiments, column='improvements'):
+    """
+    以 uttid 對齊多個實驗的逐樣本結果 (只保留所有實驗都有的樣本)
+
+    以第一個實驗 uttid 的 64 位元雜湊建立排序索引，其他實驗以 searchsorted 一次查出位置，
+    再逐一比對字串確認 (雜湊碰撞時退回 dict 查找)；uttid 陣列與第一個實驗相同時直接沿用
+
+    Returns:
+        (common_uttids, matrix): 共同 uttid (依第一個實驗的順序) 與 (實驗數, 樣本數) 的數值矩陣
+    """
+    reference = np.asarray(experiments[0]['uttids'], dtype=np.str_)
+    num_ref = len(reference)
+    ref_hashes = _uttid_hashes(reference)
+    ref_order = np.argsort(ref_hashes, kind='stable')
+    sorted_hashes = ref_hashes[ref_order]
+    index = None
+
+    positions = []  # 每個實驗中，第一個實驗各樣本的位置 (-1 表示沒有)
+    common = np.ones(num_ref, dtype=bool)
+    for exp in experiments:
+        uttids = np.asarray(exp['uttids'], dtype=np.str_)
+        if uttids.shape == reference.shape and np.array_equal(uttids, reference):
+            positions.append(np.arange(num_ref))
+            continue
+        hashes = _uttid_hashes(uttids)
+        found = np.minimum(np.searchsorted(sorted_hashes, hashes), max(num_ref - 1, 0))
+        codes = np.where(sorted_hashes[found] == hashes, ref_order[found], -1) if num_ref else \
+            np.full(len(uttids), -1)
+        valid = codes >= 0
+        if not np.array_equal(reference[codes[valid]], uttids[valid]):
+            # 雜湊碰撞 (極少見)：改以 dict 查找
+            if index is None:
+                index = {uttid: k for k, uttid in enumerate(reference.tolist())}
+            codes = np.fromiter((index.get(uttid, -1) for uttid in uttids.tolist()),
+                                dtype=np.int64, count=len(uttids))
+            valid = codes >= 0
+        position = np.full(num_ref, -1, dtype=np.int64)
+        position[codes[valid]] = np.flatnonzero(valid)
+        common &= position >= 0
+        positions.append(position)
+
+    common_idx = np.flatnonzero(common)
+    matrix = np.empty((len(experiments), len(common_idx)), dtype=np.float64)
+    for k, exp in enumerate(experiments):
+        matrix[k] = np.asarray(exp[column])[positions[k][common_idx]]
+    return reference[common_idx], matrix
+
+def bootstrap_means(matrix, num_bootstrap=1000, seed=0, chunk_size=32):
+    """
+    所有實驗共用同一組重抽樣的 bootstrap 平均
+
+    每次重抽樣表示為各樣本的抽中次數 (bincount)，以矩陣乘法一次求出所有實驗的平均；
+    配對差異的 bootstrap 分佈即為兩個實驗平均之差，不需對每一對重抽樣
+
+    Args:
+        matrix: (實驗數, 樣本數)
+        num_bootstrap: 重抽樣次數
+        chunk_size: 每次產生的重抽樣數 (記憶體約 chunk_size x 樣本數 x 8 bytes)
+
+    Returns:
+        np.ndarray: (實驗數, num_bootstrap)
+    """
+    rng = np.random.default_rng(seed)
+    num_exps, n = matrix.shape
+    means = np.empty((num_exps, num_bootstrap), dtype=np.float64)
+    for start in range(0, num_bootstrap, chunk_size):
+        b = min(chunk_size, num_bootstrap - start)
+        indices = rng.integers(0, n, size=(b, n))
+        indices += np.arange(b)[:, None] * n
+        counts = np.bincount(indices.ravel(), minlength=b * n).reshape(b, n).astype(np.float64)
+        means[:, start:start + b] = matrix @ counts.T / n
+    return means
+
+def holm_correction(p_values):
+    """Holm-Bonferroni 多重比較校正後的 p 值"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    m = len(p_values)
+    order = np.argsort(p_values)
+    adjusted = np.maximum.accumulate(p_values[order] * (m - np.arange(m)))
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+def paired_comparison(matrix, pairs=None, num_bootstrap=1000, confidence=0.95, seed=0, boot=None):
+    """
+    對實驗兩兩計算配對差異統計 (第 j 個減第 i 個)
+
+    - 平均差異與配對 t 檢定：差異的變異數由共變異數矩陣取得 (var_i + var_j - 2 cov_ij)，
+      不需實際展開每一對的差異向量；樣本數大時 p 值以常態近似 (雙尾)
+    - bootstrap 信賴區間：共用 bootstrap_means 的結果
+    - 勝率：逐樣本差異 > 0 的比例
+
+    Args:
+        matrix: (實驗數, 樣本數)，已依 uttid 對齊
+        pairs: [(i, j)] (None 表示所有 i < j)
+        boot: 已計算的 bootstrap_means 結果 (None 時重新計算)
+
+    Returns:
+        dict: i, j, mean_diff, ci_low, ci_high, t, p_value, p_holm, win_rate 等陣列
+    """
+    num_exps, n = matrix.shape
+    if pairs is None:
+        pairs = [(i, j) for i in range(num_exps) for j in range(i + 1, num_exps)]
+    i_idx = np.array([p[0] for p in pairs], dtype=np.int64)
+    j_idx = np.array([p[1] for p in pairs], dtype=np.int64)
+
+    means = matrix.mean(axis=1)
+    cov = np.atleast_2d(np.cov(matrix, ddof=1))
+    mean_diff = means[j_idx] - means[i_idx]
+    var_diff = np.maximum(cov[i_idx, i_idx] + cov[j_idx, j_idx] - 2 * cov[i_idx, j_idx], 0.0)
+    std_err = np.sqrt(var_diff / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(std_err > 0, mean_diff / std_err, np.where(mean_diff == 0, 0.0, np.inf))
+    p_value = np.array([math.erfc(abs(value) / math.sqrt(2)) for value in t])
+
+    if boot is None:
+        boot = bootstrap_means(matrix, num_bootstrap, seed)
+    num_bootstrap = boot.shape[1]
+    boot_diff = boot[j_idx] - boot[i_idx]
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(boot_diff, [alpha, 1 - alpha], axis=1)
+
+    # 依 i 分組，一次比較 i 與所有對應的 j
+    win_rate = np.empty(len(pairs))
+    for i in np.unique(i_idx):
+        mask = i_idx == i
+        win_rate[mask] = (matrix[j_idx[mask]] > matrix[i]).mean(axis=1)
+
+    return {
+        'i': i_idx, 'j': j_idx, 'mean_diff': mean_diff, 'std_err': std_err,
+        'ci_low': ci_low, 'ci_high': ci_high, 't': t, 'p_value': p_value,
+        'p_holm': holm_correction(p_value), 'win_rate': win_rate,
+        'num_bootstrap': num_bootstrap, 'confidence': confidence,
+    }
+
+def compare_many(exp_dirs, reference=None, num_bootstrap=1000, confidence=0.95, seed=0,
+                 output_csv=None, max_rows=50):
+    """
+    多實驗比較
+
+    Args:
+        exp_dirs: 實驗結果目錄列表
+        reference: 只比較此實驗 (索引) 與其他實驗；None 表示所有兩兩組合
+        output_csv: 兩兩比較表的輸出路徑
+        max_rows: 終端機最多顯示的比較列數 (依 |t| 由大到小)
+    """
+    start = time.perf_counter()
+    experiments = [load_experiment(d) for d in exp_dirs]
+    names = [exp['name'] for exp in experiments]
+    if len(set(names)) < len(names):
+        names = [f"{exp['dir'].parent.name}/{exp['name']}" for exp in experiments]
+    load_time = time.perf_counter() - start
+
+    align_start = time.perf_counter()
+    common_uttids, matrix = align_experiments(experiments)
+    align_time = time.perf_counter() - align_start
+    print("=" * 80)
+    print(f"多實驗比較 ({len(experiments)} 個實驗, 共同樣本 {len(common_uttids)} 個)")
+    print("=" * 80)
+    if len(common_uttids) < 2:
+        print("⚠️ 共同樣本不足，無法比較")
+        return None
+
+    pairs = None
+    if reference is not None:
+        pairs = [(reference, j) for j in range(len(experiments)) if j != reference]
+    compare_start = time.perf_counter()
+    boot = bootstrap_means(matrix, num_bootstrap, seed)
+    comparison = paired_comparison(matrix, pairs, confidence=confidence, boot=boot)
+    compare_time = time.perf_counter() - compare_start
+
+    # 各實驗在共同樣本上的平均與 bootstrap 信賴區間
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(boot, [alpha, 1 - alpha], axis=1)
+    means = matrix.mean(axis=1)
+    width = max(len(name) for name in names)
+    print(f"\n{'實驗':<{width}} {'樣本數':>8} {'平均改善':>10} {f'{confidence:.0%} 信賴區間':>22}")
+    print("-" * 80)
+    for k in np.argsort(-means):
+        print(f"{names[k]:<{width}} {len(experiments[k]['improvements']):>8} {means[k]:>+10.2f} "
+              f"   [{low[k]:+.2f}, {high[k]:+.2f}]")
+
+    print(f"\n兩兩配對比較 (B - A, bootstrap {num_bootstrap} 次, p 值經 Holm 校正):")
+    print(f"{'A':<{width}} {'B':<{width}} {'差異':>8} {'信賴區間':>18} {'p (Holm)':>10} {'勝率':>7}")
+    print("-" * 80)
+    order = np.argsort(-np.abs(comparison['t']), kind='stable')
+    for k in order[:max_rows]:
+        marker = '✅' if comparison['p_holm'][k] < 1 - confidence else '  '
+        print(f"{names[comparison['i'][k]]:<{width}} {names[comparison['j'][k]]:<{width}} "
+              f"{comparison['mean_diff'][k]:>+8.2f} "
+              f"  [{comparison['ci_low'][k]:+6.2f}, {comparison['ci_high'][k]:+6.2f}] "
+              f"{comparison['p_holm'][k]:>10.2g} {comparison['win_rate'][k]:>6.1%} {marker}")
+    if len(order) > max_rows:
+        print(f"   ... 另有 {len(order) - max_rows} 組 (完整結果請用 --output-csv)")
+
+    if output_csv is not None:
+        with open(output_csv, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['exp_a', 'exp_b', 'mean_diff', 'ci_low', 'ci_high',
+                             't', 'p_value', 'p_holm', 'win_rate', 'num_common'])
+            for k in range(len(comparison['i'])):
+                writer.writerow([names[comparison['i'][k]], names[comparison['j'][k]],
+                                 comparison['mean_diff'][k], comparison['ci_low'][k],
+                                 comparison['ci_high'][k], comparison['t'][k],
+                                 comparison['p_value'][k], comparison['p_holm'][k],
+                                 comparison['win_rate'][k], len(common_uttids)])
+        print(f"\n💾 比較表已保存: {output_csv}")
+
+    print(f"\n⏱️  載入 {load_time:.2f} 秒, 對齊 {align_time:.2f} 秒, "
+          f"比較 {compare_time:.2f} 秒 ({len(comparison['i'])} 組)")
+    print("=" * 80)
+    return comparison
+
 def compare_experiments(exp1_dir, exp2_dir):
     """比較兩個實驗"""
     print("=" * 80)
@@ -71,8 +294,8 @@ def compare_experiments(exp1_dir, exp2_dir):
     print()
     
     # 計算統計
-    stats1 = compute_statistics(exp1['results'])
-    stats2 = compute_statistics(exp2['results'])
+    stats1 = compute_statistics(exp1['improvements'])
+    stats2 = compute_statistics(exp2['improvements'])
     
     # 顯示基本資訊
     print("=" * 80)
@@ -112,15 +335,15 @@ def compare_experiments(exp1_dir, exp2_dir):
     print("效能分類")
     print("=" * 80)
     
-    def classify_performance(results):
-        excellent = sum(1 for r in results if r['improvement'] > 10)
-        good = sum(1 for r in results if 5 < r['improvement'] <= 10)
-        moderate = sum(1 for r in results if 0 < r['improvement'] <= 5)
-        poor = sum(1 for r in results if r['improvement'] <= 0)
+    def classify_performance(improvements):
+        excellent = int(np.sum(improvements > 10))
+        good = int(np.sum((improvements > 5) & (improvements <= 10)))
+        moderate = int(np.sum((improvements > 0) & (improvements <= 5)))
+        poor = int(np.sum(improvements <= 0))
         return excellent, good, moderate, poor
     
-    e1_exc, e1_good, e1_mod, e1_poor = classify_performance(exp1['results'])
-    e2_exc, e2_good, e2_mod, e2_poor = classify_performance(exp2['results'])
+    e1_exc, e1_good, e1_mod, e1_poor = classify_performance(exp1['improvements'])
+    e2_exc, e2_good, e2_mod, e2_poor = classify_performance(exp2['improvements'])
     
     print(f"{'類別':<20} {'實驗 1':>15} {'實驗 2':>15} {'差異':>15}")
     print("-" * 80)
@@ -176,16 +399,33 @@ def compare_experiments(exp1_dir, exp2_dir):
             print(f"{label:<20} {str(v1):>25} {str(v2):>25}")
         
         print()
+        
+        # 效能 (evaluate_best_model --profile 寫入的階段耗時)
+        p1 = exp1['metadata'].get('performance', {}).get('stages', {})
+        p2 = exp2['metadata'].get('performance', {}).get('stages', {})
+        if p1 and p2:
+            print("=" * 80)
+            print("階段耗時 (p50 / p95 ms)")
+            print("=" * 80)
+            print(f"{'階段':<20} {'實驗 1':>25} {'實驗 2':>25}")
+            print("-" * 80)
+            for stage in sorted(set(p1) | set(p2), key=lambda k: -p1.get(k, p2.get(k))['total_s']):
+                cells = []
+                for p in (p1, p2):
+                    cells.append(f"{p[stage]['p50_ms']:.2f} / {p[stage]['p95_ms']:.2f}" if stage in p else 'N/A')
+                print(f"{stage:<20} {cells[0]:>25} {cells[1]:>25}")
+            w1 = exp1['metadata']['performance'].get('wall_time_s')
+            w2 = exp2['metadata']['performance'].get('wall_time_s')
+            print(f"{'總時間 (s)':<20} {str(w1):>25} {str(w2):>25}")
+            print()
     
     # 逐樣本比較
     print("=" * 80)
     print("逐樣本改善差異 (實驗2 - 實驗1)")
     print("=" * 80)
     
-    # 確保兩個實驗有相同的樣本
-    uttids1 = {r['uttid'] for r in exp1['results']}
-    uttids2 = {r['uttid'] for r in exp2['results']}
-    common_uttids = uttids1 & uttids2
+    # 以排序陣列對齊兩個實驗的共同樣本
+    common_uttids, aligned = align_experiments([exp1, exp2])
     
     if len(common_uttids) == 0:
         print("⚠️ 兩個實驗沒有共同樣本")
@@ -194,38 +434,39 @@ def compare_experiments(exp1_dir, exp2_dir):
         print()
         
         # 計算差異
-        diffs = []
-        for uttid in sorted(common_uttids):
-            r1 = next(r for r in exp1['results'] if r['uttid'] == uttid)
-            r2 = next(r for r in exp2['results'] if r['uttid'] == uttid)
-            diff = r2['improvement'] - r1['improvement']
-            diffs.append((uttid, r1['improvement'], r2['improvement'], diff))
-        
-        # 排序找出最大改善和退步
-        diffs.sort(key=lambda x: x[3])
+        imp1, imp2 = aligned
+        diff_values = imp2 - imp1
+        order = np.argsort(diff_values, kind='stable')
         
         print("📉 最大退步 (Top 5):")
-        for i, (uttid, imp1, imp2, diff) in enumerate(diffs[:5], 1):
-            print(f"  {i}. {uttid}: {imp1:+.2f} dB → {imp2:+.2f} dB ({diff:+.2f} dB)")
+        for i, k in enumerate(order[:5], 1):
+            print(f"  {i}. {common_uttids[k]}: {imp1[k]:+.2f} dB → {imp2[k]:+.2f} dB ({diff_values[k]:+.2f} dB)")
         
         print()
         print("📈 最大改善 (Top 5):")
-        for i, (uttid, imp1, imp2, diff) in enumerate(diffs[-5:][::-1], 1):
-            print(f"  {i}. {uttid}: {imp1:+.2f} dB → {imp2:+.2f} dB ({diff:+.2f} dB)")
+        for i, k in enumerate(order[-5:][::-1], 1):
+            print(f"  {i}. {common_uttids[k]}: {imp1[k]:+.2f} dB → {imp2[k]:+.2f} dB ({diff_values[k]:+.2f} dB)")
         
         print()
         
         # 統計差異分布
-        diff_values = [d[3] for d in diffs]
-        better = sum(1 for d in diff_values if d > 0)
-        worse = sum(1 for d in diff_values if d < 0)
-        same = sum(1 for d in diff_values if d == 0)
+        better = int(np.sum(diff_values > 0))
+        worse = int(np.sum(diff_values < 0))
+        same = int(np.sum(diff_values == 0))
         
         print(f"實驗 2 相對於實驗 1:")
         print(f"  更好: {better} 個樣本 ({better/len(diff_values)*100:.1f}%)")
         print(f"  更差: {worse} 個樣本 ({worse/len(diff_values)*100:.1f}%)")
         print(f"  相同: {same} 個樣本 ({same/len(diff_values)*100:.1f}%)")
         print(f"  平均差異: {np.mean(diff_values):+.2f} dB")
+        
+        # 配對 bootstrap 信賴區間與配對 t 檢定 (平均差異本身不足以判斷優劣)
+        if len(common_uttids) > 1:
+            pairs = paired_comparison(aligned)
+            significant = '顯著' if pairs['p_value'][0] < 0.05 else '不顯著'
+            print(f"  95% 信賴區間: [{pairs['ci_low'][0]:+.2f}, {pairs['ci_high'][0]:+.2f}] dB "
+                  f"(bootstrap {pairs['num_bootstrap']} 次)")
+            print(f"  配對 t 檢定: t = {pairs['t'][0]:.2f}, p = {pairs['p_value'][0]:.2g} ({significant})")
     
     print()
     print("=" * 80)
@@ -242,12 +483,31 @@ def compare_experiments(exp1_dir, exp2_dir):
         print("⚖️ 兩個實驗表現相當")
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='比較兩個實驗的評估結果')
-    parser.add_argument('--exp1', type=str, required=True,
+    parser = argparse.ArgumentParser(description='比較實驗的評估結果')
+    parser.add_argument('--exp1', type=str, default=None,
                        help='實驗1的結果目錄路徑')
-    parser.add_argument('--exp2', type=str, required=True,
+    parser.add_argument('--exp2', type=str, default=None,
                        help='實驗2的結果目錄路徑')
+    parser.add_argument('--exps', type=str, nargs='+', default=None,
+                       help='多實驗比較的結果目錄路徑 (兩個以上)')
+    parser.add_argument('--reference', type=int, default=None,
+                       help='多實驗比較時只與第幾個實驗 (從 0 起算) 比較 (default: 所有兩兩組合)')
+    parser.add_argument('--bootstrap', type=int, default=1000,
+                       help='bootstrap 重抽樣次數 (default: 1000)')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                       help='信賴水準 (default: 0.95)')
+    parser.add_argument('--seed', type=int, default=0, help='bootstrap 亂數種子 (default: 0)')
+    parser.add_argument('--output-csv', type=str, default=None,
+                       help='多實驗比較表的輸出路徑')
     
     args = parser.parse_args()
     
-    compare_experiments(args.exp1, args.exp2)
+    if args.exps:
+        if len(args.exps) < 2:
+            parser.error('--exps 至少需要兩個實驗')
+        compare_many(args.exps, reference=args.reference, num_bootstrap=args.bootstrap,
+                     confidence=args.confidence, seed=args.seed, output_csv=args.output_csv)
+    elif args.exp1 and args.exp2:
+        compare_experiments(args.exp1, args.exp2)
+    else:
+        parser.error('請指定 --exp1 與 --exp2，或 --exps')
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+資料集清單索引 (manifest)
+以行程池對成對的 clean/noisy scp 執行 soundfile.info，檢查配對與檔案狀態，
+寫出欄位式索引 (uttid、路徑、frames、取樣率、聲道數)，供 sampler、波形快取與評估直接載入
+
+再次建立時會沿用舊索引：檔案大小與修改時間 (mtime) 未變的項目不重新讀取檔頭
+
+使用方式:
+    python scripts/dataset_manifest.py --config configs/training_rtx5090.yaml
+    python scripts/dataset_manifest.py --clean-scp data/scp/valid_clean_relative.scp --noisy-scp data/scp/valid_noisy_relative.scp
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import read_scp, resolve_audio_path
+
+MANIFEST_VERSION = 1
+HEADER_FIELDS = ('frames', 'sr', 'channels', 'size', 'mtime_ns')
+
+
+def default_manifest_path(clean_scp_path):
+    """預設索引路徑：clean scp 旁的 <scp 名稱>.manifest.npz"""
+    clean_scp_path = Path(clean_scp_path)
+    return clean_scp_path.with_name(clean_scp_path.stem + '.manifest.npz')
+
+
+def _read_header(path):
+    """worker: 讀取單一檔案的 stat 與檔頭，失敗時回傳錯誤訊息"""
+    try:
+        stat = os.stat(path)
+        info = sf.info(path)
+    except Exception as e:
+        return path, None, str(e)
+    return path, (info.frames, info.samplerate, info.channels, stat.st_size, stat.st_mtime_ns), None
+
+
+def _previous_headers(manifest_path):
+    """由舊索引取得 路徑 → 檔頭 的對照表 (版本不符或讀取失敗時回傳空表)"""
+    if manifest_path is None or not os.path.exists(manifest_path):
+        return {}
+    try:
+        manifest = DatasetManifest(manifest_path)
+    except Exception:
+        return {}
+    if manifest.meta.get('version') != MANIFEST_VERSION:
+        return {}
+
+    headers = {}
+    for kind in ('clean', 'noisy'):
+        columns = [manifest.columns[f'{kind}_{field}'] for field in HEADER_FIELDS]
+        for path, *values in zip(manifest.columns[f'{kind}_path'], *columns):
+            headers[str(path)] = tuple(int(v) for v in values)
+    return headers
+
+
+def build_manifest(clean_scp_path, noisy_scp_path, manifest_path=None, num_workers=4,
+                   root=None, rescan=False):
+    """
+    建立 (或增量更新) 資料集索引
+
+    Args:
+        clean_scp_path, noisy_scp_path: 成對的 scp 檔
+        manifest_path: 輸出路徑 (None 使用 default_manifest_path)
+        num_workers: 讀取檔頭的行程數
+        root: scp 相對路徑的基準目錄
+        rescan: True 時忽略舊索引，全部重新讀取
+
+    Returns:
+        DatasetManifest: 新索引
+    """
+    manifest_path = Path(manifest_path or default_manifest_path(clean_scp_path))
+    clean = read_scp(clean_scp_path)
+    noisy = read_scp(noisy_scp_path)
+
+    problems = []
+    for uttid in clean:
+        if uttid not in noisy:
+            problems.append({'uttid': uttid, 'issue': 'missing_noisy_entry'})
+    for uttid in noisy:
+        if uttid not in clean:
+            problems.append({'uttid': uttid, 'issue': 'missing_clean_entry'})
+
+    pairs = [
+        (uttid,
+         str(resolve_audio_path(clean[uttid], clean_scp_path, root)),
+         str(resolve_audio_path(noisy[uttid], noisy_scp_path, root)))
+        for uttid in clean if uttid in noisy
+    ]
+
+    # 只對新增或大小/mtime 改變的檔案重新讀取檔頭
+    previous = {} if rescan else _previous_headers(manifest_path)
+    headers, errors, to_scan = {}, {}, []
+    for path in dict.fromkeys(p for _, c, n in pairs for p in (c, n)):
+        old = previous.get(path)
+        if old is not None:
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                errors[path] = str(e)
+                continue
+            if (stat.st_size, stat.st_mtime_ns) == old[3:]:
+                headers[path] = old
+                continue
+        to_scan.append(path)
+
+    start = time.time()
+    print(f"\n📋 建立資料集索引: {manifest_path}")
+    print(f"   {len(pairs)} 對音訊, 沿用 {len(headers)} 個檔頭, 需讀取 {len(to_scan)} 個檔案")
+    if to_scan:
+        with Pool(num_workers) as pool:
+            for k, (path, header, error) in enumerate(
+                    pool.imap_unordered(_read_header, to_scan, chunksize=64), 1):
+                if error is not None:
+                    errors[path] = error
+                else:
+                    headers[path] = header
+                if k % 5000 == 0:
+                    print(f"   讀取進度: {k}/{len(to_scan)}")
+
+    columns = {f'{kind}_{field}': [] for kind in ('clean', 'noisy') for field in HEADER_FIELDS}
+    columns.update(uttid=[], clean_path=[], noisy_path=[])
+    for uttid, clean_path, noisy_path in pairs:
+        missing = [p for p in (clean_path, noisy_path) if p not in headers]
+        if missing:
+            for path in missing:
+                problems.append({'uttid': uttid, 'issue': 'unreadable', 'path': path,
+                                 'error': errors.get(path, '')})
+            continue
+
+        clean_header, noisy_header = headers[clean_path], headers[noisy_path]
+        if clean_header[1] != noisy_header[1]:
+            problems.append({'uttid': uttid, 'issue': 'sample_rate_mismatch',
+                             'clean': clean_header[1], 'noisy': noisy_header[1]})
+        elif clean_header[0] != noisy_header[0]:
+            problems.append({'uttid': uttid, 'issue': 'length_mismatch',
+                             'clean': clean_header[0], 'noisy': noisy_header[0]})
+
+        columns['uttid'].append(uttid)
+        columns['clean_path'].append(clean_path)
+        columns['noisy_path'].append(noisy_path)
+        for kind, header in (('clean', clean_header), ('noisy', noisy_header)):
+            for field, value in zip(HEADER_FIELDS, header):
+                columns[f'{kind}_{field}'].append(value)
+
+    meta = {
+        'version': MANIFEST_VERSION,
+        'clean_scp': str(clean_scp_path),
+        'noisy_scp': str(noisy_scp_path),
+        'num_utterances': len(columns['uttid']),
+        'problems': problems,
+    }
+
+    arrays = {name: np.array(values, dtype=np.str_)
+              for name, values in columns.items() if name in ('uttid', 'clean_path', 'noisy_path')}
+    arrays.update({name: np.array(values, dtype=np.int64)
+                   for name, values in columns.items() if name not in arrays})
+    arrays['meta'] = np.array(json.dumps(meta, ensure_ascii=False))
+
+    # 寫到暫存檔再改名，中斷時不會留下損壞的索引
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_name(f'{manifest_path.name}.tmp-{os.getpid()}.npz')
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, manifest_path)
+
+    print(f"✅ 索引完成: {meta['num_utterances']} 對音訊 ({time.time() - start:.1f} 秒)")
+    if problems:
+        counts = {}
+        for problem in problems:
+            counts[problem['issue']] = counts.get(problem['issue'], 0) + 1
+        print(f"⚠️  發現 {len(problems)} 個問題: "
+              + ", ".join(f"{issue} × {n}" for issue, n in sorted(counts.items())))
+    return DatasetManifest(manifest_path)
+
+
+class DatasetManifest:
+    """
+    已建立的資料集索引 (欄位式，一次載入)
+
+    columns 為 欄位名稱 → numpy 陣列：uttid、clean_path、noisy_path，
+    以及 clean_/noisy_ 開頭的 frames、sr、channels、size、mtime_ns
+    """
+
+    def __init__(self, manifest_path):
+        self.path = Path(manifest_path)
+        with np.load(self.path) as data:
+            self.columns = {name: data[name] for name in data.files if name != 'meta'}
+            self.meta = json.loads(str(data['meta']))
+        self.uttids = [str(u) for u in self.columns['uttid']]
+
+    def __len__(self):
+        return len(self.uttids)
+
+    @property
+    def problems(self):
+        return self.meta.get('problems', [])
+
+    def pairs(self):
+        """與 read_paired_scp 相同格式的 (uttid, clean_path, noisy_path) 清單"""
+        return [(uttid, Path(c), Path(n)) for uttid, c, n in
+                zip(self.uttids, self.columns['clean_path'], self.columns['noisy_path'])]
+
+    def headers(self):
+        """每個樣本的 ((clean_sr, clean_frames), (noisy_sr, noisy_frames))"""
+        c = self.columns
+        return [((int(cs), int(cf)), (int(ns), int(nf))) for cs, cf, ns, nf in
+                zip(c['clean_sr'], c['clean_frames'], c['noisy_sr'], c['noisy_frames'])]
+
+    def lengths(self, target_sample_rate=None):
+        """
+        每個樣本的長度 (clean/noisy 取較短者)
+
+        Args:
+            target_sample_rate: 指定時換算成重取樣後的取樣點數
+        """
+        lengths = []
+        for kind in ('clean', 'noisy'):
+            frames = self.columns[f'{kind}_frames']
+            if target_sample_rate is not None:
+                frames = frames * target_sample_rate // self.columns[f'{kind}_sr']
+            lengths.append(frames)
+        return np.minimum(*lengths)
+
+    def durations(self):
+        """每個樣本的秒數 (clean/noisy 取較短者)"""
+        return np.minimum(self.columns['clean_frames'] / self.columns['clean_sr'],
+                          self.columns['noisy_frames'] / self.columns['noisy_sr'])
+
+
+def load_manifest(clean_scp_path, noisy_scp_path, manifest_path=None):
+    """
+    載入與 scp 對應的索引；不存在或對應的 scp 不同時回傳 None
+    """
+    manifest_path = Path(manifest_path or default_manifest_path(clean_scp_path))
+    if not manifest_path.exists():
+        return None
+    manifest = DatasetManifest(manifest_path)
+    if (manifest.meta.get('version') != MANIFEST_VERSION
+            or manifest.meta.get('clean_scp') != str(clean_scp_path)
+            or manifest.meta.get('noisy_scp') != str(noisy_scp_path)):
+        return None
+    return manifest
+
+
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(description='建立資料集清單索引')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑 (未指定 --clean-scp/--noisy-scp 時使用)')
+    parser.add_argument('--splits', type=str, nargs='+', default=['train', 'valid'],
+                       help='要建立索引的資料集 (default: train valid)')
+    parser.add_argument('--clean-scp', type=str, default=None, help='clean scp 路徑')
+    parser.add_argument('--noisy-scp', type=str, default=None, help='noisy scp 路徑')
+    parser.add_argument('--output', type=str, default=None,
+                       help='索引輸出路徑 (default: clean scp 旁的 .manifest.npz)')
+    parser.add_argument('--workers', type=int, default=4, help='讀取檔頭的行程數 (default: 4)')
+    parser.add_argument('--root', type=str, default=None, help='scp 相對路徑的基準目錄')
+    parser.add_argument('--rescan', action='store_true', help='忽略舊索引，全部重新讀取')
+
+    args = parser.parse_args()
+
+    if args.clean_scp or args.noisy_scp:
+        if not (args.clean_scp and args.noisy_scp):
+            print("❌ --clean-scp 與 --noisy-scp 需同時指定")
+            sys.exit(1)
+        jobs = [(args.clean_scp, args.noisy_scp, args.output)]
+    else:
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f)
+        jobs = [(config['data'][f'{split}_clean_scp'], config['data'][f'{split}_noisy_scp'], None)
+                for split in args.splits]
+
+    for clean_scp, noisy_scp, output in jobs:
+        if not os.path.exists(clean_scp) or not os.path.exists(noisy_scp):
+            print(f"❌ 找不到 scp: {clean_scp}, {noisy_scp}")
+            sys.exit(1)
+        manifest = build_manifest(clean_scp, noisy_scp, output, num_workers=args.workers,
+                                  root=args.root, rescan=args.rescan)
+        hours = manifest.durations().sum() / 3600
+        print(f"📁 {manifest.path}: {len(manifest)} 對音訊, 共 {hours:.2f} 小時")
+
+
+if __name__ == '__main__':
+    main()
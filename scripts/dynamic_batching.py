@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+依音訊總長度 (取樣點預算) 動態組批
+固定 batch_size 假設每個樣本的成本相同；max_audio_length 提高到 16000/32000
+或使用可變長度裁切時，固定批次不是浪費記憶體就是 OOM。
+TokenBudgetBatchSampler 先依長度分桶，桶內打亂後組成「批次大小 × 批次最長長度」
+不超過預算的批次，每個 epoch 以 (seed, epoch) 決定順序，可重現
+
+梯度累積改以實際樣本數正規化 (SampleCountAccumulator)：每次反向傳播使用損失總和，
+更新前再把梯度除以累積的樣本數，等效批次不受各批次大小不同影響
+
+使用方式:
+    python scripts/dynamic_batching.py --config configs/training_rtx5090.yaml --max-batch-samples 256000
+"""
+
+import argparse
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler
+
+from batched_inference import pad_batch
+
+
+def dataset_lengths(dataset, max_audio_length=None, target_sample_rate=None):
+    """
+    取得資料集每個樣本的 (裁切後) 長度
+
+    Args:
+        dataset: 提供 get_length(i) 的資料集 (CachedAudioDataset、PartialReadAudioDataset)
+                 或 dataset_manifest.DatasetManifest
+        max_audio_length: 訓練時的裁切長度，超過者以此長度計算
+        target_sample_rate: DatasetManifest 換算重取樣後長度用的取樣率
+
+    Returns:
+        np.ndarray: int64 長度
+    """
+    if hasattr(dataset, 'get_length'):
+        lengths = np.array([dataset.get_length(i) for i in range(len(dataset))], dtype=np.int64)
+    else:
+        lengths = np.asarray(dataset.lengths(target_sample_rate), dtype=np.int64)
+    if max_audio_length is not None:
+        lengths = np.minimum(lengths, max_audio_length)
+    return lengths
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    取樣點預算批次取樣器 (作為 DataLoader 的 batch_sampler)
+
+    預算以實際長度計算，資料集必須回傳未補零的樣本 (CachedAudioDataset /
+    PartialReadAudioDataset 使用 pad_to_max=False)，並以 collate_padded 組批；
+    否則每個樣本都被補到 max_audio_length，批次會超出預算
+
+    Args:
+        lengths: 每個樣本的長度 (取樣點)
+        max_batch_samples: 每批「樣本數 × 批次內最長長度」(含補零) 的上限；
+                           單一樣本超過預算時自成一批
+        bucket_width: 分桶寬度 (取樣點)，同一桶內長度差不超過此值，補零浪費也受此限制
+        max_batch_size: 每批樣本數上限 (None 表示只受預算限制)
+        shuffle: 是否打亂桶內順序與批次順序
+        seed: 亂數種子，與 epoch 共同決定順序
+        drop_last: 捨棄每個桶最後不滿預算一半的批次
+    """
+
+    def __init__(self, lengths, max_batch_samples, bucket_width=1600, max_batch_size=None,
+                 shuffle=True, seed=0, drop_last=False):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_batch_samples = max_batch_samples
+        self.bucket_width = max(1, bucket_width)
+        self.max_batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        self._batches = None
+
+    @classmethod
+    def from_config(cls, lengths, config, **kwargs):
+        """以 training.dynamic_batching 的設定建立取樣器"""
+        settings = dict(config['training'].get('dynamic_batching') or {})
+        settings.pop('enabled', None)
+        settings.pop('target_samples_per_step', None)
+        settings.update(kwargs)
+        if 'max_batch_samples' not in settings:
+            settings['max_batch_samples'] = (config['training']['batch_size']
+                                             * config['data']['preprocessing']['max_audio_length'])
+        return cls(lengths, **settings)
+
+    def set_epoch(self, epoch):
+        """每個 epoch 開始前呼叫，改變打亂順序 (與 DistributedSampler 相同介面)"""
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self._batches = None
+
+    def _build_batches(self):
+        rng = np.random.default_rng([self.seed, self.epoch])
+        order = np.argsort(self.lengths, kind='stable')
+        keys = self.lengths[order] // self.bucket_width
+        boundaries = np.flatnonzero(np.diff(keys)) + 1
+
+        batches = []
+        for bucket in np.split(order, boundaries):
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+            batch, batch_max = [], 0
+            for index in bucket:
+                length = int(self.lengths[index])
+                new_max = max(batch_max, length)
+                full = (self.max_batch_size is not None and len(batch) >= self.max_batch_size)
+                if batch and (full or (len(batch) + 1) * new_max > self.max_batch_samples):
+                    batches.append(batch)
+                    batch, new_max = [], length
+                batch.append(int(index))
+                batch_max = new_max
+            if batch:
+                if self.drop_last and len(batch) * batch_max < self.max_batch_samples // 2:
+                    continue
+                batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[k] for k in rng.permutation(len(batches))]
+        return batches
+
+    def batches(self):
+        """目前 epoch 的批次清單 (快取到 set_epoch 改變為止)"""
+        if self._batches is None:
+            self._batches = self._build_batches()
+        return self._batches
+
+    def __iter__(self):
+        return iter(self.batches())
+
+    def __len__(self):
+        return len(self.batches())
+
+    def stats(self):
+        """批次統計：批次數、平均批次大小、補零比例"""
+        batches = self.batches()
+        sizes = np.array([len(b) for b in batches])
+        real = sum(int(self.lengths[b].sum()) for b in batches)
+        padded = sum(len(b) * int(self.lengths[b].max()) for b in batches)
+        return {
+            'num_batches': len(batches),
+            'mean_batch_size': float(sizes.mean()) if len(sizes) else 0.0,
+            'min_batch_size': int(sizes.min()) if len(sizes) else 0,
+            'max_batch_size': int(sizes.max()) if len(sizes) else 0,
+            'padding_ratio': 1.0 - real / padded if padded else 0.0,
+        }
+
+
+def collate_padded(batch):
+    """
+    可變長度批次的 collate_fn：補零到批次最長長度
+    (資料集需以 pad_to_max=False 回傳實際長度，lengths 才能排除補零區段)
+
+    Returns:
+        noisy, clean: (B, T) 張量
+        uttids: 樣本 ID 清單
+        lengths: (B,) 實際長度，計算損失時傳給 si_snr_metrics.batch_si_snr 以排除補零區段
+    """
+    noisy, clean, uttids = zip(*batch)
+    noisy, lengths = pad_batch(list(noisy))
+    clean, _ = pad_batch(list(clean))
+    return noisy, clean, list(uttids), lengths
+
+
+class SampleCountAccumulator:
+    """
+    以實際樣本數正規化的梯度累積
+
+    每批呼叫 backward(per_item_loss)，以損失總和反向傳播並記錄樣本數；
+    ready() 為 True 時呼叫 step()，梯度除以累積樣本數後 (可選) 裁剪並更新，
+    因此更新使用的是所有累積樣本的平均損失梯度，與各批次大小無關
+
+    Args:
+        model: 訓練中的模型
+        optimizer: 優化器
+        target_samples: 累積到至少這麼多樣本才更新 (等效批次大小)
+        max_norm: 梯度裁剪上限 (None 表示不裁剪)
+        scaler: torch.amp.GradScaler (fp16 混合精度時使用，bf16 不需要)
+    """
+
+    def __init__(self, model, optimizer, target_samples=128, max_norm=None, scaler=None):
+        self.model = model
+        self.optimizer = optimizer
+        self.target_samples = target_samples
+        self.max_norm = max_norm
+        self.scaler = scaler
+        self.num_samples = 0
+        self.loss_sum = 0.0
+
+    @classmethod
+    def from_config(cls, model, optimizer, config, scaler=None):
+        """
+        以 training 區段設定建立：等效批次為 dynamic_batching.target_samples_per_step，
+        未設定時為 batch_size × gradient_accumulation.steps
+        """
+        training = config['training']
+        steps = 1
+        if training.get('gradient_accumulation', {}).get('enabled', False):
+            steps = training['gradient_accumulation']['steps']
+        target = (training.get('dynamic_batching') or {}).get('target_samples_per_step')
+        clipping = training.get('gradient_clipping', {})
+        return cls(model, optimizer,
+                   target_samples=target or training['batch_size'] * steps,
+                   max_norm=clipping.get('max_norm') if clipping.get('enabled', False) else None,
+                   scaler=scaler)
+
+    def backward(self, per_item_loss):
+        """
+        對一批的逐樣本損失 (B,) 反向傳播
+
+        Returns:
+            float: 該批平均損失 (記錄用)
+        """
+        loss = per_item_loss.sum()
+        if self.scaler is not None:
+            self.scaler.scale(loss).backward()
+        else:
+            loss.backward()
+        count = per_item_loss.numel()
+        loss_value = loss.item()
+        self.num_samples += count
+        self.loss_sum += loss_value
+        return loss_value / max(count, 1)
+
+    def ready(self):
+        return self.num_samples >= self.target_samples
+
+    def step(self):
+        """
+        以累積樣本數正規化梯度並更新參數
+
+        Returns:
+            dict: 本次更新的樣本數、平均損失與裁剪前梯度範數 (未裁剪時為 None)
+        """
+        if self.num_samples == 0:
+            return None
+        if self.scaler is not None:
+            self.scaler.unscale_(self.optimizer)
+
+        scale = 1.0 / self.num_samples
+        for param in self.model.parameters():
+            if param.grad is not None:
+                param.grad.mul_(scale)
+
+        grad_norm = None
+        if self.max_norm is not None:
+            grad_norm = float(torch.nn.utils.clip_grad_norm_(self.model.parameters(), self.max_norm))
+
+        if self.scaler is not None:
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
+        else:
+            self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)
+
+        summary = {
+            'num_samples': self.num_samples,
+            'loss': self.loss_sum / self.num_samples,
+            'grad_norm': grad_norm,
+        }
+        self.num_samples = 0
+        self.loss_sum = 0.0
+        return summary
+
+
+if __name__ == '__main__':
+    import yaml
+    from dataset_manifest import build_manifest, load_manifest
+
+    parser = argparse.ArgumentParser(description='動態組批統計 (比較固定 batch_size 與取樣點預算)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--split', type=str, default='train', help='資料集 (default: train)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批取樣點預算 (default: batch_size × max_audio_length)')
+    parser.add_argument('--max-audio-length', type=int, default=None,
+                       help='裁切長度 (default: 配置中的 max_audio_length；0 表示不裁切)')
+    parser.add_argument('--bucket-width', type=int, default=1600, help='分桶寬度 (default: 1600)')
+    parser.add_argument('--seed', type=int, default=0, help='亂數種子 (default: 0)')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    preprocessing = config['data']['preprocessing']
+    clean_scp = config['data'][f'{args.split}_clean_scp']
+    noisy_scp = config['data'][f'{args.split}_noisy_scp']
+
+    manifest = load_manifest(clean_scp, noisy_scp) or build_manifest(clean_scp, noisy_scp)
+    max_audio_length = args.max_audio_length
+    if max_audio_length is None:
+        max_audio_length = preprocessing['max_audio_length']
+    lengths = dataset_lengths(manifest, max_audio_length or None, preprocessing['target_sample_rate'])
+
+    kwargs = {'bucket_width': args.bucket_width, 'seed': args.seed}
+    if args.max_batch_samples is not None:
+        kwargs['max_batch_samples'] = args.max_batch_samples
+    sampler = TokenBudgetBatchSampler.from_config(lengths, config, **kwargs)
+    stats = sampler.stats()
+
+    batch_size = config['training']['batch_size']
+    fixed_padded = sum(len(chunk) * int(chunk.max())
+                       for chunk in np.array_split(lengths, max(1, len(lengths) // batch_size)))
+
+    print("=" * 80)
+    print(f"動態組批統計 ({args.split}, {len(lengths)} 個樣本, 預算 {sampler.max_batch_samples} 取樣點)")
+    print("=" * 80)
+    print(f"  批次數:         {stats['num_batches']} (固定 batch_size={batch_size}: "
+          f"{int(np.ceil(len(lengths) / batch_size))})")
+    print(f"  批次大小:       平均 {stats['mean_batch_size']:.1f}, "
+          f"範圍 {stats['min_batch_size']}-{stats['max_batch_size']}")
+    print(f"  補零比例:       {stats['padding_ratio'] * 100:.2f}% "
+          f"(固定批次未排序: {(1 - lengths.sum() / fixed_padded) * 100:.2f}%)")
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+串流增強服務的負載產生器
+在同一台機器上開啟多個並行串流，以即時速度 (或盡快) 送出 PCM 音框，量測:
+
+- 處理延遲: 某段輸出收到的時間 − 產生該段輸出所需的最後一個輸入樣本送出的時間
+  (排隊、批次等待、前向傳播與傳輸；另加上片段長度帶來的演算法延遲才是總延遲)
+- 吞吐量: 所有串流輸出音訊總長 / 經過時間 (x 即時)
+- 服務端統計 (批次大小、前向傳播耗時等)
+
+使用方式:
+    python scripts/enhancement_client.py --port 8765 --streams 16 --duration 30
+    python scripts/enhancement_client.py --unix-socket /tmp/enhance.sock --input noisy.wav --streams 1 --output enhanced.wav
+    python scripts/enhancement_client.py --port 8765 --streams 64 --no-realtime      # 最大吞吐量
+"""
+
+import json
+import time
+import bisect
+import asyncio
+import argparse
+
+import numpy as np
+import soundfile as sf
+
+from enhancement_server import (MSG_HELLO, MSG_AUDIO, MSG_END, MSG_METRICS, MSG_ERROR,
+                                pack_message, read_message, decode_pcm, encode_pcm)
+from streaming_stats import TDigest
+
+
+async def open_connection(args):
+    if args.unix_socket:
+        return await asyncio.open_unix_connection(args.unix_socket)
+    return await asyncio.open_connection(args.host, args.port)
+
+
+async def run_stream(args, audio, sample_rate, start_delay, latencies):
+    """
+    執行一個串流：送出音框並接收增強後的音訊
+
+    Returns:
+        dict: 送出/收到的取樣點數、延遲統計與輸出 (--output 時保留)
+    """
+    await asyncio.sleep(start_delay)
+    reader, writer = await open_connection(args)
+    writer.write(pack_message(MSG_HELLO, json.dumps({'sample_rate': sample_rate, 'format': args.format}).encode()))
+    kind, payload = await read_message(reader)
+    if kind != MSG_HELLO:
+        raise RuntimeError(f"服務端拒絕連線: {payload.decode(errors='replace')}")
+    info = json.loads(payload)
+    overlap = info['overlap']
+    total = len(audio)
+    frame = max(1, int(sample_rate * args.frame_ms / 1000))
+    sent_positions = []  # 已送出樣本數 (遞增)
+    sent_times = []
+
+    async def sender():
+        start = time.perf_counter()
+        for offset in range(0, total, frame):
+            if not args.no_realtime:
+                delay = start + offset / sample_rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            chunk = audio[offset:offset + frame]
+            writer.write(pack_message(MSG_AUDIO, encode_pcm(chunk, args.format)))
+            await writer.drain()
+            sent_positions.append(offset + len(chunk))
+            sent_times.append(time.perf_counter())
+        writer.write(pack_message(MSG_END))
+        await writer.drain()
+
+    def send_time(position):
+        """送出 position 個樣本時的時間"""
+        index = bisect.bisect_left(sent_positions, position)
+        return sent_times[min(index, len(sent_times) - 1)]
+
+    outputs = []
+    received = 0
+    send_task = asyncio.create_task(sender())
+    try:
+        while True:
+            kind, payload = await read_message(reader)
+            now = time.perf_counter()
+            if kind == MSG_AUDIO:
+                segment = decode_pcm(payload, args.format)
+                received += len(segment)
+                # 輸出到 received 為止需要輸入到 received + overlap (下一段的淡入區)，最後一段則需要整個輸入
+                latencies.add((now - send_time(min(total, received + overlap))) * 1e3)
+                if args.output:
+                    outputs.append(segment)
+            elif kind == MSG_END or kind is None:
+                break
+            elif kind == MSG_ERROR:
+                raise RuntimeError(f"服務端錯誤: {payload.decode(errors='replace')}")
+        await send_task
+    finally:
+        send_task.cancel()
+        writer.close()
+    return {'sent': total, 'received': received, 'info': info,
+            'output': np.concatenate(outputs) if outputs else None}
+
+
+async def fetch_metrics(args):
+    reader, writer = await open_connection(args)
+    writer.write(pack_message(MSG_METRICS))
+    await writer.drain()
+    kind, payload = await read_message(reader)
+    writer.close()
+    return json.loads(payload) if kind == MSG_METRICS else None
+
+
+def load_audio(args, sample_rate):
+    """讀取輸入 WAV (多聲道取平均) 或產生合成測試音訊"""
+    if args.input:
+        audio, file_rate = sf.read(args.input, dtype='float32', always_2d=True)
+        if file_rate != sample_rate:
+            raise ValueError(f"輸入取樣率 {file_rate} Hz 與 --sample-rate {sample_rate} Hz 不符")
+        audio = audio.mean(axis=1)
+        if args.duration:
+            audio = audio[:int(args.duration * sample_rate)]
+        return np.ascontiguousarray(audio)
+    rng = np.random.default_rng(args.seed)
+    t = np.arange(int((args.duration or 10.0) * sample_rate)) / sample_rate
+    speech_like = 0.3 * np.sin(2 * np.pi * 220 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    return (speech_like + 0.05 * rng.standard_normal(t.shape)).astype(np.float32)
+
+
+async def run(args):
+    audio = load_audio(args, args.sample_rate)
+    latencies = TDigest()
+    print(f"🚀 {args.streams} 個串流 × {len(audio) / args.sample_rate:.1f} 秒 "
+          f"({'盡快送出' if args.no_realtime else '即時速度'}，音框 {args.frame_ms:.0f} ms)")
+
+    start = time.perf_counter()
+    # 錯開各串流的開始時間，避免所有片段永遠同時湊滿
+    tasks = [run_stream(args, audio, args.sample_rate, i * args.stagger_ms / 1000.0, latencies)
+             for i in range(args.streams)]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    results = [r for r in results if not isinstance(r, Exception)]
+    for failure in failures[:3]:
+        print(f"❌ 串流失敗: {failure}")
+
+    print("\n" + "=" * 80)
+    print("📊 負載測試結果")
+    print("=" * 80)
+    if results:
+        info = results[0]['info']
+        received = sum(r['received'] for r in results)
+        incomplete = sum(1 for r in results if r['received'] != r['sent'])
+        print(f"串流:       {len(results)} 完成 / {len(failures)} 失敗"
+              + (f" / {incomplete} 長度不符" if incomplete else ""))
+        print(f"片段:       {info['chunk_size']} 取樣點 (演算法延遲 {info['chunk_size'] / args.sample_rate * 1e3:.0f} ms)")
+        print(f"吞吐量:     {received / args.sample_rate / elapsed:.2f}x 即時 ({elapsed:.1f} 秒)")
+        if len(latencies):
+            p50, p95, p99 = latencies.quantile([0.5, 0.95, 0.99]).tolist()
+            print(f"處理延遲:   p50 {p50:.1f} / p95 {p95:.1f} / p99 {p99:.1f} / 最大 {latencies.max:.1f} ms")
+
+    metrics = await fetch_metrics(args)
+    if metrics:
+        print("\n🖥️  服務端統計:")
+        print(json.dumps(metrics, ensure_ascii=False, indent=2))
+
+    if args.output and results and results[0]['output'] is not None:
+        sf.write(args.output, results[0]['output'], args.sample_rate)
+        print(f"\n💾 已輸出第一個串流的增強音訊: {args.output}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='串流增強服務負載產生器')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='服務位址 (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP 連接埠 (default: 8765)')
+    parser.add_argument('--unix-socket', type=str, default=None, help='改用 Unix socket 路徑')
+    parser.add_argument('--input', type=str, default=None, help='輸入 WAV (default: 合成測試音訊)')
+    parser.add_argument('--output', type=str, default=None, help='儲存第一個串流的增強輸出')
+    parser.add_argument('--sample-rate', type=int, default=16000, help='取樣率 (default: 16000)')
+    parser.add_argument('--duration', type=float, default=None,
+                       help='每個串流的音訊長度秒數，指定 --input 時為截斷長度 (default: 合成音訊 10 秒 / 整個輸入檔)')
+    parser.add_argument('--streams', type=int, default=8, help='並行串流數 (default: 8)')
+    parser.add_argument('--frame-ms', type=float, default=20.0, help='每個音框長度 ms (default: 20)')
+    parser.add_argument('--stagger-ms', type=float, default=37.0,
+                       help='相鄰串流的開始時間差 ms (default: 37)')
+    parser.add_argument('--format', type=str, default='float32', choices=['float32', 'int16'],
+                       help='PCM 格式 (default: float32)')
+    parser.add_argument('--no-realtime', action='store_true', help='不依即時速度送出，測量最大吞吐量')
+    parser.add_argument('--seed', type=int, default=0, help='合成音訊的隨機種子 (default: 0)')
+
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+低延遲串流語音增強服務
+以 asyncio 在本機 TCP 或 Unix socket 上接收多個串流的 PCM 音框，每個串流保留自己的
+重疊片段狀態 (與 chunked_inference 相同的 hop 對齊片段與 sin²/cos² 交叉淡化)；
+各串流湊滿一個片段後放入共用佇列，微批次器把不同串流的片段合併成一次 TFGridNetV2 前向傳播，
+最久的片段等待超過 --max-wait-ms 或湊滿 --max-batch 時立即執行
+
+延遲 = 片段長度帶來的演算法延遲 (chunk_size / 取樣率) + 排隊/批次等待 + 前向傳播時間；
+服務端統計吞吐量、批次大小、前向傳播與片段延遲的 p50/p95/p99，
+可由客戶端以 M 訊息查詢，也會依 --metrics-interval 定期輸出
+
+通訊協定 (每個連線一個串流)，訊息 = 1 byte 類型 + 4 bytes 長度 (little-endian) + 內容:
+    H  客戶端 → 服務端: JSON {"sample_rate": 16000, "format": "float32" | "int16"}
+       服務端 → 客戶端: JSON {"sample_rate", "chunk_size", "stride", "overlap", "format"}
+    A  PCM 音訊 (單聲道，little-endian，格式依 H 指定)，雙向
+    E  串流結束；客戶端送出後服務端處理剩餘音訊，送完輸出後回覆 E 並關閉
+    M  查詢服務統計，服務端回覆 M + JSON
+    X  錯誤，服務端回覆 JSON {"error": ...} 後關閉
+
+使用方式:
+    python scripts/enhancement_server.py --checkpoint ckpt.pth --port 8765
+    python scripts/enhancement_server.py --checkpoint ckpt.pth --unix-socket /tmp/enhance.sock --chunk-size 4096 --max-wait-ms 10
+    python scripts/enhancement_client.py --port 8765 --streams 16                # 負載測試
+"""
+
+import os
+import json
+import time
+import struct
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from streaming_stats import RunningStats, TDigest
+
+MSG_HELLO = b'H'
+MSG_AUDIO = b'A'
+MSG_END = b'E'
+MSG_METRICS = b'M'
+MSG_ERROR = b'X'
+HEADER = struct.Struct('<cI')
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+PCM_FORMATS = {'float32': np.dtype('<f4'), 'int16': np.dtype('<i2')}
+
+
+def pack_message(kind, payload=b''):
+    """組成一則訊息 (類型 + 長度 + 內容)"""
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+async def read_message(reader):
+    """
+    讀取一則訊息
+
+    Returns:
+        (kind, payload)；連線已關閉時回傳 (None, b'')
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None, b''
+    kind, length = HEADER.unpack(header)
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"訊息過大 ({length} bytes)")
+    payload = await reader.readexactly(length) if length else b''
+    return kind, payload
+
+
+def decode_pcm(payload, pcm_format):
+    """PCM bytes → float32 波形"""
+    audio = np.frombuffer(payload, dtype=PCM_FORMATS[pcm_format])
+    if pcm_format == 'int16':
+        return audio.astype(np.float32) / 32768.0
+    return audio.astype(np.float32)
+
+
+def encode_pcm(audio, pcm_format):
+    """float32 波形 → PCM bytes"""
+    if pcm_format == 'int16':
+        return (np.clip(audio, -1.0, 1.0 - 1.0 / 32768) * 32768.0).astype('<i2').tobytes()
+    return np.asarray(audio, dtype='<f4').tobytes()
+
+
+class StreamState:
+    """
+    單一串流的重疊片段狀態
+
+    收到的音訊累積在緩衝區，每湊滿一個片段 (chunk_size) 就產生一個工作並前進 stride；
+    片段輸出的前 overlap 點與上一段淡出的尾端相加，stride 之後的尾端淡出後留給下一段
+    """
+
+    def __init__(self, stream_id, chunk_size, stride, fade_in, fade_out):
+        self.stream_id = stream_id
+        self.chunk_size = chunk_size
+        self.stride = stride
+        self.overlap = chunk_size - stride
+        self.fade_in = fade_in
+        self.fade_out = fade_out
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0  # buffer[0] 的絕對位置
+        self.next_start = 0    # 下一個片段的起點
+        self.received = 0
+        self.emitted = 0
+        self.carry = None
+        self.num_windows = 0
+        self.done = asyncio.Event()
+
+    def append(self, audio):
+        """加入音訊，回傳已可處理的片段 [(片段, is_last)]"""
+        self.buffer = np.concatenate([self.buffer, audio])
+        self.received += len(audio)
+        windows = []
+        while self.received >= self.next_start + self.chunk_size:
+            offset = self.next_start - self.buffer_start
+            windows.append((self.buffer[offset:offset + self.chunk_size].copy(), False))
+            self.next_start += self.stride
+            self.num_windows += 1
+        # 丟掉之後不會再用到的樣本
+        drop = self.next_start - self.buffer_start
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.buffer_start = self.next_start
+        return windows
+
+    def finish(self):
+        """串流結束：剩餘音訊補零成最後一個片段 (沒有剩餘時回傳 None)"""
+        if self.received <= self.next_start and self.num_windows > 0:
+            return None
+        if self.received == 0:
+            return None
+        window = np.zeros(self.chunk_size, dtype=np.float32)
+        rest = self.buffer[self.next_start - self.buffer_start:]
+        window[:len(rest)] = rest
+        self.num_windows += 1
+        return window, True
+
+    def finalize(self, output, is_last):
+        """將片段輸出交叉淡化後回傳可送出的音訊 (最後一段裁切到收到的長度)"""
+        head = output[:self.overlap]
+        if self.carry is not None:
+            head = head * self.fade_in + self.carry
+        if is_last:
+            segment = np.concatenate([head, output[self.overlap:]])
+            segment = segment[:max(0, self.received - self.emitted)]
+        else:
+            segment = np.concatenate([head, output[self.overlap:self.stride]])
+            self.carry = output[self.stride:] * self.fade_out
+        self.emitted += len(segment)
+        return segment
+
+
+class MicroBatcher:
+    """
+    跨串流微批次推理
+
+    Args:
+        engine: ChunkedInference (提供 forward_chunks、片段長度與交叉淡化窗)
+        max_batch: 每次前向傳播的片段上限
+        max_wait_ms: 最久的片段最多等待多久就執行 (延遲上限)
+        max_queue: 佇列上限，滿了時接收端暫停讀取 (經 TCP 背壓到客戶端)
+    """
+
+    def __init__(self, engine, max_batch=16, max_wait_ms=20.0, max_queue=256):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='forward')
+        self.sample_rate = None
+        self.start_time = time.perf_counter()
+        self.active_streams = 0
+        self.total_streams = 0
+        self.num_batches = 0
+        self.num_windows = 0
+        self.audio_in = 0
+        self.audio_out = 0
+        self.batch_sizes = RunningStats()
+        self.forward_ms = TDigest()
+        self.forward_total = 0.0
+        self.latency_ms = TDigest()
+        self.queue_wait_ms = TDigest()
+
+    async def submit(self, state, window, is_last):
+        await self.queue.put((state, window, is_last, time.perf_counter()))
+
+    def _forward(self, windows):
+        import torch
+
+        with torch.inference_mode():
+            return self.engine.forward_chunks([torch.from_numpy(w) for w in windows]).numpy()
+
+    async def run(self, send):
+        """
+        批次迴圈
+
+        Args:
+            send: send(state, segment, is_last) 將輸出送回對應串流
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = batch[0][3] + self.max_wait
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            for job in batch:
+                self.queue_wait_ms.add((started - job[3]) * 1e3)
+            try:
+                outputs = await loop.run_in_executor(self.executor, self._forward, [job[1] for job in batch])
+            except Exception as e:
+                print(f"⚠️  前向傳播失敗 ({len(batch)} 個片段): {e}")
+                for state, _, is_last, _ in batch:
+                    send(state, None, is_last, error=str(e))
+                continue
+            finished = time.perf_counter()
+            self.forward_ms.add((finished - started) * 1e3)
+            self.forward_total += finished - started
+            self.num_batches += 1
+            self.num_windows += len(batch)
+            self.batch_sizes.update([len(batch)])
+            for (state, _, is_last, ready), output in zip(batch, outputs):
+                segment = state.finalize(output, is_last)
+                self.audio_out += len(segment)
+                self.latency_ms.add((time.perf_counter() - ready) * 1e3)
+                send(state, segment, is_last)
+
+    def metrics(self):
+        """服務統計 (時間單位 ms，音訊單位秒)"""
+        uptime = time.perf_counter() - self.start_time
+        sr = self.sample_rate or 1
+
+        def quantiles(digest):
+            if len(digest) == 0:
+                return None
+            p50, p95, p99 = digest.quantile([0.5, 0.95, 0.99]).tolist()
+            return {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3), 'max': round(digest.max, 3)}
+
+        audio_out_s = self.audio_out / sr
+        return {
+            'uptime_s': round(uptime, 3),
+            'active_streams': self.active_streams,
+            'total_streams': self.total_streams,
+            'batches': self.num_batches,
+            'windows': self.num_windows,
+            'mean_batch_size': round(self.batch_sizes.mean, 3),
+            'audio_in_s': round(self.audio_in / sr, 3),
+            'audio_out_s': round(audio_out_s, 3),
+            'throughput_x_realtime': round(audio_out_s / uptime, 3) if uptime > 0 else None,
+            'forward_busy': round(self.forward_total / uptime, 4) if uptime > 0 else None,
+            'forward_ms': quantiles(self.forward_ms),
+            'queue_wait_ms': quantiles(self.queue_wait_ms),
+            'window_latency_ms': quantiles(self.latency_ms),
+            'algorithmic_latency_ms': round(self.engine.chunk_size / sr * 1e3, 3),
+        }
+
+
+class EnhancementServer:
+    """
+    串流增強服務 (每個連線一個串流)
+
+    Args:
+        engine: ChunkedInference
+        sample_rate: 模型取樣率，客戶端必須使用相同取樣率
+        max_batch, max_wait_ms, max_queue: 傳給 MicroBatcher
+    """
+
+    def __init__(self, engine, sample_rate, max_batch=16, max_wait_ms=20.0, max_queue=256):
+        self.engine = engine
+        self.sample_rate = sample_rate
+        self.batcher = MicroBatcher(engine, max_batch, max_wait_ms, max_queue)
+        self.batcher.sample_rate = sample_rate
+        self._writers = {}
+        self._next_id = 0
+
+    def _send(self, state, segment, is_last, error=None):
+        writer, pcm_format = self._writers.get(state.stream_id, (None, None))
+        if writer is None or writer.is_closing():
+            state.done.set()
+            return
+        if error is not None:
+            writer.write(pack_message(MSG_ERROR, json.dumps({'error': error}).encode()))
+            state.done.set()
+            return
+        if len(segment):
+            writer.write(pack_message(MSG_AUDIO, encode_pcm(segment, pcm_format)))
+        if is_last:
+            state.done.set()
+
+    async def handle(self, reader, writer):
+        stream_id = self._next_id
+        self._next_id += 1
+        state = None
+        try:
+            kind, payload = await read_message(reader)
+            if kind is None:
+                return
+            if kind == MSG_METRICS:
+                writer.write(pack_message(MSG_METRICS, json.dumps(self.batcher.metrics()).encode()))
+                await writer.drain()
+                return
+            if kind != MSG_HELLO:
+                raise ValueError("第一則訊息必須是 H (hello) 或 M (metrics)")
+            hello = json.loads(payload or b'{}')
+            pcm_format = hello.get('format', 'float32')
+            if pcm_format not in PCM_FORMATS:
+                raise ValueError(f"不支援的 PCM 格式: {pcm_format}")
+            if hello.get('sample_rate', self.sample_rate) != self.sample_rate:
+                raise ValueError(f"取樣率 {hello.get('sample_rate')} Hz 與模型 {self.sample_rate} Hz 不符")
+
+            engine = self.engine
+            state = StreamState(stream_id, engine.chunk_size, engine.stride,
+                                engine.fade_in.numpy(), engine.fade_out.numpy())
+            self._writers[stream_id] = (writer, pcm_format)
+            self.batcher.active_streams += 1
+            self.batcher.total_streams += 1
+            writer.write(pack_message(MSG_HELLO, json.dumps({
+                'sample_rate': self.sample_rate, 'chunk_size': engine.chunk_size,
+                'stride': engine.stride, 'overlap': engine.overlap, 'format': pcm_format,
+            }).encode()))
+
+            while True:
+                kind, payload = await read_message(reader)
+                if kind == MSG_AUDIO:
+                    audio = decode_pcm(payload, pcm_format)
+                    self.batcher.audio_in += len(audio)
+                    for window, is_last in state.append(audio):
+                        await self.batcher.submit(state, window, is_last)
+                    await writer.drain()
+                elif kind == MSG_METRICS:
+                    writer.write(pack_message(MSG_METRICS, json.dumps(self.batcher.metrics()).encode()))
+                elif kind == MSG_END or kind is None:
+                    final = state.finish()
+                    if final is not None:
+                        await self.batcher.submit(state, *final)
+                    else:
+                        state.done.set()
+                    if kind is None:
+                        return  # 客戶端已斷線，不再回送
+                    await state.done.wait()
+                    writer.write(pack_message(MSG_END))
+                    await writer.drain()
+                    return
+                else:
+                    raise ValueError(f"未知的訊息類型: {kind!r}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            try:
+                writer.write(pack_message(MSG_ERROR, json.dumps({'error': str(e)}).encode()))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            if state is not None:
+                self.batcher.active_streams -= 1
+                self._writers.pop(stream_id, None)
+            writer.close()
+
+    async def report_metrics(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            m = self.batcher.metrics()
+            latency = m['window_latency_ms'] or {}
+            print(f"📈 串流 {m['active_streams']} (累計 {m['total_streams']}) | "
+                  f"批次 {m['batches']} (平均 {m['mean_batch_size']:.1f}) | "
+                  f"{m['throughput_x_realtime']:.2f}x 即時 | 前向忙碌 {m['forward_busy']:.0%} | "
+                  f"片段延遲 p50 {latency.get('p50', 0):.1f} / p95 {latency.get('p95', 0):.1f} ms", flush=True)
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_socket=None, metrics_interval=10.0):
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            server = await asyncio.start_unix_server(self.handle, path=unix_socket)
+            address = unix_socket
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            address = f"{host}:{port}"
+        print(f"🎧 串流增強服務: {address} (片段 {self.engine.chunk_size} / 步長 {self.engine.stride} 取樣點, "
+              f"max_batch={self.batcher.max_batch}, max_wait={self.batcher.max_wait * 1e3:.0f} ms)", flush=True)
+        tasks = [asyncio.create_task(self.batcher.run(self._send))]
+        if metrics_interval and metrics_interval > 0:
+            tasks.append(asyncio.create_task(self.report_metrics(metrics_interval)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.batcher.executor.shutdown(wait=False)
+            print("\n📊 服務統計:")
+            print(json.dumps(self.batcher.metrics(), ensure_ascii=False, indent=2))
+
+
+def main():
+    import yaml
+    import torch
+    from chunked_inference import ChunkedInference
+    from evaluate_best_model import build_model, load_checkpoint_weights
+    from inference_bundle import is_bundle, load_bundle
+
+    parser = argparse.ArgumentParser(description='低延遲串流語音增強服務 (跨串流微批次)')
+    parser.add_argument('--checkpoint', type=str, required=True, help='檢查點或推理權重包路徑')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='監聽位址 (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='TCP 連接埠 (default: 8765)')
+    parser.add_argument('--unix-socket', type=str, default=None, help='改用 Unix socket 路徑')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                       help='片段長度，決定演算法延遲 (default: 配置中的 max_audio_length)')
+    parser.add_argument('--overlap', type=int, default=None,
+                       help='片段重疊長度 (default: max(n_fft, chunk_size // 4))')
+    parser.add_argument('--max-batch', type=int, default=16, help='每次前向傳播的片段上限 (default: 16)')
+    parser.add_argument('--max-wait-ms', type=float, default=20.0,
+                       help='片段湊批次的最長等待時間 ms (default: 20)')
+    parser.add_argument('--max-queue', type=int, default=256, help='待處理片段上限 (default: 256)')
+    parser.add_argument('--threads', type=int, default=None, help='torch 執行緒數 (default: torch 預設)')
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                       help='定期輸出統計的間隔秒數，0 表示不輸出 (default: 10)')
+
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    if is_bundle(args.checkpoint):
+        model, _ = load_bundle(args.checkpoint, device)
+    else:
+        model = build_model(config, device)
+        load_checkpoint_weights(model, args.checkpoint, device)
+    model.eval()
+
+    kwargs = {'overlap': args.overlap, 'batch_size': args.max_batch}
+    if args.chunk_size is not None:
+        kwargs['chunk_size'] = args.chunk_size
+    engine = ChunkedInference.from_config(model, config, **kwargs)
+    sample_rate = config['data']['preprocessing']['target_sample_rate']
+    server = EnhancementServer(engine, sample_rate, args.max_batch, args.max_wait_ms, args.max_queue)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_socket, args.metrics_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
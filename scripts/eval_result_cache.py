@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+內容定址的逐樣本評估結果快取
+增強後的 SI-SNR 以 (權重雜湊, 音訊內容雜湊, 評估設定雜湊) 為鍵，
+噪音音訊的基準 SI-SNR 只以音訊內容雜湊為鍵，所有檢查點共用。
+重新執行時只計算缺少的項目；中斷的評估可從停止處繼續
+
+快取為單一 SQLite 檔 (WAL 模式)，每 commit_interval 筆寫入一次交易
+
+使用方式:
+    python scripts/eval_result_cache.py --cache /workspace/experiments/eval_cache.sqlite   # 顯示快取統計
+"""
+
+import json
+import hashlib
+import sqlite3
+import argparse
+
+import numpy as np
+import torch
+
+CACHE_VERSION = 1
+
+
+def _new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def weights_hash(model):
+    """模型權重內容的雜湊 (名稱、dtype、形狀與數值)，相同權重的檢查點與推理權重包結果相同"""
+    h = _new_hash()
+    for name, tensor in sorted(model.state_dict().items()):
+        tensor = tensor.detach().cpu().contiguous()
+        h.update(f'{name}|{tensor.dtype}|{tuple(tensor.shape)}'.encode())
+        h.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    return h.hexdigest()
+
+
+def audio_hash(noisy, clean):
+    """前處理後的 noisy/clean 波形內容雜湊"""
+    h = _new_hash()
+    for audio in (noisy, clean):
+        array = np.ascontiguousarray(torch.as_tensor(audio).detach().cpu().float().numpy().reshape(-1))
+        h.update(str(array.shape[0]).encode())
+        h.update(array.tobytes())
+    return h.hexdigest()
+
+
+def settings_hash(settings):
+    """影響推理結果的評估設定 (dict) 雜湊"""
+    h = _new_hash()
+    h.update(json.dumps({'version': CACHE_VERSION, **settings}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class EvalResultCache:
+    """
+    逐樣本評估結果快取
+
+    Args:
+        path: SQLite 檔案路徑
+        commit_interval: 每寫入幾筆提交一次 (中斷時最多遺失這麼多筆)
+    """
+
+    def __init__(self, path, commit_interval=64):
+        self.path = str(path)
+        self.commit_interval = commit_interval
+        self._uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS baseline ('
+            'audio_hash TEXT PRIMARY KEY, si_snr_noisy REAL NOT NULL)')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS enhanced ('
+            'weights_hash TEXT NOT NULL, audio_hash TEXT NOT NULL, settings_hash TEXT NOT NULL, '
+            'uttid TEXT, si_snr_enhanced REAL NOT NULL, '
+            'PRIMARY KEY (weights_hash, audio_hash, settings_hash))')
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_baseline(self, audio_key):
+        row = self.conn.execute('SELECT si_snr_noisy FROM baseline WHERE audio_hash = ?',
+                                (audio_key,)).fetchone()
+        return None if row is None else row[0]
+
+    def get_enhanced(self, weights_key, audio_key, settings_key):
+        row = self.conn.execute(
+            'SELECT si_snr_enhanced FROM enhanced '
+            'WHERE weights_hash = ? AND audio_hash = ? AND settings_hash = ?',
+            (weights_key, audio_key, settings_key)).fetchone()
+        return None if row is None else row[0]
+
+    def lookup(self, weights_key, audio_key, settings_key):
+        """
+        查詢一個樣本的結果，並記錄命中/未命中次數
+
+        Returns:
+            (si_snr_noisy, si_snr_enhanced) 或 None (任一缺少時)
+        """
+        noisy = self.get_baseline(audio_key)
+        enhanced = self.get_enhanced(weights_key, audio_key, settings_key) if noisy is not None else None
+        if enhanced is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return noisy, enhanced
+
+    def put(self, weights_key, audio_key, settings_key, si_snr_noisy, si_snr_enhanced, uttid=None):
+        self.conn.execute('INSERT OR REPLACE INTO baseline VALUES (?, ?)',
+                          (audio_key, float(si_snr_noisy)))
+        self.conn.execute('INSERT OR REPLACE INTO enhanced VALUES (?, ?, ?, ?, ?)',
+                          (weights_key, audio_key, settings_key, uttid, float(si_snr_enhanced)))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.flush()
+
+    def flush(self):
+        if self._uncommitted:
+            self.conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+    def stats(self):
+        """快取內容統計：基準筆數、增強結果筆數、不同權重數"""
+        baseline = self.conn.execute('SELECT COUNT(*) FROM baseline').fetchone()[0]
+        enhanced, num_weights = self.conn.execute(
+            'SELECT COUNT(*), COUNT(DISTINCT weights_hash) FROM enhanced').fetchone()
+        return {'baseline': baseline, 'enhanced': enhanced, 'weights': num_weights}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='評估結果快取統計')
+    parser.add_argument('--cache', type=str, required=True, help='快取檔路徑')
+
+    args = parser.parse_args()
+
+    with EvalResultCache(args.cache) as cache:
+        stats = cache.stats()
+        print("=" * 80)
+        print(f"評估結果快取: {args.cache}")
+        print("=" * 80)
+        print(f"  基準 SI-SNR (依音訊):   {stats['baseline']}")
+        print(f"  增強結果:               {stats['enhanced']}")
+        print(f"  不同權重數:             {stats['weights']}")
+        for weights_key, count, mean in cache.conn.execute(
+                'SELECT weights_hash, COUNT(*), AVG(si_snr_enhanced) FROM enhanced GROUP BY weights_hash'):
+            print(f"    {weights_key[:16]}  {count:>8} 個樣本  平均增強 SI-SNR {mean:>7.2f} dB")
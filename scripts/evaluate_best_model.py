@@ -14,62 +14,28 @@ from pathlib import Path
 import soundfile as sf
 import librosa
 import csv
+import argparse
 from datetime import datetime
 
 # 添加代碼路徑
 sys.path.insert(0, '/workspace/TFG-Transfer-Package/code')
 
 from memory_optimized_tfgridnet import TFGridNetV2, AudioDataset
+from batched_inference import iter_length_buckets, pad_batch, unpad_batch
+from si_snr_metrics import batch_si_snr, SISNRAccumulator
+from audio_writer import AudioWriterPool
+from chunked_inference import ChunkedInference
+from inference_bundle import is_bundle, load_bundle
+from eval_result_cache import EvalResultCache, weights_hash, audio_hash, settings_hash
+from result_store import write_result_store, columns_from_rows, run_metadata, update_metadata_json
+from stage_profiler import StageProfiler
 
-def calculate_si_snr(estimate, reference, eps=1e-8):
-    """計算 SI-SNR (Scale-Invariant Signal-to-Noise Ratio)"""
-    # 確保是一維張量
-    if estimate.dim() > 1:
-        estimate = estimate.squeeze()
-    if reference.dim() > 1:
-        reference = reference.squeeze()
-    
-    # 移除均值
-    estimate = estimate - estimate.mean()
-    reference = reference - reference.mean()
-    
-    # 計算投影
-    reference_energy = torch.sum(reference ** 2) + eps
-    projection = torch.sum(estimate * reference) * reference / reference_energy
-    
-    # 計算噪音
-    noise = estimate - projection
-    
-    # 計算 SI-SNR
-    si_snr = 10 * torch.log10(
-        torch.sum(projection ** 2) / (torch.sum(noise ** 2) + eps) + eps
-    )
-    
-    return si_snr.item()
+VALID_CLEAN_SCP = '/workspace/TFG-Transfer-Package/data/scp/valid_clean_relative.scp'
+VALID_NOISY_SCP = '/workspace/TFG-Transfer-Package/data/scp/valid_noisy_relative.scp'
+RESULT_FIELDNAMES = ['uttid', 'si_snr_noisy', 'si_snr_enhanced', 'improvement']
 
-def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx5090.yaml', 
-                   save_audio=True, output_dir='/workspace/experiments/inference_results'):
-    """評估模型性能並保存增強音訊"""
-    import yaml
-    
-    print("=" * 80)
-    print("🎯 TF-GridNetV2 模型評估")
-    print("=" * 80)
-    print(f"檢查點: {checkpoint_path}")
-    print(f"配置文件: {config_path}")
-    if save_audio:
-        print(f"輸出目錄: {output_dir}")
-    print()
-    
-    # 載入配置
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
-    
-    # 設置設備
-    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
-    print(f"使用設備: {device}")
-    
-    # 創建模型
+def build_model(config, device, gradient_checkpointing=False):
+    """依訓練配置創建 TF-GridNetV2 模型 (評估用，預設不啟用 gradient checkpointing)"""
     model_config = config['model']['architecture']
     stft_config = config['model']['stft']
     
@@ -87,12 +53,14 @@ def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx
         activation=model_config['activation'],
         eps=model_config['eps'],
         use_attn=model_config.get('use_multi_head_attention', True),
-        use_gradient_checkpointing=False,  # 評估時不需要
+        use_gradient_checkpointing=gradient_checkpointing,  # 評估預設關閉；memory_planner/benchmark_rtf 量測訓練設定時開啟
         use_cross_attn=model_config.get('use_cross_attention', False),
         use_se=model_config.get('use_squeeze_excitation', False),
     ).to(device)
-    
-    # 載入檢查點
+    return model
+
+def load_checkpoint_weights(model, checkpoint_path, device):
+    """載入檢查點權重 (處理 base_model 前綴) 並切換到 eval 模式，回傳檢查點內容"""
     print(f"\n📦 載入檢查點...")
     checkpoint = torch.load(checkpoint_path, map_location=device)
     
@@ -121,21 +89,128 @@ def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx
         print(f"   驗證損失: {checkpoint['valid_loss']:.4f}")
     if 'loss' in checkpoint:
         print(f"   損失: {checkpoint['loss']:.4f}")
+    return checkpoint
+
+def write_results_csv(csv_path, audio_results):
+    """寫出逐樣本結果 CSV (uttid, si_snr_noisy, si_snr_enhanced, improvement)"""
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(audio_results)
+
+def write_highlights(highlights_path, audio_results):
+    """寫出改善最多/最少的各 5 個關鍵樣本"""
+    sorted_results = sorted(audio_results, key=lambda x: x['improvement'])
+    best_samples = sorted_results[-5:]  # 最佳5個
+    worst_samples = sorted_results[:5]  # 最差5個
+    
+    with open(highlights_path, 'w') as f:
+        f.write("=" * 80 + "\n")
+        f.write("關鍵樣本標註\n")
+        f.write("=" * 80 + "\n\n")
+        
+        f.write("🏆 最佳改善 Top 5:\n")
+        for r in reversed(best_samples):
+            f.write(f"  {r['uttid']}: {r['improvement']:+.2f} dB "
+                   f"({r['si_snr_noisy']:.2f} → {r['si_snr_enhanced']:.2f})\n")
+        
+        f.write("\n⚠️ 最差改善 Top 5:\n")
+        for r in worst_samples:
+            f.write(f"  {r['uttid']}: {r['improvement']:+.2f} dB "
+                   f"({r['si_snr_noisy']:.2f} → {r['si_snr_enhanced']:.2f})\n")
+
+def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx5090.yaml', 
+                   save_audio=True, output_dir='/workspace/experiments/inference_results',
+                   batch_size=1, max_batch_samples=None, length_tolerance=0,
+                   writer_workers=4, writer_max_pending_mb=256, write_envelopes=False,
+                   chunk_size=None, chunk_overlap=None, chunk_compare=False,
+                   result_cache=None,
+                   clean_scp_path=VALID_CLEAN_SCP, noisy_scp_path=VALID_NOISY_SCP,
+                   profile=False, profile_trace=False, torch_profile=False):
+    """
+    評估模型性能並保存增強音訊
+    
+    Args:
+        checkpoint_path: 檢查點路徑 (訓練檢查點或 inference_bundle 匯出的 .bundle.pt)
+        config_path: 訓練配置檔路徑
+        save_audio: 是否保存增強/噪音/乾淨音訊與 CSV 報告
+        output_dir: 推理結果輸出根目錄
+        batch_size: 批次大小；大於 1 時啟用長度分桶批次推理
+        max_batch_samples: 每批補零後總取樣點數上限，指定時同樣啟用批次推理
+        length_tolerance: 同一批次內允許的長度差 (取樣點)；
+                          0 表示只合併等長樣本，結果與逐樣本推理一致
+        writer_workers: 背景寫入音訊的執行緒數，0 表示同步寫入
+        writer_max_pending_mb: 尚未寫入磁碟的音訊資料上限 (MB)，超過時推理會等待
+        write_envelopes: 為長音訊預先寫出波形包絡 (<uttid>.envelope.npz)；
+                         預設不寫，visualize_samples 需要時才建立
+        chunk_size: 指定時以重疊片段串流推理 (0 表示使用配置中的 max_audio_length)，
+                    記憶體與音訊長度無關；與批次模式互斥
+        chunk_overlap: 片段重疊長度 (None 表示 max(n_fft, chunk_size // 4))
+        chunk_compare: 分段模式下同時執行整段推理，回報兩者輸出差異
+        result_cache: 逐樣本結果快取檔路徑 (eval_result_cache)；指定時已有結果的樣本不再推理，
+                      輸出目錄改為以權重雜湊命名 (不加時間戳記)，中斷後重新執行會接續
+        clean_scp_path, noisy_scp_path: 驗證集 scp (sharded_evaluation 以此指定各分片)
+        profile: 記錄各階段耗時 (load/decode/resample/forward/si_snr/submit/write)，
+                 摘要寫入 metadata.json 的 performance 欄位
+        profile_trace: 同時匯出 Chrome/Perfetto trace (結果目錄的 profile_trace.json)
+        torch_profile: 同時啟用 torch.profiler (profile_trace.torch.json)
+    
+    Returns:
+        (results, si_snr_improvements): results['per_utterance'] 為逐樣本結果列表
+    """
+    import yaml
+    
+    print("=" * 80)
+    print("🎯 TF-GridNetV2 模型評估")
+    print("=" * 80)
+    print(f"檢查點: {checkpoint_path}")
+    print(f"配置文件: {config_path}")
+    if save_audio:
+        print(f"輸出目錄: {output_dir}")
+    print()
+    
+    # 載入配置
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    
+    # 設置設備
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    print(f"使用設備: {device}")
+    
+    # 創建模型並載入檢查點
+    if is_bundle(checkpoint_path):
+        # 推理權重包：模型設定內嵌於檔案，權重以 mmap 載入
+        model, bundle = load_bundle(checkpoint_path, device)
+        checkpoint = bundle['source']
+    else:
+        model = build_model(config, device)
+        checkpoint = load_checkpoint_weights(model, checkpoint_path, device)
     
     # 創建驗證集
     print(f"\n📊 載入驗證集...")
     valid_dataset = AudioDataset(
-        clean_scp_path='/workspace/TFG-Transfer-Package/data/scp/valid_clean_relative.scp',
-        noisy_scp_path='/workspace/TFG-Transfer-Package/data/scp/valid_noisy_relative.scp',
+        clean_scp_path=clean_scp_path,
+        noisy_scp_path=noisy_scp_path,
         config=config
     )
     print(f"   驗證樣本數: {len(valid_dataset)}")
     
+    # 結果快取
+    cache = None
+    if result_cache is not None:
+        cache = EvalResultCache(result_cache)
+        model_key = weights_hash(model)
+        print(f"\n🗃️  結果快取: {result_cache} (權重 {model_key[:12]})")
+    
     # 創建輸出目錄
     if save_audio:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         epoch_num = checkpoint['epoch']
-        result_dir = Path(output_dir) / f'epoch_{epoch_num}_best_{timestamp}'
+        if cache is not None:
+            # 固定目錄名稱，重新執行時沿用已寫出的音訊
+            result_dir = Path(output_dir) / f'epoch_{epoch_num}_{model_key[:12]}'
+        else:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            result_dir = Path(output_dir) / f'epoch_{epoch_num}_best_{timestamp}'
         enhanced_dir = result_dir / 'enhanced'
         noisy_dir = result_dir / 'noisy'
         clean_dir = result_dir / 'clean'
@@ -146,71 +221,226 @@ def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx
         print(f"\n💾 音訊輸出目錄:")
         print(f"   {result_dir}")
         print()
+        
+        # 背景寫入池，讓磁碟寫入與推理重疊
+        audio_writer = AudioWriterPool(num_workers=writer_workers,
+                                       max_pending_bytes=writer_max_pending_mb * 1024 * 1024,
+                                       write_envelopes=write_envelopes)
+    
+    # 階段計時 (停用時 stage() 不做事)
+    trace_path = None
+    if profile and profile_trace:
+        if save_audio:
+            trace_path = str(result_dir / 'profile_trace.json')
+        else:
+            print("⚠️  未保存結果 (--no-save-audio)，不匯出 trace")
+    profiler = StageProfiler(
+        enabled=profile, trace_path=trace_path, torch_profile=profile and torch_profile,
+        synchronize=torch.cuda.synchronize if device.type == 'cuda' else None)
     
     # 評估
-    print(f"\n🔬 開始評估...")
-    si_snr_improvements = []
-    si_snr_noisy_list = []
-    si_snr_enhanced_list = []
-    audio_results = []  # 保存每個檔案的詳細結果
+    sample_rate = config['data']['preprocessing']['target_sample_rate']
+    batched = batch_size > 1 or max_batch_samples is not None
+    chunker = None
+    chunk_diffs = []  # 分段推理與整段推理的差異 SNR
+    if chunk_size is not None:
+        if batched:
+            raise ValueError("分段推理 (chunk_size) 與批次模式 (batch_size/max_batch_samples) 不能同時使用")
+        chunk_kwargs = {'overlap': chunk_overlap}
+        if chunk_size > 0:
+            chunk_kwargs['chunk_size'] = chunk_size
+        chunker = ChunkedInference.from_config(model, config, **chunk_kwargs)
+        print(f"\n🔪 分段推理: 片段 {chunker.chunk_size} / 重疊 {chunker.overlap} 取樣點")
+    if batched:
+        print(f"\n🔬 開始評估 (批次模式: batch_size={batch_size}, "
+              f"max_batch_samples={max_batch_samples}, length_tolerance={length_tolerance})...")
+    else:
+        print(f"\n🔬 開始評估...")
+    accumulator = SISNRAccumulator(device)  # 在設備上累積 SI-SNR，只在報告時同步
+    uttids = {}  # 以資料集索引保存 uttid，確保輸出順序與逐樣本推理相同
+    baselines = {}  # 資料集索引 → 快取中的噪音基準 SI-SNR (增強結果未命中時使用)
+    next_report = 50
+    if cache is not None:
+        settings_key = settings_hash({
+            'chunk_size': chunker.chunk_size if chunker is not None else None,
+            'chunk_overlap': chunker.overlap if chunker is not None else None,
+            'length_tolerance': length_tolerance if batched else 0,
+        })
+        audio_keys = {}  # 資料集索引 → 音訊內容雜湊
     
-    with torch.no_grad():
-        for i in range(len(valid_dataset)):
-            try:
-                noisy_audio, clean_audio, uttid = valid_dataset[i]
-                
-                # 移動到設備
-                noisy_audio = noisy_audio.unsqueeze(0).to(device)
-                clean_audio = clean_audio.to(device)
-                
-                # 模型推理
-                enhanced_audio = model(noisy_audio)
-                enhanced_audio = enhanced_audio.squeeze(0).squeeze(0)
-                
-                # 確保長度一致
-                min_len = min(enhanced_audio.shape[0], clean_audio.shape[0])
-                enhanced_audio = enhanced_audio[:min_len]
-                clean_audio = clean_audio[:min_len]
-                noisy_for_calc = noisy_audio.squeeze(0).squeeze(0)[:min_len]
-                
-                # 計算 SI-SNR
-                si_snr_noisy = calculate_si_snr(noisy_for_calc, clean_audio)
-                si_snr_enhanced = calculate_si_snr(enhanced_audio, clean_audio)
-                improvement = si_snr_enhanced - si_snr_noisy
-                
-                si_snr_noisy_list.append(si_snr_noisy)
-                si_snr_enhanced_list.append(si_snr_enhanced)
-                si_snr_improvements.append(improvement)
-                
-                # 保存音訊檔案
-                if save_audio:
+    def score_and_save(indices, batch_uttids, noisy_list, clean_list, enhanced_list):
+        """一次計算整批樣本的 SI-SNR 並保存音訊"""
+        nonlocal next_report
+        
+        # 確保長度一致
+        min_lens = [min(e.shape[0], c.shape[0]) for e, c in zip(enhanced_list, clean_list)]
+        enhanced_list = [e[:n] for e, n in zip(enhanced_list, min_lens)]
+        clean_list = [c[:n] for c, n in zip(clean_list, min_lens)]
+        noisy_list = [x[:n] for x, n in zip(noisy_list, min_lens)]
+        
+        # 計算 SI-SNR (整批一次，不與主機同步)
+        with profiler.stage('si_snr'):
+            clean_batch, lengths = pad_batch(clean_list)
+            enhanced_batch, _ = pad_batch(enhanced_list)
+            si_snr_enhanced = batch_si_snr(enhanced_batch, clean_batch, lengths)
+            cached_noisy = [baselines.pop(i, None) for i in indices]
+            missing = [k for k, value in enumerate(cached_noisy) if value is None]
+            if len(missing) == len(indices):
+                noisy_batch, _ = pad_batch(noisy_list)
+                si_snr_noisy = batch_si_snr(noisy_batch, clean_batch, lengths)
+            else:
+                # 噪音基準只與音訊內容有關，快取中已有的不再計算
+                si_snr_noisy = torch.tensor([0.0 if value is None else value for value in cached_noisy],
+                                            dtype=si_snr_enhanced.dtype, device=si_snr_enhanced.device)
+                if missing:
+                    noisy_batch, missing_lengths = pad_batch([noisy_list[k] for k in missing])
+                    missing_clean, _ = pad_batch([clean_list[k] for k in missing])
+                    si_snr_noisy[missing] = batch_si_snr(noisy_batch, missing_clean, missing_lengths)
+            accumulator.update(si_snr_noisy, si_snr_enhanced, indices)
+        uttids.update(zip(indices, batch_uttids))
+        if cache is not None:
+            for i, uttid, noisy_value, enhanced_value in zip(
+                    indices, batch_uttids, si_snr_noisy.tolist(), si_snr_enhanced.tolist()):
+                cache.put(model_key, audio_keys.pop(i), settings_key, noisy_value, enhanced_value, uttid)
+        
+        # 保存音訊檔案 (submit 含 GPU→CPU 複製；實際寫檔在背景執行緒，計入 write 階段)
+        if save_audio:
+            with profiler.stage('submit'):
+                for uttid, noisy_for_calc, clean_audio, enhanced_audio in zip(
+                        batch_uttids, noisy_list, clean_list, enhanced_list):
                     # 保存增強後的音訊
                     enhanced_path = enhanced_dir / f"{uttid}.wav"
-                    sf.write(enhanced_path, enhanced_audio.cpu().numpy(), config['data']['preprocessing']['target_sample_rate'])
-                    
+                    audio_writer.submit(enhanced_path, enhanced_audio.cpu().numpy(), sample_rate)
+                
                     # 保存噪音音訊（參考）
                     noisy_path = noisy_dir / f"{uttid}.wav"
-                    sf.write(noisy_path, noisy_for_calc.cpu().numpy(), config['data']['preprocessing']['target_sample_rate'])
-                    
+                    audio_writer.submit(noisy_path, noisy_for_calc.cpu().numpy(), sample_rate)
+                
                     # 保存乾淨音訊（ground truth）
                     clean_path = clean_dir / f"{uttid}.wav"
-                    sf.write(clean_path, clean_audio.cpu().numpy(), config['data']['preprocessing']['target_sample_rate'])
-                
-                # 記錄結果
-                audio_results.append({
-                    'uttid': uttid,
-                    'si_snr_noisy': si_snr_noisy,
-                    'si_snr_enhanced': si_snr_enhanced,
-                    'improvement': improvement
-                })
-                
-                if (i + 1) % 50 == 0:
-                    print(f"   處理進度: {i+1}/{len(valid_dataset)} "
-                          f"(平均改善: {np.mean(si_snr_improvements):.2f} dB)")
-                
+                    audio_writer.submit(clean_path, clean_audio.cpu().numpy(), sample_rate)
+        
+        while len(accumulator) >= next_report:
+            print(f"   處理進度: {len(accumulator)}/{len(valid_dataset)} "
+                  f"(平均改善: {accumulator.report()['improvement_mean']:.2f} dB)")
+            next_report += 50
+    
+    def evaluate_single(i, noisy_audio, clean_audio, uttid):
+        """逐樣本推理"""
+        # 移動到設備
+        noisy_audio = noisy_audio.unsqueeze(0).to(device)
+        clean_audio = clean_audio.to(device)
+        
+        # 模型推理
+        with profiler.stage('forward'):
+            if chunker is not None:
+                enhanced_audio = chunker.enhance(noisy_audio).to(device)
+            else:
+                enhanced_audio = model(noisy_audio)
+                enhanced_audio = enhanced_audio.squeeze(0).squeeze(0)
+        if chunker is not None and chunk_compare:
+            chunk_diffs.append(chunker.compare_with_full(noisy_audio)['snr_db'])
+        
+        score_and_save([i], [uttid], [noisy_audio.squeeze(0).squeeze(0)], [clean_audio], [enhanced_audio])
+    
+    def iter_valid_samples():
+        """逐一載入驗證樣本，載入失敗時跳過"""
+        for i in range(len(valid_dataset)):
+            try:
+                with profiler.stage('load'):
+                    noisy_audio, clean_audio, uttid = valid_dataset[i]
             except Exception as e:
-                print(f"   ⚠️  樣本 {i} ({uttid if 'uttid' in locals() else 'unknown'}) 評估失敗: {e}")
+                print(f"   ⚠️  樣本 {i} (unknown) 評估失敗: {e}")
                 continue
+            if cache is not None:
+                # 快取中已有結果 (且需要的音訊檔已寫出) 時直接使用，不再推理
+                audio_keys[i] = audio_hash(noisy_audio, clean_audio)
+                cached = cache.lookup(model_key, audio_keys[i], settings_key)
+                if cached is not None and (not save_audio or all(
+                        (d / f"{uttid}.wav").exists() for d in (enhanced_dir, noisy_dir, clean_dir))):
+                    del audio_keys[i]
+                    accumulator.update(torch.tensor([cached[0]]), torch.tensor([cached[1]]), [i])
+                    uttids[i] = uttid
+                    continue
+                baseline = cached[0] if cached is not None else cache.get_baseline(audio_keys[i])
+                if baseline is not None:
+                    baselines[i] = baseline
+            yield i, noisy_audio, clean_audio, uttid
+    
+    # 資料集內的解碼/重取樣與背景寫檔無法直接加 hook，暫時替換模組函式計時 (finally 中還原)
+    instrumented = profiler.instrument_all([
+        (sf, 'read', 'decode'),
+        (librosa, 'resample', 'resample'),
+        (sf, 'write', 'write'),
+    ])
+    try:
+        with torch.no_grad():
+            if not batched:
+                for i, noisy_audio, clean_audio, uttid in iter_valid_samples():
+                    try:
+                        evaluate_single(i, noisy_audio, clean_audio, uttid)
+                    except Exception as e:
+                        print(f"   ⚠️  樣本 {i} ({uttid}) 評估失敗: {e}")
+                        continue
+            else:
+                buckets = iter_length_buckets(
+                    iter_valid_samples(),
+                    batch_size=batch_size if batch_size > 1 else None,
+                    max_batch_samples=max_batch_samples,
+                    length_tolerance=length_tolerance,
+                )
+                for bucket in buckets:
+                    try:
+                        # 補零成批次，一次前向傳播後依原始長度切回
+                        with profiler.stage('forward'):
+                            noisy_batch, lengths = pad_batch([item[1] for item in bucket], device=device)
+                            enhanced_list = unpad_batch(model(noisy_batch), lengths)
+                    except Exception as e:
+                        # 整批失敗時退回逐樣本推理，避免一個樣本拖累整個 bucket
+                        print(f"   ⚠️  批次 ({len(bucket)} 個樣本) 推理失敗，改為逐樣本推理: {e}")
+                        for i, noisy_audio, clean_audio, uttid in bucket:
+                            try:
+                                evaluate_single(i, noisy_audio, clean_audio, uttid)
+                            except Exception as e:
+                                print(f"   ⚠️  樣本 {i} ({uttid}) 評估失敗: {e}")
+                        continue
+                
+                    try:
+                        score_and_save([item[0] for item in bucket], [item[3] for item in bucket],
+                                       [noisy_batch[b, :lengths[b]] for b in range(len(bucket))],
+                                       [item[2].to(device) for item in bucket], enhanced_list)
+                    except Exception as e:
+                        print(f"   ⚠️  批次 ({len(bucket)} 個樣本) 評估失敗: {e}")
+    
+    finally:
+        if cache is not None:
+            print(f"   🗃️  快取命中 {cache.hits} / 重新計算 {cache.misses} 個樣本")
+            cache.close()
+        # 等待背景寫入完成並回報錯誤
+        if save_audio:
+            write_errors = audio_writer.close()
+            if write_errors:
+                print(f"   ⚠️  {len(write_errors)} 個音訊檔案寫入失敗:")
+                for path, e in write_errors[:10]:
+                    print(f"      {path}: {e}")
+        instrumented.close()
+    
+    profiler.close()
+    
+    # 只在評估結束時取回每個樣本的分數
+    scores = accumulator.per_utterance()
+    audio_results = []  # 保存每個檔案的詳細結果
+    for i in sorted(scores):
+        si_snr_noisy, si_snr_enhanced, improvement = scores[i]
+        audio_results.append({
+            'uttid': uttids[i],
+            'si_snr_noisy': si_snr_noisy,
+            'si_snr_enhanced': si_snr_enhanced,
+            'improvement': improvement
+        })
+    si_snr_noisy_list = [r['si_snr_noisy'] for r in audio_results]
+    si_snr_enhanced_list = [r['si_snr_enhanced'] for r in audio_results]
+    si_snr_improvements = [r['improvement'] for r in audio_results]
     
     # 計算統計
     print("\n" + "=" * 80)
@@ -218,76 +448,150 @@ def evaluate_model(checkpoint_path, config_path='/workspace/configs/training_rtx
     print("=" * 80)
     print(f"成功評估樣本數: {len(si_snr_improvements)}/{len(valid_dataset)}")
     print()
-    print("SI-SNR 統計:")
-    print(f"  噪音音訊平均 SI-SNR:    {np.mean(si_snr_noisy_list):>8.2f} dB")
-    print(f"  增強音訊平均 SI-SNR:    {np.mean(si_snr_enhanced_list):>8.2f} dB")
-    print(f"  平均改善:               {np.mean(si_snr_improvements):>8.2f} dB")
-    print(f"  標準差:                 {np.std(si_snr_improvements):>8.2f} dB")
-    print(f"  最佳改善:               {np.max(si_snr_improvements):>8.2f} dB")
-    print(f"  最差改善:               {np.min(si_snr_improvements):>8.2f} dB")
+    if audio_results:
+        print("SI-SNR 統計:")
+        print(f"  噪音音訊平均 SI-SNR:    {np.mean(si_snr_noisy_list):>8.2f} dB")
+        print(f"  增強音訊平均 SI-SNR:    {np.mean(si_snr_enhanced_list):>8.2f} dB")
+        print(f"  平均改善:               {np.mean(si_snr_improvements):>8.2f} dB")
+        print(f"  標準差:                 {np.std(si_snr_improvements):>8.2f} dB")
+        print(f"  最佳改善:               {np.max(si_snr_improvements):>8.2f} dB")
+        print(f"  最差改善:               {np.min(si_snr_improvements):>8.2f} dB")
+    else:
+        print("⚠️  沒有成功評估的樣本，略過 SI-SNR 統計")
+    if chunk_diffs:
+        print()
+        print("分段推理 vs 整段推理 (差異 SNR，越高越接近):")
+        print(f"  平均:                   {np.mean(chunk_diffs):>8.2f} dB")
+        print(f"  最低:                   {np.min(chunk_diffs):>8.2f} dB")
     print("=" * 80)
     
     # 保存結果到 CSV
     if save_audio and len(audio_results) > 0:
         csv_path = result_dir / 'evaluation_results.csv'
-        with open(csv_path, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=['uttid', 'si_snr_noisy', 'si_snr_enhanced', 'improvement'])
-            writer.writeheader()
-            writer.writerows(audio_results)
+        write_results_csv(csv_path, audio_results)
         
         print(f"\n💾 結果已保存:")
         print(f"   CSV 報告: {csv_path}")
         print(f"   增強音訊: {enhanced_dir} ({len(list(enhanced_dir.glob('*.wav')))} 個檔案)")
         
         # 標註關鍵樣本
-        if len(audio_results) > 0:
-            sorted_results = sorted(audio_results, key=lambda x: x['improvement'])
-            best_samples = sorted_results[-5:]  # 最佳5個
-            worst_samples = sorted_results[:5]  # 最差5個
-            
-            highlights_path = result_dir / 'highlights.txt'
-            with open(highlights_path, 'w') as f:
-                f.write("=" * 80 + "\n")
-                f.write("關鍵樣本標註\n")
-                f.write("=" * 80 + "\n\n")
-                
-                f.write("🏆 最佳改善 Top 5:\n")
-                for r in reversed(best_samples):
-                    f.write(f"  {r['uttid']}: {r['improvement']:+.2f} dB "
-                           f"({r['si_snr_noisy']:.2f} → {r['si_snr_enhanced']:.2f})\n")
-                
-                f.write("\n⚠️ 最差改善 Top 5:\n")
-                for r in worst_samples:
-                    f.write(f"  {r['uttid']}: {r['improvement']:+.2f} dB "
-                           f"({r['si_snr_noisy']:.2f} → {r['si_snr_enhanced']:.2f})\n")
-            
-            print(f"   關鍵樣本: {highlights_path}")
+        highlights_path = result_dir / 'highlights.txt'
+        write_highlights(highlights_path, audio_results)
+        print(f"   關鍵樣本: {highlights_path}")
     
     # 保存結果字典
     results = {
         'checkpoint': checkpoint_path,
         'epoch': checkpoint['epoch'],
         'num_samples': len(si_snr_improvements),
-        'si_snr_noisy_mean': float(np.mean(si_snr_noisy_list)),
-        'si_snr_enhanced_mean': float(np.mean(si_snr_enhanced_list)),
-        'si_snr_improvement_mean': float(np.mean(si_snr_improvements)),
-        'si_snr_improvement_std': float(np.std(si_snr_improvements)),
-        'si_snr_improvement_max': float(np.max(si_snr_improvements)),
-        'si_snr_improvement_min': float(np.min(si_snr_improvements)),
     }
+    if audio_results:
+        results.update({
+            'si_snr_noisy_mean': float(np.mean(si_snr_noisy_list)),
+            'si_snr_enhanced_mean': float(np.mean(si_snr_enhanced_list)),
+            'si_snr_improvement_mean': float(np.mean(si_snr_improvements)),
+            'si_snr_improvement_std': float(np.std(si_snr_improvements)),
+            'si_snr_improvement_max': float(np.max(si_snr_improvements)),
+            'si_snr_improvement_min': float(np.min(si_snr_improvements)),
+        })
+    else:
+        # 沒有任何成功樣本 (例如分片內所有樣本載入失敗)：回報 0 筆，統計值為 None
+        results.update({key: None for key in (
+            'si_snr_noisy_mean', 'si_snr_enhanced_mean', 'si_snr_improvement_mean',
+            'si_snr_improvement_std', 'si_snr_improvement_max', 'si_snr_improvement_min')})
+    
+    if chunk_diffs:
+        results['chunked_vs_full_snr_mean'] = float(np.mean(chunk_diffs))
+        results['chunked_vs_full_snr_min'] = float(np.min(chunk_diffs))
+    
+    if profile:
+        results['profile'] = profiler.summary()
+        print("\n⏱️  階段耗時:")
+        print(profiler.report())
+        if trace_path is not None:
+            print(f"   Trace: {trace_path} (chrome://tracing 或 ui.perfetto.dev)")
     
     if save_audio:
         results['output_dir'] = str(result_dir)
+        if profile:
+            update_metadata_json(result_dir, {'performance': results['profile']})
+        if len(audio_results) > 0:
+            # 欄式結果檔 (供 select_audio_samples / visualize_samples / compare_experiments 讀取)
+            write_result_store(result_dir, columns_from_rows(audio_results),
+                               run_metadata(checkpoint_path, checkpoint, config['model'], results))
+    results['per_utterance'] = audio_results
     
     return results, si_snr_improvements
 
 if __name__ == '__main__':
-    checkpoint_path = '/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth'
+    parser = argparse.ArgumentParser(description='評估 TF-GridNetV2 模型並保存增強音訊')
+    parser.add_argument('--checkpoint', type=str,
+                       default='/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth',
+                       help='檢查點路徑')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--output-dir', type=str, default='/workspace/experiments/inference_results',
+                       help='推理結果輸出根目錄')
+    parser.add_argument('--no-save-audio', action='store_true',
+                       help='不保存音訊與 CSV 報告')
+    parser.add_argument('--batch-size', type=int, default=1,
+                       help='批次大小，大於 1 時啟用長度分桶批次推理 (default: 1)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批補零後總取樣點數上限 (default: 不限制)')
+    parser.add_argument('--length-tolerance', type=int, default=0,
+                       help='同一批次內允許的長度差，0 表示只合併等長樣本 (default: 0)')
+    parser.add_argument('--writer-workers', type=int, default=4,
+                       help='背景寫入音訊的執行緒數，0 表示同步寫入 (default: 4)')
+    parser.add_argument('--writer-max-pending-mb', type=int, default=256,
+                       help='尚未寫入磁碟的音訊資料上限 MB (default: 256)')
+    parser.add_argument('--write-envelopes', action='store_true',
+                       help='為長音訊預先寫出波形包絡 (default: 不寫，繪圖時才建立)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                       help='以重疊片段串流推理，0 表示使用 max_audio_length (default: 整段推理)')
+    parser.add_argument('--chunk-overlap', type=int, default=None,
+                       help='片段重疊長度 (default: max(n_fft, chunk_size // 4))')
+    parser.add_argument('--chunk-compare', action='store_true',
+                       help='分段模式下同時執行整段推理並回報差異')
+    parser.add_argument('--clean-scp', type=str, default=VALID_CLEAN_SCP,
+                       help='驗證集 clean scp')
+    parser.add_argument('--noisy-scp', type=str, default=VALID_NOISY_SCP,
+                       help='驗證集 noisy scp')
+    parser.add_argument('--result-cache', type=str, default=None,
+                       help='逐樣本結果快取檔 (SQLite)，重新執行時只計算缺少的樣本')
+    parser.add_argument('--profile', action='store_true',
+                       help='記錄各階段耗時 (p50/p95/p99)，寫入 metadata.json')
+    parser.add_argument('--profile-trace', action='store_true',
+                       help='搭配 --profile 匯出 Chrome/Perfetto trace (profile_trace.json)')
+    parser.add_argument('--torch-profile', action='store_true',
+                       help='搭配 --profile 同時啟用 torch.profiler')
+    
+    args = parser.parse_args()
+    checkpoint_path = args.checkpoint
     
     if not os.path.exists(checkpoint_path):
         print(f"❌ 找不到檢查點: {checkpoint_path}")
         sys.exit(1)
     
-    results, improvements = evaluate_model(checkpoint_path)
+    results, improvements = evaluate_model(
+        checkpoint_path,
+        config_path=args.config,
+        save_audio=not args.no_save_audio,
+        output_dir=args.output_dir,
+        batch_size=args.batch_size,
+        max_batch_samples=args.max_batch_samples,
+        length_tolerance=args.length_tolerance,
+        writer_workers=args.writer_workers,
+        writer_max_pending_mb=args.writer_max_pending_mb,
+        write_envelopes=args.write_envelopes,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        chunk_compare=args.chunk_compare,
+        result_cache=args.result_cache,
+        clean_scp_path=args.clean_scp,
+        noisy_scp_path=args.noisy_scp,
+        profile=args.profile,
+        profile_trace=args.profile_trace,
+        torch_profile=args.torch_profile,
+    )
     
     print("\n✅ 評估完成！")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+推理用權重包 (inference bundle)
+訓練檢查點包含優化器與排程器狀態，評估時需要完整 torch.load、逐一改寫 base_model. 前綴、
+strict=False 載入，並從 YAML 重建模型參數。匯出步驟將其轉為只含推理所需內容的單一檔案：
+
+- state_dict: 已去除前綴、與模型完全對應 (可 strict=True 載入) 的連續 CPU 張量
+- config: 內嵌的 model 與 data.preprocessing 設定，不需原始 YAML 即可建立模型
+- source: 來源檢查點、epoch 與損失
+
+載入時使用 torch.load(mmap=True, weights_only=True)，並以 load_state_dict(assign=True)
+直接接上 mmap 的張量，不複製權重
+
+使用方式:
+    python scripts/inference_bundle.py --checkpoint ckpt.pth --config configs/training_rtx5090.yaml
+    python scripts/inference_bundle.py --checkpoint ckpt.pth --config configs/training_rtx5090.yaml --benchmark
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from pathlib import Path
+
+import torch
+
+BUNDLE_FORMAT = 'tfgridnet-inference-bundle'
+BUNDLE_VERSION = 1
+BUNDLE_SUFFIX = '.bundle.pt'
+
+
+def default_bundle_path(checkpoint_path):
+    """預設輸出路徑：檢查點旁的 <名稱>.bundle.pt"""
+    checkpoint_path = Path(checkpoint_path)
+    return checkpoint_path.with_name(checkpoint_path.stem + BUNDLE_SUFFIX)
+
+
+def is_bundle(path):
+    """依副檔名判斷是否為推理權重包"""
+    return str(path).endswith(BUNDLE_SUFFIX)
+
+
+def _loss_value(checkpoint, key):
+    value = checkpoint.get(key)
+    return float(value) if isinstance(value, (int, float)) else None
+
+
+def export_bundle(checkpoint_path, config, output_path=None):
+    """
+    由訓練檢查點匯出推理權重包
+
+    Args:
+        checkpoint_path: 訓練檢查點路徑
+        config: 訓練配置 (dict)
+        output_path: 輸出路徑 (None 使用 default_bundle_path)
+
+    Returns:
+        Path: 權重包路徑
+    """
+    from evaluate_best_model import build_model, load_checkpoint_weights
+
+    output_path = Path(output_path or default_bundle_path(checkpoint_path))
+    device = torch.device('cpu')
+    model = build_model(config, device)
+    checkpoint = load_checkpoint_weights(model, checkpoint_path, device)
+
+    bundle = {
+        'format': BUNDLE_FORMAT,
+        'version': BUNDLE_VERSION,
+        'config': {
+            'model': config['model'],
+            'data': {'preprocessing': config['data']['preprocessing']},
+        },
+        'state_dict': {key: value.detach().contiguous().clone()
+                       for key, value in model.state_dict().items()},
+        'source': {
+            'checkpoint': str(checkpoint_path),
+            'epoch': checkpoint.get('epoch'),
+            'train_loss': _loss_value(checkpoint, 'train_loss'),
+            'valid_loss': _loss_value(checkpoint, 'valid_loss'),
+        },
+    }
+
+    # 先寫暫存檔再改名，避免中斷時留下不完整的檔案
+    tmp_path = output_path.with_name(f'{output_path.name}.tmp-{os.getpid()}')
+    torch.save(bundle, tmp_path)
+    os.replace(tmp_path, output_path)
+
+    size_mb = output_path.stat().st_size / 1024 / 1024
+    source_mb = Path(checkpoint_path).stat().st_size / 1024 / 1024
+    print(f"✅ 已匯出推理權重包: {output_path}")
+    print(f"   {len(bundle['state_dict'])} 個張量, {size_mb:.1f} MB (原檢查點 {source_mb:.1f} MB)")
+    return output_path
+
+
+def load_bundle(bundle_path, device='cpu', mmap=True):
+    """
+    載入推理權重包並建立 eval 模式的模型
+
+    Args:
+        bundle_path: 權重包路徑
+        device: 推理設備
+        mmap: 以 memory-mapping 讀取張量 (CPU 推理時權重直接對應到檔案頁面)
+
+    Returns:
+        (model, bundle): bundle['source'] 含 epoch 與損失，bundle['config'] 可供 build_model 使用
+    """
+    from evaluate_best_model import build_model
+
+    bundle = torch.load(bundle_path, map_location='cpu', mmap=mmap, weights_only=True)
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"不是推理權重包: {bundle_path}")
+    if bundle.get('version') != BUNDLE_VERSION:
+        raise ValueError(f"不支援的權重包版本 {bundle.get('version')}: {bundle_path}")
+
+    # assign=True 直接以讀入的 (mmap) 張量取代參數，不再複製一份權重
+    # (meta 設備建構雖可省去初始化，但第一次使用會載入 torch 的函式覆寫機制，反而更慢)
+    model = build_model(bundle['config'], torch.device('cpu'))
+    model.load_state_dict(bundle['state_dict'], strict=True, assign=True)
+
+    model = model.to(device).eval()
+    source = bundle['source']
+    print(f"✅ 模型已載入 (推理權重包, Epoch {source.get('epoch')})")
+    return model, bundle
+
+
+def load_bundle_weights(model, bundle_path):
+    """
+    將權重包的權重載入既有的模型 (多個檢查點共用同一個模型實例時使用)
+
+    Returns:
+        dict: 權重包的 source 資訊 (epoch、損失)
+    """
+    bundle = torch.load(bundle_path, map_location='cpu', mmap=True, weights_only=True)
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"不是推理權重包: {bundle_path}")
+    model.load_state_dict(bundle['state_dict'], strict=True)
+    model.eval()
+    return bundle['source']
+
+
+def _peak_rss_mb(reset=False):
+    """目前行程的峰值常駐記憶體 (MB)；Linux 上 reset=True 會先把峰值重設為目前值"""
+    if reset:
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        except OSError:
+            pass
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _cold_start_worker(mode, checkpoint_path, config_path, bundle_path, device):
+    """在獨立行程中量測一種載入方式的冷啟動時間與記憶體 (結果以 JSON 印在最後一行)"""
+    import yaml
+    import io
+    import contextlib
+    import evaluate_best_model  # 模組匯入不計入載入時間
+
+    rss_before = _peak_rss_mb(reset=True)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == 'checkpoint':
+            with open(config_path, 'r') as f:
+                config = yaml.safe_load(f)
+            model = evaluate_best_model.build_model(config, torch.device(device))
+            evaluate_best_model.load_checkpoint_weights(model, checkpoint_path, torch.device(device))
+        else:
+            model, _ = load_bundle(bundle_path, device)
+    elapsed = time.perf_counter() - start
+    rss_after = _peak_rss_mb()
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': rss_after - rss_before}))
+
+
+def compare_cold_start(checkpoint_path, config_path, bundle_path, device='cpu', repeats=3):
+    """
+    比較完整檢查點與推理權重包的冷啟動時間與峰值記憶體增量
+
+    每次量測都在新的 Python 行程中進行 (檔案可能已在系統頁面快取中)
+    """
+    results = {}
+    for mode in ('checkpoint', 'bundle'):
+        runs = []
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', mode,
+                 '--checkpoint', str(checkpoint_path), '--config', str(config_path),
+                 '--output', str(bundle_path), '--device', device],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            runs.append(json.loads(output))
+        results[mode] = {
+            'seconds': min(r['seconds'] for r in runs),
+            'peak_rss_mb': min(r['peak_rss_mb'] for r in runs),
+        }
+
+    print("=" * 80)
+    print(f"冷啟動比較 (device={device}, {repeats} 次取最佳)")
+    print("=" * 80)
+    print(f"{'載入方式':<20} {'時間 (ms)':>12} {'峰值記憶體增量 (MB)':>22}")
+    print("-" * 80)
+    labels = {'checkpoint': '完整檢查點', 'bundle': '推理權重包 (mmap)'}
+    for mode, result in results.items():
+        print(f"{labels[mode]:<20} {result['seconds'] * 1000:>12.1f} {result['peak_rss_mb']:>22.1f}")
+    speedup = results['checkpoint']['seconds'] / max(results['bundle']['seconds'], 1e-9)
+    print(f"\n⚡ 加速比: {speedup:.2f}x")
+    return results
+
+
+if __name__ == '__main__':
+    import yaml
+
+    parser = argparse.ArgumentParser(description='匯出推理權重包並比較冷啟動時間')
+    parser.add_argument('--checkpoint', type=str,
+                       default='/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth',
+                       help='訓練檢查點路徑')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--output', type=str, default=None,
+                       help='權重包輸出路徑 (default: 檢查點旁的 .bundle.pt)')
+    parser.add_argument('--benchmark', action='store_true', help='匯出後比較兩種載入方式的冷啟動')
+    parser.add_argument('--device', type=str, default='cpu', help='冷啟動比較的設備 (default: cpu)')
+    parser.add_argument('--repeats', type=int, default=3, help='冷啟動量測次數 (default: 3)')
+    parser.add_argument('--worker', type=str, default=None, choices=['checkpoint', 'bundle'],
+                       help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        _cold_start_worker(args.worker, args.checkpoint, args.config, args.output, args.device)
+        sys.exit(0)
+
+    if not os.path.exists(args.checkpoint):
+        print(f"❌ 找不到檢查點: {args.checkpoint}")
+        sys.exit(1)
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    bundle_path = export_bundle(args.checkpoint, config, args.output)
+
+    if args.benchmark:
+        compare_cold_start(args.checkpoint, args.config, bundle_path, args.device, args.repeats)
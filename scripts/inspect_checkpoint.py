@@ -1,47 +1,390 @@
 #!/usr/bin/env python3
-"""檢查檢查點的內容"""
-import torch
+"""
+檢查檢查點的內容
+只解析 torch.save zip 檔中的 data.pkl (中繼資料與張量檔頭：名稱、形狀、dtype、位元組數)，
+不讀取任何張量資料；實驗目錄的結果記錄在 sidecar 索引 (.checkpoint_index.json)，
+檔案大小與修改時間未變的檢查點不再重新解析
+
+使用方式:
+    python scripts/inspect_checkpoint.py ckpt.pth                       # 單一檢查點詳細資訊
+    python scripts/inspect_checkpoint.py /workspace/experiments/run1    # 列出目錄中所有檢查點
+    python scripts/inspect_checkpoint.py run1 --sort valid_loss --max-valid-loss -12 --limit 10
+"""
+
+import os
 import sys
+import json
+import time
+import pickle
+import warnings
+import zipfile
+import argparse
+from pathlib import Path
+from collections import OrderedDict
+
+import torch
+
+INDEX_NAME = '.checkpoint_index.json'
+INDEX_VERSION = 1
+CHECKPOINT_SUFFIXES = ('.pth', '.pt')
+
+
+class TensorHeader:
+    """張量檔頭 (不含資料)"""
+
+    def __init__(self, dtype, shape, storage_key):
+        self.dtype = dtype
+        self.shape = tuple(shape)
+        self.storage_key = storage_key
+
+    @property
+    def numel(self):
+        n = 1
+        for dim in self.shape:
+            n *= dim
+        return n
+
+    @property
+    def nbytes(self):
+        return self.numel * _element_size(self.dtype)
+
+    def __repr__(self):
+        return f"TensorHeader({self.dtype}, {list(self.shape)})"
+
+
+class _StorageHeader:
+    def __init__(self, key, dtype):
+        self.key = key
+        self.dtype = dtype
+
+
+_ELEMENT_SIZES = {}
+
+
+def _element_size(dtype):
+    if dtype not in _ELEMENT_SIZES:
+        _ELEMENT_SIZES[dtype] = torch.empty((), dtype=dtype).element_size()
+    return _ELEMENT_SIZES[dtype]
+
+
+def _rebuild_tensor_header(storage, storage_offset, size, stride, *args):
+    return TensorHeader(storage.dtype, size, storage.key)
+
+
+def _rebuild_parameter(data, *args):
+    return data
+
+
+_SAFE_BUILTINS = {'set': set, 'frozenset': frozenset, 'complex': complex, 'slice': slice}
+
+
+class _HeaderUnpickler(pickle.Unpickler):
+    """
+    把張量重建函式換成只記錄檔頭的版本，storage 以 persistent id 取代而不讀取
+
+    與 torch.load(weights_only=True) 相同只允許白名單中的全域物件 (dtype、storage 類別、
+    torch.Size/device、OrderedDict)，其餘一律拒絕，掃描不受信任的檔案也不會執行任意程式碼
+    """
+
+    def find_class(self, module, name):
+        if module == 'torch._utils':
+            if name in ('_rebuild_tensor_v2', '_rebuild_tensor'):
+                return _rebuild_tensor_header
+            if name in ('_rebuild_parameter', '_rebuild_parameter_with_state'):
+                return _rebuild_parameter
+        elif module == 'collections' and name == 'OrderedDict':
+            return OrderedDict
+        elif module == 'builtins' and name in _SAFE_BUILTINS:
+            return _SAFE_BUILTINS[name]
+        elif module == 'torch':
+            value = getattr(torch, name, None)
+            if isinstance(value, torch.dtype) or value in (torch.Size, torch.device):
+                return value
+            if name.endswith('Storage') and isinstance(value, type):
+                return value
+        raise pickle.UnpicklingError(f"檢查點包含不允許的全域物件: {module}.{name}")
+
+    def persistent_load(self, pid):
+        # ('storage', storage_type, key, location, numel)
+        storage_type, key = pid[1], pid[2]
+        if isinstance(storage_type, torch.dtype):
+            dtype = storage_type
+        else:
+            # 舊式 TypedStorage 類別 (如 torch.FloatStorage) 存取 dtype 會發出棄用警告
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                dtype = storage_type.dtype
+        return _StorageHeader(key, dtype)
+
+
+def read_checkpoint_headers(checkpoint_path):
+    """
+    讀取檢查點結構而不載入張量資料
+
+    Returns:
+        (obj, storage_bytes): obj 為檢查點內容 (張量以 TensorHeader 表示)，
+                              storage_bytes 為 storage key → 實際位元組數
+    """
+    with zipfile.ZipFile(checkpoint_path) as archive:
+        names = archive.namelist()
+        pkl_name = next(n for n in names if n.endswith('/data.pkl') or n == 'data.pkl')
+        prefix = pkl_name[:-len('data.pkl')]
+        storage_bytes = {
+            info.filename[len(prefix) + len('data/'):]: info.file_size
+            for info in archive.infolist() if info.filename.startswith(prefix + 'data/')
+        }
+        with archive.open(pkl_name) as f:
+            obj = _HeaderUnpickler(f).load()
+    return obj, storage_bytes
+
+
+def _iter_tensors(obj, prefix=''):
+    """走訪巢狀結構中的張量檔頭，產生 (名稱, TensorHeader)"""
+    if isinstance(obj, TensorHeader):
+        yield prefix, obj
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            yield from _iter_tensors(value, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(obj, (list, tuple)):
+        for k, value in enumerate(obj):
+            yield from _iter_tensors(value, f'{prefix}.{k}' if prefix else str(k))
+
+
+def _scalar(value):
+    if isinstance(value, (int, float, str)) or value is None:
+        return value
+    if isinstance(value, TensorHeader):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def load_checkpoint_headers(checkpoint_path):
+    """
+    read_checkpoint_headers 的包裝：舊版 (非 zip) 格式無法只讀檔頭時退回完整載入 (weights_only)
+    """
+    try:
+        return read_checkpoint_headers(checkpoint_path)
+    except (zipfile.BadZipFile, StopIteration):
+        obj = torch.load(checkpoint_path, map_location='cpu', weights_only=True)
+        return _tensors_to_headers(obj), {}
+
+
+def summarize_checkpoint(checkpoint_path, headers=None):
+    """
+    產生檢查點摘要 (可 JSON 序列化)：頂層鍵值、epoch/損失、
+    model_state_dict 的張量數、參數量、位元組數與特定模組的鍵值數
+
+    Args:
+        headers: 已讀取的 (obj, storage_bytes)，None 時自行讀取
+    """
+    obj, storage_bytes = headers or load_checkpoint_headers(checkpoint_path)
+
+    summary = {'keys': list(obj.keys()) if isinstance(obj, dict) else []}
+    for key in ('epoch', 'train_loss', 'valid_loss', 'loss'):
+        if isinstance(obj, dict) and key in obj:
+            summary[key] = _scalar(obj[key])
+
+    sections = {}
+    for name in summary['keys']:
+        tensors = list(_iter_tensors(obj[name]))
+        if tensors:
+            sections[name] = {
+                'num_tensors': len(tensors),
+                'bytes': sum(t.nbytes for _, t in tensors),
+            }
+    summary['sections'] = sections
+
+    state_dict = obj.get('model_state_dict', {}) if isinstance(obj, dict) else {}
+    model_tensors = list(_iter_tensors(state_dict))
+    summary['model'] = {
+        'num_tensors': len(model_tensors),
+        'num_params': sum(t.numel for _, t in model_tensors),
+        'bytes': sum(t.nbytes for _, t in model_tensors),
+        'dtypes': sorted({str(t.dtype).replace('torch.', '') for _, t in model_tensors}),
+        'cross_attention': sum('cross_attention' in k for k, _ in model_tensors),
+        'se_block': sum('se_block' in k for k, _ in model_tensors),
+        'base_model': sum(k.startswith('base_model.') for k, _ in model_tensors),
+    }
+    summary['storage_bytes'] = sum(storage_bytes.values())
+    return summary
+
+
+def _tensors_to_headers(obj):
+    if isinstance(obj, torch.Tensor):
+        return TensorHeader(obj.dtype, obj.shape, None)
+    if isinstance(obj, dict):
+        return {k: _tensors_to_headers(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_tensors_to_headers(v) for v in obj)
+    return obj
+
+
+def index_directory(directory, use_index=True):
+    """
+    摘要目錄中的所有檢查點，並更新 sidecar 索引
+
+    Returns:
+        list: (檔名, 摘要) 依檔名排序
+    """
+    directory = Path(directory)
+    index_path = directory / INDEX_NAME
+    index = {}
+    if use_index and index_path.exists():
+        try:
+            with open(index_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                index = data['entries']
+        except (OSError, ValueError, KeyError):
+            index = {}
+
+    results, changed = [], False
+    names = sorted(p.name for p in directory.iterdir()
+                   if p.suffix in CHECKPOINT_SUFFIXES and p.is_file())
+    for name in names:
+        stat = (directory / name).stat()
+        signature = [stat.st_size, stat.st_mtime_ns]
+        entry = index.get(name)
+        if entry is None or entry['signature'] != signature:
+            try:
+                entry = {'signature': signature, 'summary': summarize_checkpoint(directory / name)}
+            except Exception as e:
+                entry = {'signature': signature, 'summary': {'error': str(e)}}
+            index[name] = entry
+            changed = True
+        results.append((name, entry['summary']))
+
+    # 移除已刪除檔案的記錄
+    for name in set(index) - set(names):
+        del index[name]
+        changed = True
+
+    if use_index and changed:
+        tmp_path = index_path.with_name(f'{INDEX_NAME}.tmp-{os.getpid()}')
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'entries': index}, f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"⚠️  無法寫入索引 {index_path}: {e}")
+    return results
+
+
+def print_checkpoint(checkpoint_path, num_keys=20):
+    """印出單一檢查點的詳細資訊"""
+    headers = load_checkpoint_headers(checkpoint_path)
+    obj = headers[0]
+    summary = summarize_checkpoint(checkpoint_path, headers)
+
+    print("=" * 80)
+    print("檢查點內容分析")
+    print("=" * 80)
+
+    print("\n📦 檢查點鍵值:")
+    for key in summary['keys']:
+        section = summary['sections'].get(key)
+        extra = f"  ({section['num_tensors']} 個張量, {section['bytes'] / 1024 / 1024:.1f} MB)" if section else ""
+        print(f"  - {key}{extra}")
+
+    print("\n📊 基本信息:")
+    if 'epoch' in summary:
+        print(f"  Epoch: {summary['epoch']}")
+    for key, label in (('train_loss', 'Train Loss'), ('valid_loss', 'Valid Loss')):
+        if isinstance(summary.get(key), float):
+            print(f"  {label}: {summary[key]:.4f}")
+
+    model = summary['model']
+    tensors = list(_iter_tensors(obj.get('model_state_dict', {})))
+    print(f"\n🔑 模型參數鍵值 (前 {num_keys} 個):")
+    for key, header in tensors[:num_keys]:
+        dtype = str(header.dtype).replace('torch.', '')
+        print(f"  - {key:<60} {dtype:<9} {list(header.shape)}")
+
+    print(f"\n總共 {model['num_tensors']} 個參數 ({model['num_params']:,} 個數值, "
+          f"{model['bytes'] / 1024 / 1024:.1f} MB)")
+
+    print(f"\n✅ Cross Attention 參數: {model['cross_attention']}")
+    print(f"✅ SE Block 參數: {model['se_block']}")
+
+    base_model_keys = [k for k, _ in tensors if k.startswith('base_model.')]
+    print(f"\n🔍 base_model 前綴參數: {len(base_model_keys)}")
+    if base_model_keys:
+        print("  前5個:")
+        for key in base_model_keys[:5]:
+            print(f"    - {key}")
 
-checkpoint_path = '/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth'
 
-print("=" * 80)
-print("檢查點內容分析")
-print("=" * 80)
+def _format_loss(value):
+    return f"{value:.4f}" if isinstance(value, float) else "-"
 
-checkpoint = torch.load(checkpoint_path, map_location='cpu')
 
-print("\n📦 檢查點鍵值:")
-for key in checkpoint.keys():
-    print(f"  - {key}")
+def print_directory(directory, sort_key='name', min_epoch=None, max_valid_loss=None, limit=None,
+                    use_index=True):
+    """列出目錄中的檢查點 (可依 epoch/損失過濾與排序)"""
+    start = time.perf_counter()
+    rows = index_directory(directory, use_index=use_index)
+    elapsed = time.perf_counter() - start
 
-print("\n📊 基本信息:")
-if 'epoch' in checkpoint:
-    print(f"  Epoch: {checkpoint['epoch']}")
-if 'train_loss' in checkpoint:
-    print(f"  Train Loss: {checkpoint['train_loss']:.4f}")
-if 'valid_loss' in checkpoint:
-    print(f"  Valid Loss: {checkpoint['valid_loss']:.4f}")
+    if min_epoch is not None:
+        rows = [r for r in rows if isinstance(r[1].get('epoch'), int) and r[1]['epoch'] >= min_epoch]
+    if max_valid_loss is not None:
+        rows = [r for r in rows if isinstance(r[1].get('valid_loss'), float)
+                and r[1]['valid_loss'] <= max_valid_loss]
+    if sort_key != 'name':
+        rows.sort(key=lambda r: (not isinstance(r[1].get(sort_key), (int, float)),
+                                 r[1].get(sort_key) if isinstance(r[1].get(sort_key), (int, float)) else 0))
+    if limit is not None:
+        rows = rows[:limit]
 
-print("\n🔑 模型參數鍵值 (前 20 個):")
-state_dict = checkpoint['model_state_dict']
-keys = list(state_dict.keys())[:20]
-for key in keys:
-    print(f"  - {key}")
+    print("=" * 80)
+    print(f"檢查點列表: {directory}")
+    print("=" * 80)
+    print(f"{'檔名':<40} {'Epoch':>6} {'Train':>9} {'Valid':>9} {'參數':>8} {'MB':>8}")
+    print("-" * 80)
+    for name, summary in rows:
+        if 'error' in summary:
+            print(f"{name:<40} ❌ {summary['error']}")
+            continue
+        model = summary['model']
+        print(f"{name:<40} {str(summary.get('epoch', '-')):>6} {_format_loss(summary.get('train_loss')):>9} "
+              f"{_format_loss(summary.get('valid_loss')):>9} {model['num_tensors']:>8} "
+              f"{summary['storage_bytes'] / 1024 / 1024:>8.1f}")
+    print("-" * 80)
+    print(f"共 {len(rows)} 個檢查點 ({elapsed * 1000:.1f} ms)")
 
-print(f"\n總共 {len(state_dict)} 個參數")
 
-# 檢查是否有 cross_attention 相關的鍵
-cross_attn_keys = [k for k in state_dict.keys() if 'cross_attention' in k]
-se_keys = [k for k in state_dict.keys() if 'se_block' in k]
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='檢查檢查點內容 (不載入張量資料)')
+    parser.add_argument('paths', nargs='*',
+                        default=['/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth'],
+                        help='檢查點檔案或實驗目錄')
+    parser.add_argument('--keys', type=int, default=20, help='顯示的模型參數鍵值數 (default: 20)')
+    parser.add_argument('--sort', type=str, default='name',
+                        choices=['name', 'epoch', 'train_loss', 'valid_loss'],
+                        help='目錄列表的排序欄位 (default: name)')
+    parser.add_argument('--min-epoch', type=int, default=None, help='只列出 epoch 不小於此值的檢查點')
+    parser.add_argument('--max-valid-loss', type=float, default=None, help='只列出驗證損失不大於此值的檢查點')
+    parser.add_argument('--limit', type=int, default=None, help='最多列出幾個檢查點')
+    parser.add_argument('--no-index', action='store_true', help='不讀寫 sidecar 索引')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出摘要')
 
-print(f"\n✅ Cross Attention 參數: {len(cross_attn_keys)}")
-print(f"✅ SE Block 參數: {len(se_keys)}")
+    args = parser.parse_args()
 
-# 檢查 base_model 前綴
-base_model_keys = [k for k in state_dict.keys() if k.startswith('base_model.')]
-print(f"\n🔍 base_model 前綴參數: {len(base_model_keys)}")
-if base_model_keys:
-    print("  前5個:")
-    for key in base_model_keys[:5]:
-        print(f"    - {key}")
+    for path in args.paths:
+        if not os.path.exists(path):
+            print(f"❌ 找不到: {path}")
+            sys.exit(1)
+        if os.path.isdir(path):
+            if args.json:
+                print(json.dumps(dict(index_directory(path, use_index=not args.no_index)),
+                                 indent=2, ensure_ascii=False))
+            else:
+                print_directory(path, args.sort, args.min_epoch, args.max_valid_loss, args.limit,
+                                use_index=not args.no_index)
+        elif args.json:
+            print(json.dumps(summarize_checkpoint(path), indent=2, ensure_ascii=False))
+        else:
+            print_checkpoint(path, args.keys)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+TF-GridNetV2 訓練記憶體估算與批次大小建議
+由訓練配置 (batch_size、max_audio_length、STFT、emb_dim、lstm_hidden_units、n_layers、n_heads、
+gradient checkpointing、mixed precision、attention chunk) 解析估算：
+
+- 參數、梯度與 Adam 狀態的記憶體
+- 前向保留給反向傳播的 activation (逐元件：STFT/卷積前端、頻率/時間 BiLSTM、注意力特徵、注意力分數)
+- 反向傳播時的額外工作記憶體 (checkpointing 重算的一個 block 或梯度暫存)
+
+並在 CPU 上以小尺寸實際執行模型，透過 saved_tensors_hooks 量測保留的 activation 位元組數
+來驗證估算 (--calibrate 時以量測/估算的中位數比例修正)，最後依記憶體預算建議
+最大的 batch_size 與對應的 gradient accumulation 步數
+
+估算假設 ESPnet 的 TF-GridNetV2 結構 (每個 block 為 intra-frame BiLSTM → inter-frame BiLSTM →
+全頻帶自注意力，Q/K 每頭維度為 ceil(512 / n_freqs))；模型實作不同時請以驗證結果為準
+
+使用方式:
+    python scripts/memory_planner.py --config configs/training_rtx5090.yaml                     # 估算目前配置
+    python scripts/memory_planner.py --config configs/training_rtx5090.yaml --budget-gb 32 --validate --calibrate
+    python scripts/memory_planner.py --config configs/training_rtx5090.yaml --max-audio-length 32000 --emb-dim 256
+"""
+
+import math
+import copy
+import argparse
+
+import numpy as np
+
+# ESPnet TF-GridNetV2 的 approx_qk_dim：Q/K 每頭維度 E = ceil(APPROX_QK_DIM / n_freqs)
+APPROX_QK_DIM = 512
+# BiLSTM 每個方向每步保留的內部狀態 (4 個 gate + cell + hidden，以隱藏單元數為單位)
+LSTM_STATE_FACTOR = 6
+GB = 1024 ** 3
+
+
+def model_dims(config):
+    """
+    由訓練配置取出估算需要的維度
+
+    Returns:
+        dict: D/H/n_layers/n_heads/F/E/n_fft/hop 與訓練設定 (checkpointing、mixed precision、attention chunk)
+    """
+    architecture = config['model']['architecture']
+    stft = config['model']['stft']
+    training = config.get('training', {})
+    n_freqs = stft['n_fft'] // 2 + 1
+    mixed = architecture.get('use_mixed_precision', False) or training.get('mixed_precision', {}).get('enabled', False)
+    chunk = architecture.get('attention_chunk_size') if architecture.get('use_chunked_attention', False) else None
+    return {
+        'D': architecture['emb_dim'],
+        'H': architecture['lstm_hidden_units'],
+        'n_layers': architecture['n_layers'],
+        'n_heads': architecture['n_heads'],
+        'n_srcs': architecture.get('n_srcs', 1),
+        'emb_ks': architecture.get('emb_ks', 1),
+        'emb_hs': architecture.get('emb_hs', 1),
+        'use_attn': architecture.get('use_multi_head_attention', True),
+        'attention_dropout': architecture.get('attention_dropout', 0.0),
+        'n_fft': stft['n_fft'],
+        'hop_length': stft['hop_length'],
+        'F': n_freqs,
+        'E': math.ceil(APPROX_QK_DIM / n_freqs),
+        'checkpointing': architecture.get('use_gradient_checkpointing', False),
+        'mixed_precision': bool(mixed),
+        'attention_chunk': chunk,
+    }
+
+
+def count_parameters(dims):
+    """TF-GridNetV2 的參數量 (解析式)"""
+    D, H, F, E = dims['D'], dims['H'], dims['F'], dims['E']
+    heads, ks = dims['n_heads'], dims['emb_ks']
+    stem = 2 * D * 9 + D + 2 * D  # Conv2d(2, D, 3x3) + GroupNorm
+    lstm = 2 * (4 * H * (D * ks + H) + 8 * H)  # 雙向，每方向兩組 bias
+    rnn = 2 * D + lstm + 2 * H * D * ks + D  # LayerNorm + BiLSTM + ConvTranspose1d
+    block = 2 * rnn
+    if dims['use_attn']:
+        v_dim = D // heads
+        qk = 2 * (D * E * heads + E * heads + heads + 2 * E * heads * F)
+        v = D * v_dim * heads + v_dim * heads + heads + 2 * v_dim * heads * F
+        proj = D * D + D + 1 + 2 * D * F
+        block += qk + v + proj
+    head = D * 2 * dims['n_srcs'] * 9 + 2 * dims['n_srcs']  # ConvTranspose2d(D, 2, 3x3)
+    return stem + dims['n_layers'] * block + head
+
+
+def activation_bytes(dims, batch_size, audio_length):
+    """
+    前向傳播保留給反向傳播的 activation 與反向時的工作記憶體 (bytes)
+
+    mixed precision 時卷積/LSTM/矩陣乘法的輸出以 2 bytes 計，正規化與 softmax 維持 fp32
+
+    Returns:
+        dict: stem / block / scores (單一 block) / head / saved (總保留量) / workspace (反向額外)
+    """
+    D, H, E, heads = dims['D'], dims['H'], dims['E'], dims['n_heads']
+    frames = audio_length // dims['hop_length'] + 1
+    U = batch_size * frames * dims['F']  # 每個通道的 T-F 元素數
+    cb = 2 if dims['mixed_precision'] else 4  # 計算 dtype 的位元組數
+
+    stem = U * (2 * 4 + D * cb + D * 4)  # STFT 輸出、卷積輸出、GroupNorm 輸出
+    # 頻率/時間 BiLSTM 各一組：LayerNorm 輸入與輸出、LSTM 輸出與內部狀態
+    rnn = 2 * U * (2 * D * 4 + (2 * H + 2 * LSTM_STATE_FACTOR * H) * cb)
+    block = rnn
+    scores = 0
+    if dims['use_attn']:
+        # Q/K/V/輸出投影：卷積輸出、PReLU 輸出 (計算 dtype) 與 LayerNorm 輸出 (fp32)
+        block += U * ((2 * 2 * E * heads + 2 * D + 2 * D) * cb + (2 * E * heads + 2 * D) * 4)
+        keys = min(frames, dims['attention_chunk'] or frames)
+        # 注意力分數：softmax 輸出 (fp32)，dropout 另存遮罩與輸出
+        per_score = 4 + ((1 + cb) if dims['attention_dropout'] > 0 else 0)
+        scores = batch_size * heads * frames * keys * per_score
+        block += scores
+    head = U * (D * 4 + 2 * dims['n_srcs'] * 4)
+
+    if dims['checkpointing']:
+        # 只保留每個 block 的輸入，反向時重算一個 block
+        saved = stem + dims['n_layers'] * U * D * 4 + head
+        workspace = block + 2 * U * D * 4
+    else:
+        saved = stem + dims['n_layers'] * block + head
+        workspace = 2 * U * D * 4 + scores
+    return {'stem': stem, 'block': block, 'scores': scores, 'head': head,
+            'saved': saved, 'workspace': workspace}
+
+
+def estimate_memory(dims, batch_size, audio_length, activation_scale=1.0):
+    """
+    訓練一步的峰值記憶體估算 (bytes)
+
+    Args:
+        activation_scale: activation 的修正係數 (由 validate 的量測結果得到)
+
+    Returns:
+        dict: parameters / gradients / optimizer / activations / workspace / total 與參數量
+    """
+    num_params = count_parameters(dims)
+    activations = activation_bytes(dims, batch_size, audio_length)
+    estimate = {
+        'num_params': num_params,
+        'parameters': num_params * 4,
+        'gradients': num_params * 4,  # AMP 仍以 fp32 保存權重與梯度
+        'optimizer': num_params * 8,  # Adam exp_avg + exp_avg_sq
+        'activations': activations['saved'] * activation_scale,
+        'workspace': activations['workspace'] * activation_scale,
+        'detail': activations,
+    }
+    estimate['total'] = (estimate['parameters'] + estimate['gradients'] + estimate['optimizer']
+                         + estimate['activations'] + estimate['workspace'])
+    return estimate
+
+
+def measure_saved_activations(model, batch_size, audio_length, mixed_precision=False, seed=0):
+    """
+    在 CPU 上執行一次前向傳播，量測保留給反向傳播的 tensor 位元組數 (依 storage 去重，不含參數)
+
+    Returns:
+        int: bytes
+    """
+    import torch
+
+    torch.manual_seed(seed)
+    param_storages = {p.untyped_storage().data_ptr() for p in model.parameters()}
+    storages = {}
+
+    def pack(tensor):
+        storage = tensor.untyped_storage()
+        ptr = storage.data_ptr()
+        if ptr not in param_storages:
+            storages[ptr] = max(storages.get(ptr, 0), storage.nbytes())
+        return tensor
+
+    noisy = torch.randn(batch_size, audio_length) * 0.1
+    model.train()
+    autocast = torch.autocast('cpu', dtype=torch.bfloat16, enabled=mixed_precision)
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda tensor: tensor), autocast:
+        output = model(noisy)
+        output.float().pow(2).mean()
+    return sum(storages.values())
+
+
+def validate(config, dims, shapes=((1, 4000), (2, 4000), (1, 8000), (2, 8000))):
+    """
+    以小尺寸實際執行模型，比較量測與估算的 activation 與參數量
+
+    Returns:
+        dict: rows (每個尺寸的量測/估算位元組數與比例)、scale (比例中位數，可作為 activation_scale)、
+              measured_params / predicted_params
+    """
+    import torch
+    from evaluate_best_model import build_model
+
+    model = build_model(config, torch.device('cpu'), gradient_checkpointing=dims['checkpointing'])
+    measured_params = sum(p.numel() for p in model.parameters())
+    rows = []
+    for batch_size, audio_length in shapes:
+        measured = measure_saved_activations(model, batch_size, audio_length, dims['mixed_precision'])
+        predicted = activation_bytes(dims, batch_size, audio_length)['saved']
+        rows.append({'batch_size': batch_size, 'audio_length': audio_length,
+                     'measured': measured, 'predicted': predicted,
+                     'ratio': measured / predicted if predicted else float('nan')})
+    scale = float(np.median([row['ratio'] for row in rows]))
+    return {'rows': rows, 'scale': scale,
+            'measured_params': measured_params, 'predicted_params': count_parameters(dims)}
+
+
+def recommend_batch_size(dims, audio_length, budget_bytes, target_effective_batch, activation_scale=1.0,
+                         max_batch_size=4096):
+    """
+    找出預算內最大的 batch_size，並計算達到目標有效批次所需的 accumulation 步數
+
+    accumulation 步數固定後，batch_size 取 ceil(target / steps)，避免最後一步的批次過小
+
+    Returns:
+        dict 或 None (batch_size=1 也放不下時)
+    """
+    def fits(batch_size):
+        return estimate_memory(dims, batch_size, audio_length, activation_scale)['total'] <= budget_bytes
+
+    if not fits(1):
+        return None
+    # 倍增找到上界後二分搜尋 (fits 對 batch_size 單調)
+    low, high = 1, 2
+    while high <= max_batch_size and fits(high):
+        low, high = high, high * 2
+    high = min(high, max_batch_size + 1)  # high 放不下 (或超過上限)
+    while high - low > 1:
+        mid = (low + high) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid
+    max_fit = low
+    steps = max(1, math.ceil(target_effective_batch / max_fit))
+    batch_size = min(max_fit, math.ceil(target_effective_batch / steps))
+    return {
+        'max_batch_size': max_fit,
+        'batch_size': batch_size,
+        'accumulation_steps': steps,
+        'effective_batch': batch_size * steps,
+        'max_batch_samples': batch_size * audio_length,
+        'estimate': estimate_memory(dims, batch_size, audio_length, activation_scale),
+    }
+
+
+def apply_overrides(config, args):
+    """命令列覆寫配置中的模型與訓練設定"""
+    config = copy.deepcopy(config)
+    architecture = config['model']['architecture']
+    for key, value in [('emb_dim', args.emb_dim), ('lstm_hidden_units', args.lstm_hidden_units),
+                       ('n_layers', args.n_layers), ('n_heads', args.n_heads)]:
+        if value is not None:
+            architecture[key] = value
+    if args.max_audio_length is not None:
+        config['data']['preprocessing']['max_audio_length'] = args.max_audio_length
+    if args.batch_size is not None:
+        config['training']['batch_size'] = args.batch_size
+    if args.no_checkpointing:
+        architecture['use_gradient_checkpointing'] = False
+    if args.no_mixed_precision:
+        architecture['use_mixed_precision'] = False
+        config['training'].setdefault('mixed_precision', {})['enabled'] = False
+    return config
+
+
+def _gb(value):
+    return f"{value / GB:8.2f} GB"
+
+
+def print_estimate(dims, batch_size, audio_length, estimate):
+    print("=" * 80)
+    print(f"🧮 記憶體估算: batch_size={batch_size}, max_audio_length={audio_length}")
+    print(f"   D={dims['D']} H={dims['H']} layers={dims['n_layers']} heads={dims['n_heads']} "
+          f"F={dims['F']} E={dims['E']} chunk={dims['attention_chunk']} "
+          f"checkpointing={dims['checkpointing']} mixed_precision={dims['mixed_precision']}")
+    print("=" * 80)
+    detail = estimate['detail']
+    print(f"  參數量:                 {estimate['num_params']:>12,}")
+    print(f"  參數 (fp32):            {_gb(estimate['parameters'])}")
+    print(f"  梯度:                   {_gb(estimate['gradients'])}")
+    print(f"  Adam 狀態:              {_gb(estimate['optimizer'])}")
+    print(f"  Activation (保留):      {_gb(estimate['activations'])}")
+    print(f"    - 前端 / 輸出端:      {_gb(detail['stem'] + detail['head'])}")
+    print(f"    - 每個 block:         {_gb(detail['block'])} (其中注意力分數 {detail['scores'] / GB:.2f} GB)")
+    print(f"  反向工作記憶體:         {_gb(estimate['workspace'])}")
+    print("-" * 80)
+    print(f"  預估峰值:               {_gb(estimate['total'])}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='TF-GridNetV2 訓練記憶體估算與批次大小建議')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--budget-gb', type=float, default=32.0, help='GPU 記憶體預算 GB (default: 32)')
+    parser.add_argument('--reserve-gb', type=float, default=2.0,
+                       help='保留給 CUDA context 與配置器碎片的記憶體 GB (default: 2)')
+    parser.add_argument('--target-effective-batch', type=int, default=None,
+                       help='目標有效批次 (default: 配置的 batch_size × accumulation steps)')
+    parser.add_argument('--validate', action='store_true', help='以 CPU 小尺寸實測驗證 activation 估算')
+    parser.add_argument('--calibrate', action='store_true',
+                       help='以驗證的量測/估算比例修正建議 (隱含 --validate)')
+    parser.add_argument('--batch-size', type=int, default=None, help='覆寫 training.batch_size')
+    parser.add_argument('--max-audio-length', type=int, default=None, help='覆寫 max_audio_length')
+    parser.add_argument('--emb-dim', type=int, default=None, help='覆寫 emb_dim')
+    parser.add_argument('--lstm-hidden-units', type=int, default=None, help='覆寫 lstm_hidden_units')
+    parser.add_argument('--n-layers', type=int, default=None, help='覆寫 n_layers')
+    parser.add_argument('--n-heads', type=int, default=None, help='覆寫 n_heads')
+    parser.add_argument('--no-checkpointing', action='store_true', help='假設不使用 gradient checkpointing')
+    parser.add_argument('--no-mixed-precision', action='store_true', help='假設不使用 mixed precision')
+
+    args = parser.parse_args()
+
+    import yaml
+
+    with open(args.config, 'r') as f:
+        config = apply_overrides(yaml.safe_load(f), args)
+    dims = model_dims(config)
+    training = config['training']
+    batch_size = training['batch_size']
+    audio_length = config['data']['preprocessing']['max_audio_length']
+    accumulation = training.get('gradient_accumulation', {})
+    steps = accumulation.get('steps', 1) if accumulation.get('enabled', False) else 1
+    target = args.target_effective_batch or batch_size * steps
+
+    scale = 1.0
+    if args.validate or args.calibrate:
+        print("=" * 80)
+        print("🔍 CPU 小尺寸驗證 (量測保留給反向傳播的 tensor)")
+        print("=" * 80)
+        check = validate(config, dims)
+        print(f"  參數量: 量測 {check['measured_params']:,} / 估算 {check['predicted_params']:,}")
+        print(f"  {'batch':>6} {'長度':>7} {'量測 (MB)':>12} {'估算 (MB)':>12} {'比例':>8}")
+        for row in check['rows']:
+            print(f"  {row['batch_size']:>6} {row['audio_length']:>7} {row['measured'] / 2 ** 20:>12.2f} "
+                  f"{row['predicted'] / 2 ** 20:>12.2f} {row['ratio']:>8.2f}")
+        print(f"  量測/估算中位數: {check['scale']:.2f}")
+        if args.calibrate:
+            scale = check['scale']
+            print(f"  ✅ 以下估算的 activation 乘上 {scale:.2f}")
+        print()
+
+    print_estimate(dims, batch_size, audio_length, estimate_memory(dims, batch_size, audio_length, scale))
+
+    budget = (args.budget_gb - args.reserve_gb) * GB
+    recommendation = recommend_batch_size(dims, audio_length, budget, target, scale)
+    print("\n" + "=" * 80)
+    print(f"📐 建議 (預算 {args.budget_gb:.0f} GB - 保留 {args.reserve_gb:.1f} GB, 目標有效批次 {target})")
+    print("=" * 80)
+    if recommendation is None:
+        print("❌ batch_size=1 也超出預算，請縮短 max_audio_length、啟用 gradient checkpointing 或縮小模型")
+    else:
+        print(f"  可容納的最大 batch_size:  {recommendation['max_batch_size']}")
+        print(f"  建議 batch_size:          {recommendation['batch_size']}")
+        print(f"  gradient_accumulation:    {recommendation['accumulation_steps']} 步 "
+              f"(有效批次 {recommendation['effective_batch']})")
+        print(f"  dynamic_batching.max_batch_samples: {recommendation['max_batch_samples']}")
+        print(f"  預估峰值:                 {recommendation['estimate']['total'] / GB:.2f} GB")
+    print("=" * 80)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+即時噪音混合資料增強
+訓練時只讀取乾淨語音，再從獨立的噪音語料隨機取片段，依每個樣本抽樣的 SNR 與增益
+在批次上以向量化方式混合，取代預先混好的 train_noisy 檔：
+每個樣本的磁碟讀取減半，且每個 epoch 的混合組合都不同
+
+SNR/增益/噪音片段由 (seed, epoch, 樣本索引) 決定，與 DataLoader worker 數及批次組合無關，可重現
+
+配置 (configs/training_rtx5090.yaml):
+    data.mode: paired (預設，使用成對 scp 的 AudioDataset) 或 noise_mixing
+    data.noise_mixing: noise_scp、snr_range_db、gain_range_db、seed 等設定
+
+使用方式:
+    python scripts/noise_mixing.py --config configs/training_rtx5090.yaml --noise-scp data/scp/noise.scp --num-items 4 --output-dir /tmp/mix_preview
+"""
+
+import os
+import sys
+import argparse
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+from torch.utils.data import Dataset
+
+from audio_io import read_scp, resolve_audio_path, read_resampled_segment, load_waveform
+from partial_read_dataset import PeakIndex, default_peak_index_path
+
+
+class NoiseBank:
+    """
+    噪音語料
+
+    Args:
+        noise_scp_path: 噪音 scp (每行 "id path")
+        target_sample_rate: 重取樣目標取樣率
+        preload: True 時一次載入並重取樣整個語料 (存成連續陣列，fork 的 worker 共用)，
+                 之後每個樣本只需讀取乾淨語音；False 時每次以部分讀取取得片段
+        root: scp 相對路徑的基準目錄
+    """
+
+    def __init__(self, noise_scp_path, target_sample_rate=16000, preload=True, root=None):
+        self.target_sample_rate = target_sample_rate
+        self.preload = preload
+        self.paths = [resolve_audio_path(path, noise_scp_path, root)
+                      for path in read_scp(noise_scp_path).values()]
+        if not self.paths:
+            raise ValueError(f"噪音 scp 沒有任何項目: {noise_scp_path}")
+
+        if preload:
+            audios = [load_waveform(path, target_sample_rate, normalize=False) for path in self.paths]
+            self.lengths = np.array([a.shape[0] for a in audios], dtype=np.int64)
+            self.offsets = np.concatenate([[0], np.cumsum(self.lengths)[:-1]])
+            self.data = np.concatenate(audios) if audios else np.zeros(0, dtype=np.float32)
+        else:
+            self.headers = []
+            for path in self.paths:
+                info = sf.info(str(path))
+                self.headers.append((info.samplerate, info.frames))
+            # 與 load_waveform 整檔重取樣的長度 (無條件進位) 一致
+            self.lengths = np.array([-(-frames * target_sample_rate // sr) for sr, frames in self.headers],
+                                    dtype=np.int64)
+
+        if np.any(self.lengths <= 0):
+            raise ValueError("噪音語料中有空檔案")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def segment(self, k, start, length):
+        """取第 k 個噪音檔從 start 開始的 length 個取樣點，不足時從頭循環接續"""
+        total = int(self.lengths[k])
+        pieces, filled = [], 0
+        while filled < length:
+            count = min(length - filled, total - start)
+            if self.preload:
+                offset = int(self.offsets[k]) + start
+                pieces.append(self.data[offset:offset + count])
+            else:
+                sr, frames = self.headers[k]
+                pieces.append(read_resampled_segment(self.paths[k], start, count, self.target_sample_rate,
+                                                     orig_sr=sr, num_frames=frames))
+            filled += count
+            start = 0
+        return np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+
+
+class NoiseMixingDataset(Dataset):
+    """
+    乾淨語音 + 噪音片段資料集，混合交給 BatchNoiseMixer 在批次上進行
+
+    Args:
+        clean_scp_path: 乾淨語音 scp
+        noise_bank: NoiseBank
+        config: 訓練配置 (使用 data.preprocessing 與 data.noise_mixing 的設定)
+        random_crop: 超過 max_audio_length 時隨機選擇裁切位置
+        peak_index_path: 乾淨語音峰值 sidecar JSON (None 表示 clean scp 旁的 <名稱>.peaks.json，
+                         見 partial_read_dataset.PeakIndex)
+        root: scp 相對路徑的基準目錄
+
+    每個樣本回傳 (clean, noise, params, uttid)；params 為 [snr_db, gain_db]
+    """
+
+    def __init__(self, clean_scp_path, noise_bank, config, random_crop=True, peak_index_path=None,
+                 root=None):
+        preprocessing = config['data']['preprocessing']
+        settings = config['data'].get('noise_mixing') or {}
+        self.target_sample_rate = preprocessing['target_sample_rate']
+        self.max_audio_length = preprocessing.get('max_audio_length')
+        self.normalize = preprocessing.get('normalize_audio', True)
+        self.snr_range = tuple(settings.get('snr_range_db', (-5.0, 20.0)))
+        self.gain_range = tuple(settings.get('gain_range_db', (-6.0, 6.0)))
+        self.seed = settings.get('seed', 0)
+        self.random_crop = random_crop
+        self.noise_bank = noise_bank
+        self.epoch = 0
+
+        self.items = [(uttid, resolve_audio_path(path, clean_scp_path, root))
+                      for uttid, path in read_scp(clean_scp_path).items()]
+        self.headers = []
+        for _, path in self.items:
+            info = sf.info(str(path))
+            self.headers.append((info.samplerate, info.frames))
+
+        self.peaks = None
+        if self.normalize:
+            if peak_index_path is None:
+                peak_index_path = default_peak_index_path(clean_scp_path)
+            self.peaks = PeakIndex(peak_index_path, self.target_sample_rate)
+
+    def __len__(self):
+        return len(self.items)
+
+    def set_epoch(self, epoch):
+        """每個 epoch 開始前呼叫，改變噪音/SNR/增益的抽樣"""
+        self.epoch = epoch
+
+    def get_length(self, i):
+        sr, frames = self.headers[i]
+        return frames * self.target_sample_rate // sr
+
+    def __getitem__(self, i):
+        uttid, path = self.items[i]
+        rng = np.random.default_rng([self.seed, self.epoch, i])
+
+        total = self.get_length(i)
+        length, start = total, 0
+        if self.max_audio_length is not None and total > self.max_audio_length:
+            length = self.max_audio_length
+            if self.random_crop:
+                start = int(rng.integers(0, total - length + 1))
+
+        sr, frames = self.headers[i]
+        clean = read_resampled_segment(path, start, length, self.target_sample_rate,
+                                       orig_sr=sr, num_frames=frames)
+        if self.normalize:
+            peak = self.peaks[str(path)]
+            if peak > 1e-8:
+                clean = clean / peak
+
+        k = int(rng.integers(0, len(self.noise_bank)))
+        noise = self.noise_bank.segment(k, int(rng.integers(0, self.noise_bank.lengths[k])), length)
+        params = np.array([rng.uniform(*self.snr_range), rng.uniform(*self.gain_range)],
+                          dtype=np.float32)
+
+        # 不足 max_audio_length 時補零 (噪音也補零，補零區段混合後仍為靜音)
+        if self.max_audio_length is not None and length < self.max_audio_length:
+            pad = self.max_audio_length - length
+            clean = np.pad(clean, (0, pad))
+            noise = np.pad(noise, (0, pad))
+
+        return (torch.from_numpy(np.ascontiguousarray(clean, dtype=np.float32)),
+                torch.from_numpy(np.ascontiguousarray(noise, dtype=np.float32)),
+                torch.from_numpy(params), uttid)
+
+
+class BatchNoiseMixer(torch.nn.Module):
+    """
+    在批次上混合乾淨語音與噪音 (可在 GPU 上執行)
+
+    noisy = gain * (clean + scale * noise)，scale 使 10·log10(P_clean / P_scaled_noise) = snr_db；
+    clean 目標同樣乘上 gain。混合後峰值超過 max_peak 的樣本，noisy 與 clean 一起等比例縮小
+
+    Args:
+        max_peak: 峰值上限，避免截波
+        eps: 功率下限
+    """
+
+    def __init__(self, max_peak=0.99, eps=1e-8):
+        super().__init__()
+        self.max_peak = max_peak
+        self.eps = eps
+
+    def forward(self, clean, noise, params, lengths=None):
+        """
+        Args:
+            clean, noise: (B, T) 張量
+            params: (B, 2) 的 [snr_db, gain_db]
+            lengths: (B,) 有效長度 (None 表示整段)，功率只在有效區段計算
+
+        Returns:
+            noisy, clean: (B, T) 張量
+        """
+        params = params.to(device=clean.device, dtype=clean.dtype)
+        snr_db, gain_db = params[:, 0], params[:, 1]
+
+        if lengths is None:
+            valid = torch.full((clean.shape[0],), clean.shape[-1], device=clean.device, dtype=clean.dtype)
+            mask = None
+        else:
+            lengths = lengths.to(clean.device)
+            mask = torch.arange(clean.shape[-1], device=clean.device)[None, :] < lengths[:, None]
+            noise = noise * mask
+            valid = lengths.to(clean.dtype).clamp_min(1)
+
+        clean_power = clean.pow(2).sum(dim=-1) / valid
+        noise_power = noise.pow(2).sum(dim=-1) / valid
+        scale = torch.sqrt(clean_power / (noise_power.clamp_min(self.eps) * 10 ** (snr_db / 10)))
+        # 靜音的乾淨語音維持純噪音 (以增益決定音量)
+        scale = torch.where(clean_power > self.eps, scale, torch.ones_like(scale))
+
+        noisy = clean + scale[:, None] * noise
+        gain = 10 ** (gain_db / 20)
+        peak = noisy.abs().amax(dim=-1) * gain
+        gain = gain * torch.clamp(self.max_peak / peak.clamp_min(self.eps), max=1.0)
+
+        noisy = noisy * gain[:, None]
+        clean = clean * gain[:, None]
+        return noisy, clean
+
+
+def build_train_dataset(config, split='train', random_crop=True, root=None):
+    """
+    依 data.mode 建立訓練資料集
+
+    Returns:
+        (dataset, mixer): paired 模式為 (AudioDataset, None)，批次內容為 (noisy, clean, uttid)；
+        noise_mixing 模式為 (NoiseMixingDataset, BatchNoiseMixer)，批次內容為
+        (clean, noise, params, uttid)，需經 mixer(clean, noise, params) 得到 (noisy, clean)
+    """
+    data = config['data']
+    mode = data.get('mode', 'paired')
+    if mode == 'paired':
+        sys.path.insert(0, '/workspace/TFG-Transfer-Package/code')
+        from memory_optimized_tfgridnet import AudioDataset
+        dataset = AudioDataset(
+            clean_scp_path=data[f'{split}_clean_scp'],
+            noisy_scp_path=data[f'{split}_noisy_scp'],
+            config=config,
+        )
+        return dataset, None
+    if mode != 'noise_mixing':
+        raise ValueError(f"不支援的資料模式: {mode}")
+
+    settings = data.get('noise_mixing') or {}
+    noise_bank = NoiseBank(settings[f'{split}_noise_scp'], data['preprocessing']['target_sample_rate'],
+                           preload=settings.get('preload_noise', True), root=root)
+    dataset = NoiseMixingDataset(data[f'{split}_clean_scp'], noise_bank, config,
+                                 random_crop=random_crop,
+                                 peak_index_path=settings.get('peak_index'), root=root)
+    return dataset, BatchNoiseMixer(max_peak=settings.get('max_peak', 0.99))
+
+
+if __name__ == '__main__':
+    import yaml
+
+    parser = argparse.ArgumentParser(description='即時噪音混合預覽')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--split', type=str, default='train', help='資料集 (default: train)')
+    parser.add_argument('--noise-scp', type=str, default=None,
+                       help='噪音 scp (default: 配置中的 data.noise_mixing.<split>_noise_scp)')
+    parser.add_argument('--num-items', type=int, default=8, help='預覽樣本數 (default: 8)')
+    parser.add_argument('--epoch', type=int, default=0, help='epoch (影響抽樣, default: 0)')
+    parser.add_argument('--output-dir', type=str, default=None, help='輸出混合結果 WAV 的目錄')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    config['data']['mode'] = 'noise_mixing'
+    config['data'].setdefault('noise_mixing', {})
+    if args.noise_scp is not None:
+        config['data']['noise_mixing'][f'{args.split}_noise_scp'] = args.noise_scp
+
+    dataset, mixer = build_train_dataset(config, args.split)
+    dataset.set_epoch(args.epoch)
+    batch = [dataset[i] for i in range(min(args.num_items, len(dataset)))]
+    clean = torch.stack([b[0] for b in batch])
+    noise = torch.stack([b[1] for b in batch])
+    params = torch.stack([b[2] for b in batch])
+    noisy, clean = mixer(clean, noise, params)
+
+    print("=" * 80)
+    print(f"噪音混合預覽 ({len(batch)} 個樣本, 噪音語料 {len(dataset.noise_bank)} 個檔案)")
+    print("=" * 80)
+    sample_rate = dataset.target_sample_rate
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    for k, (_, _, p, uttid) in enumerate(batch):
+        residual = noisy[k] - clean[k]
+        actual = 10 * torch.log10(clean[k].pow(2).sum() / residual.pow(2).sum().clamp_min(1e-12))
+        print(f"  {uttid:<20} 目標 SNR {p[0]:>6.2f} dB  實際 {actual:>6.2f} dB  增益 {p[1]:>+6.2f} dB")
+        if args.output_dir:
+            sf.write(str(Path(args.output_dir) / f'{uttid}_noisy.wav'), noisy[k].numpy(), sample_rate)
+            sf.write(str(Path(args.output_dir) / f'{uttid}_clean.wav'), clean[k].numpy(), sample_rate)
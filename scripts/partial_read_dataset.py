@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+部分讀取隨機裁切資料集
+先由檔頭 (或索引) 取得長度，決定裁切位置後只 seek 讀取需要的片段 (加上重取樣餘量)，
+不再整檔解碼後丟掉大部分內容；clean 與 noisy 使用相同的裁切位置
+
+峰值正規化需要整檔峰值：第一次讀到某檔案時計算 (該次仍需整檔解碼)，
+存進 scp/manifest 旁的 sidecar JSON，之後的 epoch 與下次訓練只做部分讀取
+
+使用方式:
+    python scripts/partial_read_dataset.py --config configs/training_rtx5090.yaml --split train   # 讀取速度比較
+"""
+
+import os
+import json
+import time
+import argparse
+import multiprocessing.util
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+import torch
+from torch.utils.data import Dataset
+
+from audio_io import read_paired_scp, read_resampled_segment, file_peak, load_waveform
+from dataset_manifest import DatasetManifest
+
+
+def default_peak_index_path(index_path):
+    """預設峰值 sidecar 路徑：clean scp (或 manifest) 旁的 <名稱>.peaks.json"""
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.stem + '.peaks.json')
+
+
+class PeakIndex:
+    """
+    重取樣後峰值的 sidecar 快取，第一次讀到某檔案時才計算，不在初始化時掃描整個資料集
+
+    項目為 路徑 → [檔案大小, mtime_ns, 取樣率, 峰值]，檔案或取樣率變動時重新計算；
+    每新增 save_every 筆及行程結束時寫回 (先合併其他行程已寫入的項目，寫暫存檔後改名)，
+    DataLoader 的各 worker 各自計算並寫回，之後的 epoch 與下次訓練直接沿用
+
+    Args:
+        path: sidecar JSON 路徑 (None 表示只保留在記憶體)
+        target_sample_rate: 重取樣後的取樣率
+        save_every: 每新增幾筆寫回一次
+    """
+
+    def __init__(self, path, target_sample_rate, save_every=64):
+        self.path = None if path is None else str(path)
+        self.target_sample_rate = target_sample_rate
+        self.save_every = save_every
+        self.entries = self._load()
+        self.unsaved = 0
+        self._finalizer_pid = None
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def __getitem__(self, path):
+        path = str(path)
+        stat = os.stat(path)
+        signature = [stat.st_size, stat.st_mtime_ns, self.target_sample_rate]
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == signature:
+            return entry[3]
+
+        peak = file_peak(path, self.target_sample_rate)
+        self.entries[path] = signature + [peak]
+        self.unsaved += 1
+        if self._finalizer_pid != os.getpid():
+            # DataLoader worker 結束時不會執行 atexit，multiprocessing 的 Finalize 會
+            multiprocessing.util.Finalize(self, self.save, exitpriority=10)
+            self._finalizer_pid = os.getpid()
+        if self.unsaved >= self.save_every:
+            self.save()
+        return peak
+
+    def save(self):
+        """把尚未寫回的項目合併寫入 sidecar (無法寫入時只警告一次並改為只保留在記憶體)"""
+        if self.path is None or not self.unsaved:
+            return
+        merged = self._load()
+        merged.update(self.entries)
+        tmp_path = f'{self.path}.tmp-{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️  無法寫入峰值索引 {self.path}，改為只保留在記憶體: {e}")
+            self.path = None
+        self.entries = merged
+        self.unsaved = 0
+
+
+class PartialReadAudioDataset(Dataset):
+    """
+    只讀取裁切片段的資料集，介面與 AudioDataset 相同 (回傳 noisy, clean, uttid)
+
+    Args:
+        clean_scp_path, noisy_scp_path: 成對的 scp 檔
+        config: 訓練配置 (使用 data.preprocessing 的設定)
+        random_crop: 超過 max_audio_length 時隨機選擇裁切位置；False 時從頭裁切
+        margin_ms: 重取樣濾波器邊界餘量 (毫秒)
+        peak_index_path: 峰值 sidecar JSON 路徑 (None 表示 clean scp 或 manifest 旁的
+                         <名稱>.peaks.json，見 PeakIndex)
+        root: scp 相對路徑的基準目錄
+        manifest_path: dataset_manifest 建立的索引路徑，指定時直接使用其中的配對與檔頭
+        pad_to_max: 不足 max_audio_length 時補零；搭配 dynamic_batching.TokenBudgetBatchSampler
+                    時應設為 False，回傳實際長度，由 collate_padded 補零並記錄長度
+    """
+
+    def __init__(self, clean_scp_path, noisy_scp_path, config, random_crop=True,
+                 margin_ms=8.0, peak_index_path=None, root=None, manifest_path=None, pad_to_max=True):
+        preprocessing = config['data']['preprocessing']
+        self.target_sample_rate = preprocessing['target_sample_rate']
+        self.max_audio_length = preprocessing.get('max_audio_length')
+        self.normalize = preprocessing.get('normalize_audio', True)
+        self.random_crop = random_crop
+        self.margin_ms = margin_ms
+        self.pad_to_max = pad_to_max
+
+        if manifest_path is not None:
+            manifest = DatasetManifest(manifest_path)
+            self.pairs = manifest.pairs()
+            self.headers = manifest.headers()
+        else:
+            self.pairs = read_paired_scp(clean_scp_path, noisy_scp_path, root)
+            # 只讀檔頭取得長度與取樣率
+            self.headers = []
+            for _, clean_path, noisy_path in self.pairs:
+                clean_info = sf.info(str(clean_path))
+                noisy_info = sf.info(str(noisy_path))
+                self.headers.append(((clean_info.samplerate, clean_info.frames),
+                                     (noisy_info.samplerate, noisy_info.frames)))
+
+        self.peaks = None
+        if self.normalize:
+            if peak_index_path is None:
+                peak_index_path = default_peak_index_path(manifest_path or clean_scp_path)
+            self.peaks = PeakIndex(peak_index_path, self.target_sample_rate)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def get_length(self, i):
+        """第 i 個樣本重取樣後的長度 (clean/noisy 取較短者)"""
+        return min(frames * self.target_sample_rate // sr for sr, frames in self.headers[i])
+
+    def _read(self, path, header, start, length):
+        sr, frames = header
+        audio = read_resampled_segment(path, start, length, self.target_sample_rate,
+                                       orig_sr=sr, num_frames=frames, margin_ms=self.margin_ms)
+        if self.normalize:
+            peak = self.peaks[str(path)]
+            if peak > 1e-8:
+                audio = audio / peak
+        return audio
+
+    def __getitem__(self, i):
+        uttid, clean_path, noisy_path = self.pairs[i]
+        clean_header, noisy_header = self.headers[i]
+
+        # 先決定裁切位置，再只讀取需要的片段
+        total = self.get_length(i)
+        length = total
+        start = 0
+        if self.max_audio_length is not None and total > self.max_audio_length:
+            length = self.max_audio_length
+            if self.random_crop:
+                start = int(torch.randint(0, total - length + 1, (1,)))
+
+        clean = self._read(clean_path, clean_header, start, length)
+        noisy = self._read(noisy_path, noisy_header, start, length)
+
+        # 不足 max_audio_length 時補零
+        if self.pad_to_max and self.max_audio_length is not None and length < self.max_audio_length:
+            pad = self.max_audio_length - length
+            clean = np.pad(clean, (0, pad))
+            noisy = np.pad(noisy, (0, pad))
+
+        return torch.from_numpy(noisy), torch.from_numpy(clean), uttid
+
+
+def run_benchmark(dataset, num_items=100):
+    """比較整檔讀取後裁切與部分讀取的每樣本時間"""
+    num_items = min(num_items, len(dataset))
+
+    # 暖機 (librosa 第一次呼叫會載入重取樣後端)
+    load_waveform(dataset.pairs[0][1], dataset.target_sample_rate, dataset.normalize)
+    dataset[0]
+
+    start = time.perf_counter()
+    for i in range(num_items):
+        _, clean_path, noisy_path = dataset.pairs[i]
+        for path in (clean_path, noisy_path):
+            audio = load_waveform(path, dataset.target_sample_rate, dataset.normalize)
+            audio[:dataset.max_audio_length]
+    full_read = (time.perf_counter() - start) / num_items
+
+    start = time.perf_counter()
+    for i in range(num_items):
+        dataset[i]
+    partial_read = (time.perf_counter() - start) / num_items
+
+    avg_seconds = np.mean([dataset.get_length(i) for i in range(num_items)]) / dataset.target_sample_rate
+    print("=" * 80)
+    print(f"讀取速度比較 ({num_items} 個樣本, 平均長度 {avg_seconds:.2f} 秒, "
+          f"裁切 {dataset.max_audio_length} 取樣點)")
+    print("=" * 80)
+    print(f"  整檔讀取 + 裁切: {full_read * 1000:>10.2f} ms / 樣本")
+    print(f"  部分讀取:        {partial_read * 1000:>10.2f} ms / 樣本")
+    print(f"  加速比:          {full_read / partial_read:>10.2f}x")
+
+
+if __name__ == '__main__':
+    import yaml
+
+    parser = argparse.ArgumentParser(description='部分讀取資料集讀取速度比較')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--split', type=str, default='train', help='資料集 (default: train)')
+    parser.add_argument('--num-items', type=int, default=100, help='測試樣本數 (default: 100)')
+    parser.add_argument('--peak-index', type=str, default=None,
+                       help='峰值 sidecar JSON 路徑 (default: scp 或 manifest 旁的 <名稱>.peaks.json)')
+    parser.add_argument('--manifest', type=str, default=None, help='dataset_manifest 索引路徑')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    dataset = PartialReadAudioDataset(
+        config['data'][f'{args.split}_clean_scp'],
+        config['data'][f'{args.split}_noisy_scp'],
+        config,
+        peak_index_path=args.peak_index,
+        manifest_path=args.manifest,
+    )
+    run_benchmark(dataset, args.num_items)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+評估結果的欄式儲存
+evaluation_results.csv 之外另存 evaluation_results.npz：每個逐樣本指標一個有型別的欄位
+(uttid 為固定寬度字串，分數為 float64)，執行資訊 (檢查點、epoch、模型設定、統計摘要)
+以 JSON 存於 __metadata__
+
+npz 不壓縮 (ZIP_STORED)，讀取時直接以 np.memmap 對應各欄位在檔案中的位置，
+只讀取需要的欄位且不複製資料；舊的結果目錄沒有 npz 時退回解析 CSV 與 metadata.json
+
+使用方式:
+    python scripts/result_store.py --result-dir <結果目錄>              # 顯示欄位與執行資訊
+    python scripts/result_store.py --result-dir <結果目錄> --convert    # 由 CSV 補建 npz
+"""
+
+import csv
+import json
+import zipfile
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+RESULT_STORE_NAME = 'evaluation_results.npz'
+RESULT_CSV_NAME = 'evaluation_results.csv'
+METADATA_KEY = '__metadata__'
+FLOAT_COLUMNS = ('si_snr_noisy', 'si_snr_enhanced', 'improvement')
+
+
+def columns_from_rows(rows, fieldnames=('uttid',) + FLOAT_COLUMNS):
+    """
+    將逐樣本結果列 (dict) 轉為欄位陣列
+
+    Returns:
+        dict: 欄位名稱 → np.ndarray (uttid 為字串，其餘為 float64)
+    """
+    columns = {}
+    for name in fieldnames:
+        values = [row[name] for row in rows]
+        if name == 'uttid':
+            columns[name] = np.array(values, dtype=np.str_) if values else np.zeros(0, dtype='<U1')
+        else:
+            columns[name] = np.array(values, dtype=np.float64)
+    return columns
+
+
+def write_result_store(result_dir, columns, metadata=None):
+    """
+    寫出欄式結果檔
+
+    Args:
+        result_dir: 結果目錄
+        columns: 欄位名稱 → 陣列 (可由 columns_from_rows 產生)
+        metadata: 執行資訊 (可 JSON 序列化的 dict)
+
+    Returns:
+        Path: npz 路徑
+    """
+    path = Path(result_dir) / RESULT_STORE_NAME
+    arrays = {name: np.ascontiguousarray(values) for name, values in columns.items()}
+    for name, values in arrays.items():
+        if values.dtype.hasobject:
+            raise TypeError(f"欄位 {name} 為 object 陣列，無法以 memmap 讀取")
+    arrays[METADATA_KEY] = np.array(json.dumps(metadata or {}, ensure_ascii=False, default=str))
+    # np.savez 不壓縮，成員為 ZIP_STORED，可直接對應到檔案位置
+    tmp_path = path.with_name(path.name + '.tmp.npz')
+    np.savez(tmp_path, **arrays)
+    tmp_path.replace(path)
+    return path
+
+
+def _member_memmap(path, info):
+    """以 memmap 開啟 npz 中未壓縮的 .npy 成員"""
+    with open(path, 'rb') as f:
+        # 本地檔頭: 固定 30 bytes，其後為檔名與 extra 欄位 (長度可能與中央目錄不同)
+        f.seek(info.header_offset + 26)
+        name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject:
+        raise TypeError(f"{info.filename} 為 object 陣列")
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def read_result_store(path, columns=None):
+    """
+    讀取 npz 結果檔的指定欄位
+
+    Args:
+        path: npz 路徑
+        columns: 欄位名稱列表 (None 表示全部)
+
+    Returns:
+        (columns, metadata): 欄位 → 唯讀陣列 (未壓縮成員為 memmap)、執行資訊 dict
+    """
+    path = str(path)
+    result = {}
+    with zipfile.ZipFile(path) as zip_file:
+        members = {Path(info.filename).stem: info for info in zip_file.infolist()}
+        names = [name for name in members if name != METADATA_KEY] if columns is None else list(columns)
+        for name in names:
+            if name not in members:
+                raise KeyError(f"{path} 沒有欄位 {name}")
+            info = members[name]
+            if info.compress_type == zipfile.ZIP_STORED:
+                result[name] = _member_memmap(path, info)
+            else:
+                with zip_file.open(info) as f:
+                    result[name] = np.lib.format.read_array(f)
+        metadata = {}
+        if METADATA_KEY in members:
+            with zip_file.open(members[METADATA_KEY]) as f:
+                metadata = json.loads(str(np.lib.format.read_array(f)))
+    return result, metadata
+
+
+def read_results_csv(csv_path, columns=None):
+    """由 evaluation_results.csv 讀取指定欄位 (舊結果目錄的退回路徑)"""
+    with open(csv_path, 'r') as f:
+        reader = csv.DictReader(f)
+        names = list(reader.fieldnames) if columns is None else list(columns)
+        missing = [name for name in names if name not in reader.fieldnames]
+        if missing:
+            raise KeyError(f"{csv_path} 沒有欄位 {', '.join(missing)}")
+        values = {name: [] for name in names}
+        for row in reader:
+            for name in names:
+                values[name].append(row[name])
+    result = {}
+    for name in names:
+        if name == 'uttid':
+            result[name] = np.array(values[name], dtype=np.str_)
+        else:
+            result[name] = np.array(values[name], dtype=np.float64)
+    return result
+
+
+def load_results(result_dir, columns=None):
+    """
+    讀取結果目錄的逐樣本指標
+
+    優先使用 evaluation_results.npz，不存在時退回 evaluation_results.csv
+
+    Args:
+        result_dir: 結果目錄
+        columns: 需要的欄位 (None 表示全部)
+
+    Returns:
+        dict: 欄位名稱 → np.ndarray
+    """
+    result_dir = Path(result_dir)
+    store_path = result_dir / RESULT_STORE_NAME
+    if store_path.exists():
+        return read_result_store(store_path, columns)[0]
+    csv_path = result_dir / RESULT_CSV_NAME
+    if not csv_path.exists():
+        raise FileNotFoundError(f"找不到評估結果: {store_path} 或 {csv_path}")
+    return read_results_csv(csv_path, columns)
+
+
+def load_run_metadata(result_dir):
+    """
+    讀取執行資訊：npz 內的 metadata 與 metadata.json (後者的欄位優先)
+
+    Returns:
+        dict 或 None (都不存在時)
+    """
+    result_dir = Path(result_dir)
+    metadata = None
+    store_path = result_dir / RESULT_STORE_NAME
+    if store_path.exists():
+        metadata = read_result_store(store_path, columns=[])[1] or None
+    metadata_path = result_dir / 'metadata.json'
+    if metadata_path.exists():
+        with open(metadata_path, 'r') as f:
+            metadata = {**(metadata or {}), **json.load(f)}
+    return metadata
+
+
+def update_metadata_json(result_dir, updates):
+    """
+    將欄位合併寫入結果目錄的 metadata.json (保留既有欄位，例如手動填寫的實驗說明)
+
+    Returns:
+        Path: metadata.json 路徑
+    """
+    metadata_path = Path(result_dir) / 'metadata.json'
+    metadata = {}
+    if metadata_path.exists():
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+    metadata.update(updates)
+    tmp_path = metadata_path.with_name(metadata_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(metadata_path)
+    return metadata_path
+
+
+def run_metadata(checkpoint_path, checkpoint, model_config=None, results=None):
+    """
+    評估結果的執行資訊
+
+    Args:
+        checkpoint_path: 檢查點路徑
+        checkpoint: 檢查點內容或權重包的 source (需含 epoch，可含損失)
+        model_config: 訓練配置中的 model 區塊
+        results: 統計摘要 (只保留純量欄位)
+    """
+    import torch
+
+    metadata = {
+        'checkpoint': str(checkpoint_path),
+        'training': {
+            'best_epoch': checkpoint.get('epoch'),
+            'train_loss': checkpoint.get('train_loss'),
+            'valid_loss': checkpoint.get('valid_loss'),
+            'pytorch_version': torch.__version__,
+        },
+    }
+    if model_config is not None:
+        architecture = model_config['architecture']
+        # 與 TFGridNetV2 的建構參數同名
+        metadata['model'] = {
+            'n_layers': architecture.get('n_layers'),
+            'lstm_hidden_units': architecture.get('lstm_hidden_units'),
+            'attn_n_head': architecture.get('n_heads'),
+            'emb_dim': architecture.get('emb_dim'),
+            'n_fft': model_config['stft'].get('n_fft'),
+            'hop_length': model_config['stft'].get('hop_length'),
+        }
+    if results is not None:
+        metadata['summary'] = {key: value for key, value in results.items()
+                               if isinstance(value, (int, float, str)) or value is None}
+    return metadata
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='欄式評估結果檔')
+    parser.add_argument('--result-dir', type=str, required=True, help='推理結果目錄路徑')
+    parser.add_argument('--convert', action='store_true',
+                       help='由 evaluation_results.csv (與 metadata.json) 補建 npz')
+
+    args = parser.parse_args()
+    result_dir = Path(args.result_dir)
+
+    if args.convert:
+        columns = read_results_csv(result_dir / RESULT_CSV_NAME)
+        metadata = load_run_metadata(result_dir)
+        path = write_result_store(result_dir, columns, metadata)
+        print(f"✅ 已建立欄式結果檔: {path} ({len(next(iter(columns.values())))} 個樣本)")
+
+    store_path = result_dir / RESULT_STORE_NAME
+    source = store_path if store_path.exists() else result_dir / RESULT_CSV_NAME
+    columns = load_results(result_dir)
+    metadata = load_run_metadata(result_dir)
+    print("=" * 80)
+    print(f"評估結果: {source}")
+    print("=" * 80)
+    for name, values in columns.items():
+        kind = 'memmap' if isinstance(values, np.memmap) else 'array'
+        print(f"  {name:<20} {str(values.dtype):>8} {values.shape[0]:>10} 筆  ({kind})")
+    if 'improvement' in columns and len(columns['improvement']) > 0:
+        print(f"\n  平均改善: {columns['improvement'].mean():.2f} dB")
+    if metadata:
+        print(f"\n📦 執行資訊:")
+        print(json.dumps(metadata, ensure_ascii=False, indent=2))
@@ -4,10 +4,12 @@
 從評估結果中選擇最佳和最差的樣本，用於 Git 提交
 """
 
-import csv
 import shutil
 from pathlib import Path
 import argparse
+import numpy as np
+
+from result_store import load_results
 
 def select_samples(result_dir, output_dir='audio_samples', best_n=5, worst_n=5):
     """
@@ -20,29 +22,24 @@ def select_samples(result_dir, output_dir='audio_samples', best_n=5, worst_n=5):
         worst_n: 選擇最差樣本數量
     """
     result_dir = Path(result_dir)
-    csv_path = result_dir / 'evaluation_results.csv'
     
-    if not csv_path.exists():
-        print(f"❌ 找不到 CSV 檔案: {csv_path}")
+    # 讀取評估結果 (欄式結果檔，舊結果退回 CSV)
+    try:
+        columns = load_results(result_dir, ['uttid', 'improvement'])
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
         return
+    uttids = columns['uttid']
+    improvements = columns['improvement']
     
-    # 讀取評估結果
-    results = []
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            results.append({
-                'uttid': row['uttid'],
-                'improvement': float(row['improvement'])
-            })
-    
-    # 排序
-    sorted_results = sorted(results, key=lambda x: x['improvement'])
+    # 排序 (穩定排序，同分時保持原順序)
+    order = np.argsort(improvements, kind='stable')
     
     # 選擇最佳和最差
-    worst_samples = sorted_results[:worst_n]
-    best_samples = sorted_results[-best_n:]
-    best_samples.reverse()  # 從高到低排列
+    def to_samples(indices):
+        return [{'uttid': str(uttids[i]), 'improvement': float(improvements[i])} for i in indices]
+    worst_samples = to_samples(order[:worst_n])
+    best_samples = to_samples(order[::-1][:best_n])  # 從高到低排列
     
     # 創建輸出目錄
     output_base = result_dir / output_dir
@@ -107,7 +104,7 @@ def select_samples(result_dir, output_dir='audio_samples', best_n=5, worst_n=5):
             f.write(f"   - `{uttid}_clean.wav` - 乾淨參考音訊\n\n")
         
         f.write("\n## 📊 統計\n\n")
-        f.write(f"- 總樣本數: {len(results)}\n")
+        f.write(f"- 總樣本數: {len(improvements)}\n")
         f.write(f"- 精選樣本: {best_n + worst_n} 個\n")
         f.write(f"- 音訊檔案數: {(best_n + worst_n) * 3} 個 WAV\n")
         f.write(f"- 來源實驗: {result_dir.name}\n")
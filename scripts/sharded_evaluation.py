@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+多行程分片 CPU 評估
+將驗證集 scp 切成 N 個分片，每個分片由獨立行程 (各自載入模型、固定執行緒數) 執行
+evaluate_model，完成後合併為單一 evaluation_results.csv、highlights.txt 與統計摘要
+
+分片依檔案大小以最長優先 (LPT) 分配，讓各行程的音訊總長接近；
+合併時依原 scp 順序排列，逐列沿用分片 CSV 的原始文字，
+因此內容與單行程評估 (相同執行緒數) 逐位元組相同
+
+使用方式:
+    python scripts/sharded_evaluation.py --checkpoint ckpt.pth --workers 4
+    python scripts/sharded_evaluation.py --checkpoint ckpt.pth --benchmark --benchmark-workers 1 2 4 8 --no-save-audio
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+from audio_io import read_scp, resolve_audio_path
+from result_store import write_result_store, columns_from_rows, run_metadata
+
+SHARD_RESULTS = 'shard_results.csv'
+SHARD_META = 'shard_meta.json'
+
+
+def _scp_path_for_shard(path, scp_path):
+    """分片 scp 放在其他目錄，相對路徑能解析時改寫為絕對路徑"""
+    resolved = resolve_audio_path(path, scp_path)
+    return str(resolved.resolve()) if resolved.exists() else path
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def split_scp(clean_scp_path, noisy_scp_path, num_shards, shard_root):
+    """
+    將成對的 clean/noisy scp 切成 num_shards 個分片
+
+    依 noisy 檔案大小由大到小，每次分給目前總量最小的分片 (LPT)；
+    分片內保持原 scp 順序
+
+    Returns:
+        (uttid_order, shards): uttid_order 為原 scp 順序，
+        shards 為 [(shard_dir, clean_scp, noisy_scp, num_utts)] (不含空分片)
+    """
+    clean = read_scp(clean_scp_path)
+    noisy = read_scp(noisy_scp_path)
+    uttid_order = [uttid for uttid in clean if uttid in noisy]
+    position = {uttid: i for i, uttid in enumerate(uttid_order)}
+
+    sizes = {uttid: _file_size(resolve_audio_path(noisy[uttid], noisy_scp_path))
+             for uttid in uttid_order}
+    assigned = [[] for _ in range(num_shards)]
+    loads = [0] * num_shards
+    for uttid in sorted(uttid_order, key=lambda u: (-sizes[u], position[u])):
+        k = int(np.argmin(loads))
+        assigned[k].append(uttid)
+        loads[k] += max(sizes[uttid], 1)
+
+    shards = []
+    for k, uttids in enumerate(assigned):
+        if not uttids:
+            continue
+        uttids.sort(key=position.get)
+        shard_dir = Path(shard_root) / f'shard_{k:02d}'
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        shard_clean = shard_dir / 'valid_clean.scp'
+        shard_noisy = shard_dir / 'valid_noisy.scp'
+        with open(shard_clean, 'w') as f:
+            for uttid in uttids:
+                f.write(f"{uttid} {_scp_path_for_shard(clean[uttid], clean_scp_path)}\n")
+        with open(shard_noisy, 'w') as f:
+            for uttid in uttids:
+                f.write(f"{uttid} {_scp_path_for_shard(noisy[uttid], noisy_scp_path)}\n")
+        shards.append((shard_dir, shard_clean, shard_noisy, len(uttids)))
+    return uttid_order, shards
+
+
+def _worker(args):
+    """分片行程：固定執行緒數後執行 evaluate_model，寫出分片 CSV 與中繼資料"""
+    import torch
+
+    torch.set_num_threads(args.threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    from evaluate_best_model import evaluate_model, write_results_csv
+
+    shard_dir = Path(args.shard_dir)
+    start = time.perf_counter()
+    results, _ = evaluate_model(
+        args.checkpoint,
+        config_path=args.config,
+        save_audio=not args.no_save_audio,
+        output_dir=str(shard_dir),
+        batch_size=args.batch_size,
+        max_batch_samples=args.max_batch_samples,
+        length_tolerance=args.length_tolerance,
+        writer_workers=args.writer_workers,
+        write_envelopes=args.write_envelopes,
+        clean_scp_path=str(shard_dir / 'valid_clean.scp'),
+        noisy_scp_path=str(shard_dir / 'valid_noisy.scp'),
+    )
+    elapsed = time.perf_counter() - start
+
+    write_results_csv(shard_dir / SHARD_RESULTS, results['per_utterance'])
+    with open(shard_dir / SHARD_META, 'w') as f:
+        json.dump({
+            'epoch': results['epoch'],
+            'num_samples': results['num_samples'],
+            'output_dir': results.get('output_dir'),
+            'seconds': elapsed,
+            'threads': args.threads,
+        }, f, indent=2)
+
+
+def run_shards(checkpoint_path, config_path, shards, threads_per_worker=1, save_audio=True,
+               batch_size=1, max_batch_samples=None, length_tolerance=0, writer_workers=2,
+               write_envelopes=False):
+    """
+    為每個分片啟動一個評估行程並等待全部完成
+
+    子行程設定 OMP/MKL 執行緒數並隱藏 GPU，輸出寫入各分片目錄的 worker.log
+
+    Returns:
+        list: 各分片的中繼資料 (shard_meta.json 內容)
+    """
+    env = dict(os.environ)
+    env.update({
+        'OMP_NUM_THREADS': str(threads_per_worker),
+        'MKL_NUM_THREADS': str(threads_per_worker),
+        'CUDA_VISIBLE_DEVICES': '',
+    })
+    command = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--checkpoint', str(checkpoint_path), '--config', str(config_path),
+               '--threads', str(threads_per_worker),
+               '--batch-size', str(batch_size), '--length-tolerance', str(length_tolerance),
+               '--writer-workers', str(writer_workers)]
+    if max_batch_samples is not None:
+        command += ['--max-batch-samples', str(max_batch_samples)]
+    if not save_audio:
+        command.append('--no-save-audio')
+    if write_envelopes:
+        command.append('--write-envelopes')
+
+    processes = []
+    for shard_dir, _, _, _ in shards:
+        log = open(shard_dir / 'worker.log', 'w')
+        process = subprocess.Popen(command + ['--shard-dir', str(shard_dir)],
+                                   stdout=log, stderr=subprocess.STDOUT, env=env)
+        processes.append((shard_dir, process, log))
+
+    failed = []
+    for shard_dir, process, log in processes:
+        process.wait()
+        log.close()
+        if process.returncode != 0:
+            failed.append(shard_dir)
+    if failed:
+        raise RuntimeError("分片評估失敗 (詳見 worker.log): " + ', '.join(str(d) for d in failed))
+
+    metas = []
+    for shard_dir, _, _, _ in shards:
+        with open(shard_dir / SHARD_META, 'r') as f:
+            metas.append(json.load(f))
+    return metas
+
+
+def read_shard_rows(csv_path):
+    """
+    讀取分片 CSV (以 csv 模組解析，uttid 含逗號或引號時同樣正確)
+
+    Returns:
+        (header, rows): header 為欄位名稱列表，rows 為 uttid → 欄位文字列表 (保留原始數值文字)
+    """
+    with open(csv_path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        rows = {row[0]: row for row in reader if row}
+    return header, rows
+
+
+def merge_shards(shards, metas, uttid_order, result_dir, save_audio=True,
+                 checkpoint_path=None, model_config=None):
+    """
+    合併各分片結果到 result_dir
+
+    - evaluation_results.csv: 依原 scp 順序串接分片 CSV 的原始列
+    - enhanced/noisy/clean: 由分片目錄移入
+    - highlights.txt、summary.json 與 evaluation_results.npz: 由合併後的數值重新計算
+
+    Returns:
+        dict: 與 evaluate_model 相同欄位的統計結果
+    """
+    from evaluate_best_model import write_highlights, RESULT_FIELDNAMES
+
+    result_dir = Path(result_dir)
+    result_dir.mkdir(parents=True, exist_ok=True)
+
+    header = None
+    rows = {}
+    for shard_dir, _, _, _ in shards:
+        shard_header, shard_rows = read_shard_rows(shard_dir / SHARD_RESULTS)
+        header = header or shard_header
+        rows.update(shard_rows)
+
+    # 依原順序輸出；評估失敗的樣本 (不在任何分片結果中) 直接略過，與單行程相同
+    ordered = [rows[uttid] for uttid in uttid_order if uttid in rows]
+    csv_path = result_dir / 'evaluation_results.csv'
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header or RESULT_FIELDNAMES)
+        writer.writerows(ordered)
+
+    audio_results = []
+    for uttid, noisy, enhanced, improvement in ordered:
+        audio_results.append({
+            'uttid': uttid,
+            'si_snr_noisy': float(noisy),
+            'si_snr_enhanced': float(enhanced),
+            'improvement': float(improvement),
+        })
+
+    if save_audio:
+        for meta in metas:
+            if not meta.get('output_dir'):
+                continue
+            for sub in ('enhanced', 'noisy', 'clean'):
+                target = result_dir / sub
+                target.mkdir(exist_ok=True)
+                # WAV 與其包絡 (<uttid>.envelope.npz) 一起搬移
+                for path in (Path(meta['output_dir']) / sub).glob('*'):
+                    if path.suffix in ('.wav', '.npz'):
+                        shutil.move(str(path), str(target / path.name))
+    if audio_results:
+        write_highlights(result_dir / 'highlights.txt', audio_results)
+
+    si_snr_noisy_list = [r['si_snr_noisy'] for r in audio_results]
+    si_snr_enhanced_list = [r['si_snr_enhanced'] for r in audio_results]
+    si_snr_improvements = [r['improvement'] for r in audio_results]
+    results = {
+        'epoch': metas[0]['epoch'] if metas else None,
+        'num_samples': len(audio_results),
+        'num_shards': len(shards),
+        'shard_seconds': [meta['seconds'] for meta in metas],
+        'output_dir': str(result_dir),
+    }
+    if audio_results:
+        results.update({
+            'si_snr_noisy_mean': float(np.mean(si_snr_noisy_list)),
+            'si_snr_enhanced_mean': float(np.mean(si_snr_enhanced_list)),
+            'si_snr_improvement_mean': float(np.mean(si_snr_improvements)),
+            'si_snr_improvement_std': float(np.std(si_snr_improvements)),
+            'si_snr_improvement_max': float(np.max(si_snr_improvements)),
+            'si_snr_improvement_min': float(np.min(si_snr_improvements)),
+        })
+    else:
+        # 沒有任何成功樣本 (例如所有樣本載入失敗)：回報 0 筆，統計值為 None
+        results.update({key: None for key in (
+            'si_snr_noisy_mean', 'si_snr_enhanced_mean', 'si_snr_improvement_mean',
+            'si_snr_improvement_std', 'si_snr_improvement_max', 'si_snr_improvement_min')})
+    with open(result_dir / 'summary.json', 'w') as f:
+        json.dump(results, f, indent=2)
+    if audio_results:
+        write_result_store(result_dir, columns_from_rows(audio_results),
+                           run_metadata(checkpoint_path, {'epoch': results['epoch']}, model_config, results))
+    return results
+
+
+def sharded_evaluate(checkpoint_path, config_path, clean_scp_path, noisy_scp_path, output_dir,
+                     num_workers=4, threads_per_worker=1, save_audio=True, keep_shards=False,
+                     **eval_kwargs):
+    """
+    分片評估並合併結果
+
+    Args:
+        num_workers: 評估行程數
+        threads_per_worker: 每個行程的 torch/OMP 執行緒數
+        save_audio: 是否保存音訊
+        keep_shards: 保留分片目錄 (scp、分片 CSV、worker.log)
+        eval_kwargs: 傳給 evaluate_model 的 batch_size/max_batch_samples/length_tolerance/
+                     writer_workers/write_envelopes
+
+    Returns:
+        (results, wall_seconds)
+    """
+    import yaml
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    shard_root = Path(output_dir) / f'shards_{timestamp}_{os.getpid()}'
+    uttid_order, shards = split_scp(clean_scp_path, noisy_scp_path, num_workers, shard_root)
+    if not shards:
+        raise ValueError(f"scp 中沒有成對的樣本: {clean_scp_path}, {noisy_scp_path}")
+    print(f"📦 {len(uttid_order)} 個樣本分為 {len(shards)} 個分片 "
+          f"({', '.join(str(n) for _, _, _, n in shards)})，每行程 {threads_per_worker} 執行緒")
+
+    start = time.perf_counter()
+    metas = run_shards(checkpoint_path, config_path, shards, threads_per_worker, save_audio, **eval_kwargs)
+    wall = time.perf_counter() - start
+
+    result_dir = Path(output_dir) / f"epoch_{metas[0]['epoch']}_best_{timestamp}"
+    with open(config_path, 'r') as f:
+        model_config = yaml.safe_load(f)['model']
+    results = merge_shards(shards, metas, uttid_order, result_dir, save_audio, checkpoint_path, model_config)
+    results['checkpoint'] = str(checkpoint_path)
+    results['wall_seconds'] = wall
+    if not keep_shards:
+        shutil.rmtree(shard_root, ignore_errors=True)
+    return results, wall
+
+
+def print_results(results):
+    print("\n" + "=" * 80)
+    print(f"📊 評估結果 (合併 {results['num_shards']} 個分片)")
+    print("=" * 80)
+    print(f"成功評估樣本數: {results['num_samples']}")
+    if results['num_samples'] == 0:
+        print("⚠️  沒有成功評估的樣本 (詳見各分片 worker.log)")
+        print("=" * 80)
+        return
+    print()
+    print("SI-SNR 統計:")
+    print(f"  噪音音訊 (基準):        {results['si_snr_noisy_mean']:>8.2f} dB")
+    print(f"  增強音訊:               {results['si_snr_enhanced_mean']:>8.2f} dB")
+    print(f"  平均改善:               {results['si_snr_improvement_mean']:>8.2f} dB")
+    print(f"  改善標準差:             {results['si_snr_improvement_std']:>8.2f} dB")
+    print(f"  最佳改善:               {results['si_snr_improvement_max']:>8.2f} dB")
+    print(f"  最差改善:               {results['si_snr_improvement_min']:>8.2f} dB")
+    print(f"\n⏱️  總時間 {results['wall_seconds']:.1f} 秒；各分片 "
+          + ', '.join(f"{s:.1f}" for s in results['shard_seconds']) + " 秒")
+    print(f"💾 結果已保存: {results['output_dir']}")
+    print("=" * 80)
+
+
+def benchmark_scaling(checkpoint_path, config_path, clean_scp_path, noisy_scp_path, output_dir,
+                      worker_counts=(1, 2, 4, 8), threads_per_worker=1, save_audio=False, **eval_kwargs):
+    """
+    以不同行程數執行分片評估，比較總時間、加速比與合併結果是否與 1 行程一致
+    """
+    runs = []
+    reference = None
+    for num_workers in worker_counts:
+        results, wall = sharded_evaluate(checkpoint_path, config_path, clean_scp_path, noisy_scp_path,
+                                         output_dir, num_workers, threads_per_worker, save_audio,
+                                         **eval_kwargs)
+        with open(Path(results['output_dir']) / 'evaluation_results.csv', 'rb') as f:
+            content = f.read()
+        if reference is None:
+            reference = content
+        runs.append((num_workers, wall, results['num_samples'], content == reference))
+
+    cpu_count = os.cpu_count()
+    print("\n" + "=" * 80)
+    print(f"分片評估擴展性 (每行程 {threads_per_worker} 執行緒, CPU 核心數 {cpu_count})")
+    print("=" * 80)
+    print(f"{'行程數':>8} {'總時間 (s)':>12} {'樣本/秒':>10} {'加速比':>8} {'效率':>8} {'結果一致':>10}")
+    print("-" * 80)
+    base = runs[0][1]
+    for num_workers, wall, num_samples, identical in runs:
+        speedup = base / max(wall, 1e-9)
+        print(f"{num_workers:>8} {wall:>12.2f} {num_samples / max(wall, 1e-9):>10.2f} "
+              f"{speedup:>7.2f}x {speedup / num_workers * runs[0][0]:>7.0%} "
+              f"{'✅' if identical else '❌':>10}")
+    if max(worker_counts) * threads_per_worker > cpu_count:
+        print(f"\n⚠️  行程數 x 執行緒數超過 CPU 核心數 ({cpu_count})，較大的設定會互相搶佔")
+    return runs
+
+
+if __name__ == '__main__':
+    from evaluate_best_model import VALID_CLEAN_SCP, VALID_NOISY_SCP
+
+    parser = argparse.ArgumentParser(description='多行程分片 CPU 評估並合併結果')
+    parser.add_argument('--checkpoint', type=str,
+                       default='/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth',
+                       help='檢查點路徑 (訓練檢查點或 .bundle.pt)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--clean-scp', type=str, default=VALID_CLEAN_SCP, help='驗證集 clean scp')
+    parser.add_argument('--noisy-scp', type=str, default=VALID_NOISY_SCP, help='驗證集 noisy scp')
+    parser.add_argument('--output-dir', type=str, default='/workspace/experiments/inference_results',
+                       help='推理結果輸出根目錄')
+    parser.add_argument('--workers', type=int, default=4, help='評估行程數 (default: 4)')
+    parser.add_argument('--threads', type=int, default=1, help='每個行程的執行緒數 (default: 1)')
+    parser.add_argument('--no-save-audio', action='store_true', help='不保存音訊')
+    parser.add_argument('--keep-shards', action='store_true', help='保留分片目錄')
+    parser.add_argument('--batch-size', type=int, default=1, help='批次大小 (default: 1)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批補零後總取樣點數上限 (default: 不限制)')
+    parser.add_argument('--length-tolerance', type=int, default=0,
+                       help='同一批次內允許的長度差 (default: 0)')
+    parser.add_argument('--writer-workers', type=int, default=2,
+                       help='每個行程背景寫入音訊的執行緒數 (default: 2)')
+    parser.add_argument('--write-envelopes', action='store_true',
+                       help='為長音訊預先寫出波形包絡 (default: 不寫，繪圖時才建立)')
+    parser.add_argument('--benchmark', action='store_true', help='比較不同行程數的擴展性')
+    parser.add_argument('--benchmark-workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                       help='擴展性測試的行程數 (default: 1 2 4 8)')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--shard-dir', type=str, default=None, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args)
+        sys.exit(0)
+
+    if not os.path.exists(args.checkpoint):
+        print(f"❌ 找不到檢查點: {args.checkpoint}")
+        sys.exit(1)
+
+    eval_kwargs = {
+        'batch_size': args.batch_size,
+        'max_batch_samples': args.max_batch_samples,
+        'length_tolerance': args.length_tolerance,
+        'writer_workers': args.writer_workers,
+        'write_envelopes': args.write_envelopes,
+    }
+    if args.benchmark:
+        benchmark_scaling(args.checkpoint, args.config, args.clean_scp, args.noisy_scp, args.output_dir,
+                          args.benchmark_workers, args.threads, not args.no_save_audio, **eval_kwargs)
+    else:
+        results, _ = sharded_evaluate(args.checkpoint, args.config, args.clean_scp, args.noisy_scp,
+                                      args.output_dir, args.workers, args.threads,
+                                      not args.no_save_audio, args.keep_shards, **eval_kwargs)
+        print_results(results)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+批次 SI-SNR 計算引擎
+一次計算 (B, T) 批次的 SI-SNR (支援長度遮罩)，並在設備上累積統計量，
+只有在需要報告時才與主機同步
+
+使用方式:
+    python scripts/si_snr_metrics.py --batch 32 --length 8000   # CPU 微基準測試
+"""
+
+import time
+import argparse
+
+import torch
+
+# CPU 上每次處理的元素上限，讓中間張量留在快取內
+CPU_CHUNK_ELEMENTS = 1 << 16
+# 一段容納不到這麼多列 (樣本較長) 時，逐列處理有效區段比遮罩批次更快
+CPU_MIN_CHUNK_ROWS = 16
+
+
+def calculate_si_snr(estimate, reference, eps=1e-8):
+    """計算 SI-SNR (Scale-Invariant Signal-to-Noise Ratio)"""
+    # 確保是一維張量
+    if estimate.dim() > 1:
+        estimate = estimate.squeeze()
+    if reference.dim() > 1:
+        reference = reference.squeeze()
+    
+    # 移除均值
+    estimate = estimate - estimate.mean()
+    reference = reference - reference.mean()
+    
+    # 計算投影
+    reference_energy = torch.sum(reference ** 2) + eps
+    projection = torch.sum(estimate * reference) * reference / reference_energy
+    
+    # 計算噪音
+    noise = estimate - projection
+    
+    # 計算 SI-SNR
+    si_snr = 10 * torch.log10(
+        torch.sum(projection ** 2) / (torch.sum(noise ** 2) + eps) + eps
+    )
+    
+    return si_snr.item()
+
+
+def batch_si_snr(estimate, reference, lengths=None, eps=1e-8):
+    """
+    計算批次 SI-SNR (Scale-Invariant Signal-to-Noise Ratio)
+
+    與 calculate_si_snr 的公式相同，但一次處理整個批次且不呼叫 .item()
+
+    Args:
+        estimate: (B, T) 估計訊號
+        reference: (B, T) 參考訊號
+        lengths: (B,) 每個樣本的有效長度，None 表示全部有效
+        eps: 數值穩定項
+
+    Returns:
+        (B,) SI-SNR (dB)，仍在原設備上
+    """
+    if estimate.dim() == 1:
+        estimate = estimate.unsqueeze(0)
+    if reference.dim() == 1:
+        reference = reference.unsqueeze(0)
+    if lengths is not None:
+        lengths = torch.as_tensor(lengths, device=estimate.device)
+
+    # CPU 上短樣本分段處理，避免整批中間張量超出快取；長樣本逐列只處理有效區段；GPU 上一次處理整批
+    if estimate.device.type == 'cpu':
+        rows = CPU_CHUNK_ELEMENTS // max(1, estimate.shape[-1])
+        if rows < CPU_MIN_CHUNK_ROWS:
+            return _row_si_snr(estimate, reference, lengths, eps)
+        scores = []
+        for b in range(0, estimate.shape[0], rows):
+            chunk_estimate = estimate[b:b + rows]
+            chunk_reference = reference[b:b + rows]
+            chunk_lengths = None
+            if lengths is not None:
+                # CPU 上讀取長度不需要同步，直接裁掉補零區段，等長時省略遮罩
+                chunk_lengths = lengths[b:b + rows]
+                max_len = int(chunk_lengths.max())
+                chunk_estimate = chunk_estimate[:, :max_len]
+                chunk_reference = chunk_reference[:, :max_len]
+                if int(chunk_lengths.min()) == max_len:
+                    chunk_lengths = None
+            scores.append(_batch_si_snr(chunk_estimate, chunk_reference, chunk_lengths, eps))
+        return torch.cat(scores)
+    return _batch_si_snr(estimate, reference, lengths, eps)
+
+
+def _row_si_snr(estimate, reference, lengths, eps):
+    """CPU 逐列計算：依長度切出有效區段 (不需遮罩)，內積以 torch.dot 計算"""
+    lengths = [estimate.shape[-1]] * estimate.shape[0] if lengths is None else lengths.tolist()
+    scores = []
+    for b, n in enumerate(lengths):
+        e = estimate[b, :n]
+        r = reference[b, :n]
+        e = e - e.mean()
+        r = r - r.mean()
+        reference_energy = torch.dot(r, r) + eps
+        scale = torch.dot(e, r) / reference_energy
+        noise = e - scale * r
+        scores.append(10 * torch.log10(
+            scale * scale * (reference_energy - eps) / (torch.dot(noise, noise) + eps) + eps
+        ))
+    return torch.stack(scores)
+
+
+def _batch_si_snr(estimate, reference, lengths, eps):
+    if lengths is None:
+        mask = None
+        counts = torch.full((estimate.shape[0], 1), estimate.shape[-1],
+                            dtype=estimate.dtype, device=estimate.device)
+    else:
+        positions = torch.arange(estimate.shape[-1], device=estimate.device)
+        mask = positions.unsqueeze(0) >= lengths.unsqueeze(1)  # True 為補零區段
+        counts = lengths.to(estimate.dtype).unsqueeze(1)
+        estimate = estimate.masked_fill(mask, 0.0)
+        reference = reference.masked_fill(mask, 0.0)
+
+    # 移除均值 (只計算有效區段)
+    estimate = estimate - estimate.sum(dim=-1, keepdim=True) / counts
+    reference = reference - reference.sum(dim=-1, keepdim=True) / counts
+    if mask is not None:
+        estimate.masked_fill_(mask, 0.0)
+        reference.masked_fill_(mask, 0.0)
+
+    # 計算投影係數
+    reference_energy = torch.sum(reference * reference, dim=-1) + eps
+    scale = torch.sum(estimate * reference, dim=-1) / reference_energy
+
+    # 計算噪音 (estimate - scale * reference)，投影能量直接由係數求得
+    noise = torch.addcmul(estimate, reference, scale.unsqueeze(-1), value=-1.0)
+    projection_energy = scale * scale * (reference_energy - eps)
+
+    return 10 * torch.log10(
+        projection_energy / (torch.sum(noise * noise, dim=-1) + eps) + eps
+    )
+
+
+class SISNRAccumulator:
+    """
+    在設備上累積噪音/增強 SI-SNR 與改善量的統計
+
+    update() 不會觸發主機同步；report() 與 per_utterance() 才會把資料搬回 CPU
+    """
+
+    FIELDS = ('si_snr_noisy', 'si_snr_enhanced', 'improvement')
+
+    def __init__(self, device=None):
+        self.device = torch.device(device) if device is not None else torch.device('cpu')
+        self._indices = []
+        self._noisy = []
+        self._enhanced = []
+        # 依序為 noisy / enhanced / improvement
+        self._sum = torch.zeros(3, dtype=torch.float64, device=self.device)
+        self._sq_sum = torch.zeros(3, dtype=torch.float64, device=self.device)
+        self._min = torch.full((3,), float('inf'), dtype=torch.float64, device=self.device)
+        self._max = torch.full((3,), float('-inf'), dtype=torch.float64, device=self.device)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def update(self, si_snr_noisy, si_snr_enhanced, indices=None):
+        """
+        加入一個批次的分數
+
+        Args:
+            si_snr_noisy: (B,) 噪音音訊 SI-SNR
+            si_snr_enhanced: (B,) 增強音訊 SI-SNR
+            indices: 長度 B 的樣本索引 (用於之後還原每個樣本的結果)
+        """
+        si_snr_noisy = si_snr_noisy.detach().reshape(-1).to(self.device)
+        si_snr_enhanced = si_snr_enhanced.detach().reshape(-1).to(self.device)
+        if indices is None:
+            indices = range(self._count, self._count + si_snr_noisy.shape[0])
+
+        self._indices.extend(indices)
+        self._noisy.append(si_snr_noisy)
+        self._enhanced.append(si_snr_enhanced)
+        self._count += si_snr_noisy.shape[0]
+
+        values = torch.stack([si_snr_noisy, si_snr_enhanced,
+                              si_snr_enhanced - si_snr_noisy]).to(torch.float64)
+        self._sum += values.sum(dim=1)
+        self._sq_sum += (values ** 2).sum(dim=1)
+        self._min = torch.minimum(self._min, values.min(dim=1).values)
+        self._max = torch.maximum(self._max, values.max(dim=1).values)
+
+    def report(self):
+        """回傳目前的統計 (同步一次)"""
+        if self._count == 0:
+            return {'count': 0}
+        stats = torch.stack([self._sum, self._sq_sum, self._min, self._max]).cpu().tolist()
+        sums, sq_sums, mins, maxs = stats
+        report = {'count': self._count}
+        for k, field in enumerate(self.FIELDS):
+            mean = sums[k] / self._count
+            report[f'{field}_mean'] = mean
+            report[f'{field}_std'] = max(sq_sums[k] / self._count - mean ** 2, 0.0) ** 0.5
+            report[f'{field}_min'] = mins[k]
+            report[f'{field}_max'] = maxs[k]
+        return report
+
+    def per_utterance(self):
+        """
+        取回每個樣本的分數 (同步一次)
+
+        Returns:
+            dict: 索引 → (si_snr_noisy, si_snr_enhanced, improvement)，
+                  improvement 在主機上以 Python float 相減，與逐樣本版本一致
+        """
+        if self._count == 0:
+            return {}
+        noisy = torch.cat(self._noisy).cpu().tolist()
+        enhanced = torch.cat(self._enhanced).cpu().tolist()
+        return {
+            i: (n, e, e - n)
+            for i, n, e in zip(self._indices, noisy, enhanced)
+        }
+
+
+def run_benchmark(batch=32, length=8000, repeats=20):
+    """在 CPU 上比較逐樣本 calculate_si_snr 與 batch_si_snr"""
+    torch.manual_seed(0)
+    clean = torch.randn(batch, length)
+    noisy = clean + 0.5 * torch.randn(batch, length)
+    lengths = torch.randint(length // 2, length + 1, (batch,))
+
+    # 逐樣本版本 (每個樣本呼叫一次 .item() 同步)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        reference = [calculate_si_snr(noisy[b, :lengths[b]], clean[b, :lengths[b]])
+                     for b in range(batch)]
+    per_item = (time.perf_counter() - start) / repeats
+
+    # 批次版本 (累積在設備上，最後才同步)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        accumulator = SISNRAccumulator()
+        scores = batch_si_snr(noisy, clean, lengths)
+        accumulator.update(scores, scores)
+        accumulator.report()
+    batched = (time.perf_counter() - start) / repeats
+
+    max_diff = (batch_si_snr(noisy, clean, lengths) - torch.tensor(reference)).abs().max().item()
+
+    print("=" * 80)
+    print(f"SI-SNR 微基準測試 (CPU, batch={batch}, length={length}, repeats={repeats})")
+    print("=" * 80)
+    print(f"  逐樣本 calculate_si_snr: {per_item * 1000:>10.3f} ms / 批次")
+    print(f"  batch_si_snr:            {batched * 1000:>10.3f} ms / 批次")
+    print(f"  加速比:                  {per_item / batched:>10.2f}x")
+    print(f"  最大差異:                {max_diff:>10.2e} dB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批次 SI-SNR 微基準測試')
+    parser.add_argument('--batch', type=int, default=32, help='批次大小 (default: 32)')
+    parser.add_argument('--length', type=int, default=8000, help='樣本長度 (default: 8000)')
+    parser.add_argument('--repeats', type=int, default=20, help='重複次數 (default: 20)')
+
+    args = parser.parse_args()
+
+    run_benchmark(batch=args.batch, length=args.length, repeats=args.repeats)
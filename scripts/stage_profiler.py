@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+評估流程的階段計時
+以 profiler.stage('forward') 包住各階段 (資料載入、解碼、重取樣、前向傳播、SI-SNR、寫檔)，
+彙整每個階段的次數、總時間與 p50/p95/p99，可選擇匯出 Chrome/Perfetto trace
+(chrome://tracing 或 ui.perfetto.dev 開啟)，並同時包一層 torch.profiler
+
+- 停用時 stage() 回傳共用的空 context manager，評估迴圈不需要另外判斷
+- 外部程式碼 (例如資料集內的 sf.read / librosa.resample) 以 instrument() 暫時替換函式來計時
+- 分位數使用 streaming_stats.TDigest，記憶體與樣本數無關；trace 事件數有上限
+
+使用方式:
+    profiler = StageProfiler(trace_path='trace.json')
+    with profiler.instrument(soundfile, 'read', 'decode'):
+        with profiler.stage('forward'):
+            enhanced = model(noisy)
+    profiler.close()
+    print(profiler.report())
+"""
+
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager, nullcontext, ExitStack
+
+from streaming_stats import RunningStats, TDigest
+
+_NULL_STAGE = nullcontext()
+
+
+class StageProfiler:
+    """
+    各階段耗時統計與 trace 紀錄
+
+    Args:
+        enabled: False 時所有 hook 都不做事
+        trace_path: Chrome trace JSON 輸出路徑 (None 表示不記錄事件)
+        max_trace_events: trace 事件上限，超過後只統計不記錄
+        torch_profile: 同時啟用 torch.profiler，trace 另存為 <trace_path>.torch.json
+        synchronize: 每個階段結束前呼叫的同步函式 (例如 torch.cuda.synchronize)，
+                     讓非同步的 GPU 計算算在正確的階段
+    """
+
+    def __init__(self, enabled=True, trace_path=None, max_trace_events=1000000,
+                 torch_profile=False, synchronize=None):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.max_trace_events = max_trace_events
+        self.synchronize = synchronize
+        self.num_dropped_events = 0
+        self._stats = {}  # 階段 → (RunningStats, TDigest, 待加入的耗時)
+        self._events = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._wall_time = None
+        self._torch_profiler = None
+        if enabled and torch_profile:
+            import torch
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self._torch_profiler = torch.profiler.profile(activities=activities)
+            self._torch_profiler.__enter__()
+
+    def stage(self, name):
+        """計時一個階段的 context manager"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        record_function = None
+        if self._torch_profiler is not None:
+            import torch
+            record_function = torch.profiler.record_function(name)
+            record_function.__enter__()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.synchronize is not None:
+                self.synchronize()
+            end = time.perf_counter()
+            if record_function is not None:
+                record_function.__exit__(None, None, None)
+            self.record(name, start, end)
+
+    def record(self, name, start, end):
+        """記錄一段已量測的時間 (perf_counter 秒)"""
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = (RunningStats(), TDigest(), [])
+            pending = entry[2]
+            pending.append(end - start)
+            if len(pending) >= 1024:
+                entry[0].update(pending)
+                entry[1].add(pending)
+                pending.clear()
+            if self.trace_path is not None:
+                if len(self._events) < self.max_trace_events:
+                    self._events.append((name, start, end - start, threading.get_ident()))
+                else:
+                    self.num_dropped_events += 1
+
+    @contextmanager
+    def instrument(self, owner, attr, name):
+        """
+        暫時以計時版本替換 owner.attr (模組函式或方法)，離開時還原
+
+        用於無法直接修改的程式碼，例如 instrument(soundfile, 'read', 'decode')
+        """
+        if not self.enabled:
+            yield
+            return
+        original = getattr(owner, attr)
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            with self._timed(name):
+                return original(*args, **kwargs)
+
+        setattr(owner, attr, timed)
+        try:
+            yield
+        finally:
+            setattr(owner, attr, original)
+
+    def instrument_all(self, targets):
+        """
+        一次替換多個函式
+
+        Args:
+            targets: [(owner, attr, 階段名稱)]；owner 為 None 的項目略過 (選用套件未安裝)
+        """
+        stack = ExitStack()
+        for owner, attr, name in targets:
+            if owner is not None and hasattr(owner, attr):
+                stack.enter_context(self.instrument(owner, attr, name))
+        return stack
+
+    def close(self):
+        """結束計時，停止 torch.profiler 並寫出 trace"""
+        if not self.enabled or self._wall_time is not None:
+            return
+        self._wall_time = time.perf_counter() - self._start
+        with self._lock:
+            for stats, digest, pending in self._stats.values():
+                if pending:
+                    stats.update(pending)
+                    digest.add(pending)
+                    pending.clear()
+        if self._torch_profiler is not None:
+            self._torch_profiler.__exit__(None, None, None)
+            if self.trace_path is not None:
+                self._torch_profiler.export_chrome_trace(f'{os.path.splitext(self.trace_path)[0]}.torch.json')
+        if self.trace_path is not None:
+            self.export_trace(self.trace_path)
+
+    def export_trace(self, path):
+        """寫出 Chrome trace event 格式 (complete events，時間單位 μs)"""
+        pid = os.getpid()
+        thread_ids = {}
+        events = []
+        for name, start, duration, thread in self._events:
+            tid = thread_ids.setdefault(thread, len(thread_ids))
+            events.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': round((start - self._start) * 1e6, 3), 'dur': round(duration * 1e6, 3)})
+        for thread, tid in thread_ids.items():
+            label = 'main' if thread == threading.main_thread().ident else f'thread-{tid}'
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': label}})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return path
+
+    def summary(self):
+        """
+        各階段統計 (時間單位 ms)
+
+        Returns:
+            dict: wall_time_s 與 stages (階段 → count/total_s/mean_ms/p50_ms/p95_ms/p99_ms/max_ms/share)；
+                  share 為佔總時間比例 (巢狀階段與背景執行緒會重疊，總和可能超過 1)
+        """
+        wall_time = self._wall_time if self._wall_time is not None else time.perf_counter() - self._start
+        stages = {}
+        with self._lock:
+            for name, (stats, digest, pending) in self._stats.items():
+                if pending:
+                    stats.update(pending)
+                    digest.add(pending)
+                    pending.clear()
+                p50, p95, p99 = digest.quantile([0.5, 0.95, 0.99]).tolist()
+                total = stats.mean * stats.count
+                stages[name] = {
+                    'count': stats.count,
+                    'total_s': round(total, 6),
+                    'mean_ms': round(stats.mean * 1e3, 4),
+                    'p50_ms': round(p50 * 1e3, 4),
+                    'p95_ms': round(p95 * 1e3, 4),
+                    'p99_ms': round(p99 * 1e3, 4),
+                    'max_ms': round(stats.max * 1e3, 4),
+                    'share': round(total / wall_time, 4) if wall_time > 0 else None,
+                }
+        summary = {'wall_time_s': round(wall_time, 6), 'stages': stages}
+        if self.trace_path is not None:
+            summary['trace'] = str(self.trace_path)
+            summary['dropped_trace_events'] = self.num_dropped_events
+        return summary
+
+    def report(self):
+        """階段耗時表 (依總時間排序)"""
+        summary = self.summary()
+        lines = [f"{'階段':<12} {'次數':>8} {'總計(s)':>10} {'p50(ms)':>10} {'p95(ms)':>10} "
+                 f"{'p99(ms)':>10} {'佔比':>7}"]
+        stages = sorted(summary['stages'].items(), key=lambda item: -item[1]['total_s'])
+        for name, s in stages:
+            share = f"{s['share'] * 100:6.1f}%" if s['share'] is not None else '     -'
+            lines.append(f"{name:<12} {s['count']:>8} {s['total_s']:>10.3f} {s['p50_ms']:>10.2f} "
+                         f"{s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} {share:>7}")
+        lines.append(f"總時間: {summary['wall_time_s']:.2f} 秒")
+        return '\n'.join(lines)
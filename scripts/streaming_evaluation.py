@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+固定記憶體的串流評估 (大型測試集)
+evaluate_model 將所有樣本分數保留在列表中並排序取最佳/最差樣本，記憶體隨測試集大小成長。
+此路徑改為：
+
+- 以產生器逐行讀取 clean/noisy scp，逐一載入音訊 (不建立整個資料集)
+- 每批結果立即附加寫入 evaluation_results.csv
+- 平均/標準差線上計算，分位數以 t-digest 近似，最佳/最差樣本以固定大小的 heap 保留
+
+記憶體只與批次大小、t-digest 壓縮參數與 top_k 有關，百萬級樣本亦可執行
+
+使用方式:
+    python scripts/streaming_evaluation.py --checkpoint ckpt.pth --clean-scp test_clean.scp --noisy-scp test_noisy.scp
+    python scripts/streaming_evaluation.py --checkpoint ckpt.bundle.pt --batch-size 8 --save-audio
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+from pathlib import Path
+from datetime import datetime
+
+import torch
+
+from audio_io import resolve_audio_path, load_waveform
+from batched_inference import iter_length_buckets, pad_batch, unpad_batch
+from si_snr_metrics import batch_si_snr
+from audio_writer import AudioWriterPool
+from inference_bundle import is_bundle, load_bundle
+from streaming_stats import StreamingSummary, StreamingCSVWriter
+from evaluate_best_model import (build_model, load_checkpoint_weights, write_highlights,
+                                 RESULT_FIELDNAMES, VALID_CLEAN_SCP, VALID_NOISY_SCP)
+
+
+def _iter_scp(scp_path):
+    with open(scp_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                uttid, path = line.split(maxsplit=1)
+                yield uttid, path
+
+
+def iter_scp_pairs(clean_scp_path, noisy_scp_path, root=None):
+    """
+    同步逐行讀取 clean/noisy scp (兩者需為相同 uttid 順序)
+
+    Yields:
+        (uttid, clean_path, noisy_path)
+    """
+    noisy_iter = _iter_scp(noisy_scp_path)
+    for uttid, clean_path in _iter_scp(clean_scp_path):
+        noisy_uttid, noisy_path = next(noisy_iter, (None, None))
+        if noisy_uttid != uttid:
+            raise ValueError(f"clean/noisy scp 順序不一致: {uttid} vs {noisy_uttid} "
+                             f"(串流評估需要兩個 scp 依相同順序排列)")
+        yield (uttid,
+               resolve_audio_path(clean_path, clean_scp_path, root),
+               resolve_audio_path(noisy_path, noisy_scp_path, root))
+
+
+def iter_samples(pairs, target_sample_rate, normalize):
+    """
+    逐一載入音訊，載入失敗時跳過
+
+    Yields:
+        (index, noisy, clean, uttid): 與 evaluate_model 的樣本格式相同
+    """
+    for i, (uttid, clean_path, noisy_path) in enumerate(pairs):
+        try:
+            clean = load_waveform(clean_path, target_sample_rate, normalize)
+            noisy = load_waveform(noisy_path, target_sample_rate, normalize)
+        except Exception as e:
+            print(f"   ⚠️  樣本 {i} ({uttid}) 載入失敗: {e}")
+            continue
+        length = min(len(clean), len(noisy))
+        yield i, torch.from_numpy(noisy[:length]), torch.from_numpy(clean[:length]), uttid
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def streaming_evaluate(checkpoint_path, config_path, clean_scp_path, noisy_scp_path, output_dir,
+                       batch_size=1, max_batch_samples=None, length_tolerance=0,
+                       save_audio=False, writer_workers=4, writer_max_pending_mb=256, write_envelopes=False,
+                       top_k=5, compression=100, report_every=1000, root=None):
+    """
+    串流評估模型
+
+    Args:
+        checkpoint_path: 檢查點或 .bundle.pt
+        config_path: 訓練配置檔路徑
+        clean_scp_path, noisy_scp_path: 測試集 scp (相同 uttid 順序)
+        output_dir: 輸出根目錄
+        batch_size, max_batch_samples, length_tolerance: 同 evaluate_model 的批次設定
+        save_audio: 是否保存增強/噪音/乾淨音訊
+        write_envelopes: 同 evaluate_model，為長音訊預先寫出波形包絡
+        top_k: highlights.txt 的最佳/最差樣本數
+        compression: t-digest 壓縮參數
+        report_every: 每幾個樣本印出一次進度
+
+    Returns:
+        dict: 統計摘要 (含近似分位數與峰值記憶體)
+    """
+    import yaml
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    preprocessing = config['data']['preprocessing']
+    sample_rate = preprocessing['target_sample_rate']
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    if is_bundle(checkpoint_path):
+        model, bundle = load_bundle(checkpoint_path, device)
+        checkpoint = bundle['source']
+    else:
+        model = build_model(config, device)
+        checkpoint = load_checkpoint_weights(model, checkpoint_path, device)
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    result_dir = Path(output_dir) / f"epoch_{checkpoint['epoch']}_stream_{timestamp}"
+    result_dir.mkdir(parents=True, exist_ok=True)
+    if save_audio:
+        audio_dirs = {name: result_dir / name for name in ('enhanced', 'noisy', 'clean')}
+        for d in audio_dirs.values():
+            d.mkdir(exist_ok=True)
+        audio_writer = AudioWriterPool(num_workers=writer_workers,
+                                       max_pending_bytes=writer_max_pending_mb * 1024 * 1024,
+                                       write_envelopes=write_envelopes)
+
+    summary = StreamingSummary(top_k=top_k, compression=compression)
+    csv_writer = StreamingCSVWriter(result_dir / 'evaluation_results.csv', RESULT_FIELDNAMES)
+    num_failed = 0
+    next_report = report_every
+
+    def score(bucket, enhanced_list):
+        """計算一批的 SI-SNR，結果立即寫出並更新串流統計"""
+        nonlocal next_report
+        min_lens = [min(e.shape[0], item[2].shape[0]) for e, item in zip(enhanced_list, bucket)]
+        noisy_batch, lengths = pad_batch([item[1][:n] for item, n in zip(bucket, min_lens)], device=device)
+        clean_batch, _ = pad_batch([item[2][:n] for item, n in zip(bucket, min_lens)], device=device)
+        enhanced_batch, _ = pad_batch([e[:n] for e, n in zip(enhanced_list, min_lens)])
+        si_snr_noisy = batch_si_snr(noisy_batch, clean_batch, lengths).tolist()
+        si_snr_enhanced = batch_si_snr(enhanced_batch, clean_batch, lengths).tolist()
+
+        rows = [{'uttid': item[3], 'si_snr_noisy': n, 'si_snr_enhanced': e, 'improvement': e - n}
+                for item, n, e in zip(bucket, si_snr_noisy, si_snr_enhanced)]
+        csv_writer.write_rows(rows)
+        summary.update(rows)
+
+        if save_audio:
+            for item, enhanced, n in zip(bucket, enhanced_list, min_lens):
+                uttid = item[3]
+                audio_writer.submit(audio_dirs['enhanced'] / f"{uttid}.wav", enhanced[:n].cpu().numpy(), sample_rate)
+                audio_writer.submit(audio_dirs['noisy'] / f"{uttid}.wav", item[1][:n].numpy(), sample_rate)
+                audio_writer.submit(audio_dirs['clean'] / f"{uttid}.wav", item[2][:n].numpy(), sample_rate)
+
+        while len(summary) >= next_report:
+            stats = summary.stats['improvement']
+            print(f"   處理進度: {len(summary)} (平均改善: {stats.mean:.2f} dB, "
+                  f"峰值記憶體 {_peak_rss_mb():.0f} MB)")
+            next_report += report_every
+
+    samples = iter_samples(iter_scp_pairs(clean_scp_path, noisy_scp_path, root),
+                           sample_rate, preprocessing.get('normalize_audio', True))
+    batched = batch_size > 1 or max_batch_samples is not None
+    if batched:
+        buckets = iter_length_buckets(samples, batch_size=batch_size if batch_size > 1 else None,
+                                      max_batch_samples=max_batch_samples, length_tolerance=length_tolerance)
+    else:
+        buckets = ([item] for item in samples)
+
+    print(f"\n🔬 開始串流評估 (batch_size={batch_size}, max_batch_samples={max_batch_samples})...")
+    start = time.perf_counter()
+    try:
+        with torch.no_grad():
+            for bucket in buckets:
+                try:
+                    noisy_batch, lengths = pad_batch([item[1] for item in bucket], device=device)
+                    score(bucket, unpad_batch(model(noisy_batch), lengths))
+                except Exception as e:
+                    num_failed += len(bucket)
+                    print(f"   ⚠️  批次 ({len(bucket)} 個樣本: {bucket[0][3]}...) 評估失敗: {e}")
+    finally:
+        csv_writer.close()
+        if save_audio:
+            write_errors = audio_writer.close()
+            if write_errors:
+                print(f"   ⚠️  {len(write_errors)} 個音訊檔案寫入失敗:")
+                for path, e in write_errors[:10]:
+                    print(f"      {path}: {e}")
+    elapsed = time.perf_counter() - start
+
+    report = summary.report()
+    report.update({
+        'checkpoint': str(checkpoint_path),
+        'epoch': checkpoint['epoch'],
+        'num_failed': num_failed,
+        'seconds': elapsed,
+        'peak_rss_mb': _peak_rss_mb(),
+        'output_dir': str(result_dir),
+    })
+    if len(summary) > 0:
+        write_highlights(result_dir / 'highlights.txt', summary.highlights())
+    with open(result_dir / 'summary.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_report(report):
+    print("\n" + "=" * 80)
+    print("📊 串流評估結果")
+    print("=" * 80)
+    print(f"成功評估樣本數: {report['count']} (失敗 {report['num_failed']})")
+    if report['count'] == 0:
+        return
+    print()
+    print("SI-SNR 統計:")
+    print(f"  噪音音訊 (基準):        {report['si_snr_noisy_mean']:>8.2f} dB")
+    print(f"  增強音訊:               {report['si_snr_enhanced_mean']:>8.2f} dB")
+    print(f"  平均改善:               {report['improvement_mean']:>8.2f} dB")
+    print(f"  改善標準差:             {report['improvement_std']:>8.2f} dB")
+    print(f"  最佳改善:               {report['improvement_max']:>8.2f} dB")
+    print(f"  最差改善:               {report['improvement_min']:>8.2f} dB")
+    print()
+    print("改善量分位數 (t-digest 近似):")
+    for q in StreamingSummary.QUANTILES:
+        key = f'improvement_p{int(round(q * 100))}'
+        print(f"  {key[len('improvement_'):]:<24}{report[key]:>8.2f} dB")
+    print(f"\n⏱️  {report['seconds']:.1f} 秒, 峰值記憶體 {report['peak_rss_mb']:.0f} MB")
+    print(f"💾 結果已保存: {report['output_dir']}")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='固定記憶體的串流評估 (大型測試集)')
+    parser.add_argument('--checkpoint', type=str,
+                       default='/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_100_best.pth',
+                       help='檢查點路徑 (訓練檢查點或 .bundle.pt)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--clean-scp', type=str, default=VALID_CLEAN_SCP, help='測試集 clean scp')
+    parser.add_argument('--noisy-scp', type=str, default=VALID_NOISY_SCP, help='測試集 noisy scp')
+    parser.add_argument('--root', type=str, default=None, help='scp 相對路徑的根目錄')
+    parser.add_argument('--output-dir', type=str, default='/workspace/experiments/inference_results',
+                       help='推理結果輸出根目錄')
+    parser.add_argument('--batch-size', type=int, default=1, help='批次大小 (default: 1)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批補零後總取樣點數上限 (default: 不限制)')
+    parser.add_argument('--length-tolerance', type=int, default=0,
+                       help='同一批次內允許的長度差 (default: 0)')
+    parser.add_argument('--save-audio', action='store_true', help='保存增強/噪音/乾淨音訊')
+    parser.add_argument('--writer-workers', type=int, default=4,
+                       help='背景寫入音訊的執行緒數 (default: 4)')
+    parser.add_argument('--write-envelopes', action='store_true',
+                       help='為長音訊預先寫出波形包絡 (default: 不寫，繪圖時才建立)')
+    parser.add_argument('--top-k', type=int, default=5, help='最佳/最差樣本數 (default: 5)')
+    parser.add_argument('--compression', type=int, default=100, help='t-digest 壓縮參數 (default: 100)')
+    parser.add_argument('--report-every', type=int, default=1000, help='進度回報間隔 (default: 1000)')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.checkpoint):
+        print(f"❌ 找不到檢查點: {args.checkpoint}")
+        sys.exit(1)
+
+    report = streaming_evaluate(
+        args.checkpoint, args.config, args.clean_scp, args.noisy_scp, args.output_dir,
+        batch_size=args.batch_size, max_batch_samples=args.max_batch_samples,
+        length_tolerance=args.length_tolerance, save_audio=args.save_audio,
+        writer_workers=args.writer_workers, write_envelopes=args.write_envelopes, top_k=args.top_k, compression=args.compression,
+        report_every=args.report_every, root=args.root,
+    )
+    print_report(report)
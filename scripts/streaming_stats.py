@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+固定記憶體的串流統計
+評估百萬級樣本時不保留逐樣本列表：
+
+- RunningStats: 線上平均/標準差/最小/最大 (Welford，批次間以 Chan 公式合併)
+- TDigest: 近似分位數 (merging t-digest，質心數量只與 compression 有關)
+- BoundedTopK: 以 heap 保留分數最高的 k 筆
+- StreamingSummary: 組合以上三者，依樣本結果列更新
+- StreamingCSVWriter: 逐列附加寫入 CSV，定期 flush
+
+使用方式:
+    python scripts/streaming_stats.py --num-values 1000000   # 與 numpy 精確值比較
+"""
+
+import csv
+import math
+import heapq
+import time
+import argparse
+
+import numpy as np
+
+
+class RunningStats:
+    """線上計算平均、母體標準差 (同 np.std)、最小與最大值"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, values):
+        """加入一個或一批數值"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if values.size == 0:
+            return
+        n = values.size
+        batch_mean = float(values.mean())
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += batch_m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        """合併另一個 RunningStats (例如不同分片的結果)"""
+        if other.count == 0:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self._m2 += other._m2 + delta ** 2 * self.count * other.count / total
+        self.count = total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
+
+
+class TDigest:
+    """
+    Merging t-digest 近似分位數
+
+    新數值先放入緩衝區，滿了才與既有質心一起排序合併；質心大小受 k1 (arcsin) 尺度函數限制，
+    兩端的質心較小，因此尾端分位數 (p1/p99) 也相當準確。記憶體約為 O(compression)
+
+    Args:
+        compression: 壓縮參數 δ，質心數量上限約為 δ
+        buffer_size: 緩衝區大小 (None 表示 10 * compression)
+    """
+
+    def __init__(self, compression=100, buffer_size=None):
+        self.compression = compression
+        self.buffer_size = buffer_size or 10 * compression
+        self._means = np.zeros(0, dtype=np.float64)
+        self._weights = np.zeros(0, dtype=np.float64)
+        self._buffer = []
+        self._buffered = 0  # 緩衝區內的數值個數
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def __len__(self):
+        return self.count
+
+    def add(self, values):
+        """加入一個或一批數值 (權重皆為 1)"""
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if values.size == 0:
+            return
+        self._buffer.append(values)
+        self._buffered += values.size
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        if self._buffered >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other):
+        """合併另一個 t-digest 的質心"""
+        other._compress()
+        self._compress()
+        if other.count == 0:
+            return
+        self._means = np.concatenate([self._means, other._means])
+        self._weights = np.concatenate([self._weights, other._weights])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(force=True)
+
+    def _k_limit(self, q):
+        """q 處的質心可延伸到的分位數上限 (k1 尺度函數 k(q) + 1 的反函數)"""
+        k = self.compression / (2 * math.pi) * math.asin(2 * q - 1) + 1
+        if k >= self.compression / 4:
+            return 1.0
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self, force=False):
+        if not self._buffer and not force:
+            return
+        means = np.concatenate([self._means] + self._buffer)
+        weights = np.concatenate([self._weights] + [np.ones(b.size) for b in self._buffer])
+        self._buffer = []
+        self._buffered = 0
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        new_means, new_weights = [], []
+        cur_mean, cur_weight = means[0], weights[0]
+        weight_before = 0.0
+        limit = self._k_limit(0.0) * total
+        for mean, weight in zip(means[1:], weights[1:]):
+            if weight_before + cur_weight + weight <= limit:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                new_means.append(cur_mean)
+                new_weights.append(cur_weight)
+                weight_before += cur_weight
+                limit = self._k_limit(min(weight_before / total, 1.0)) * total
+                cur_mean, cur_weight = mean, weight
+        new_means.append(cur_mean)
+        new_weights.append(cur_weight)
+        self._means = np.array(new_means, dtype=np.float64)
+        self._weights = np.array(new_weights, dtype=np.float64)
+
+    @property
+    def num_centroids(self):
+        self._compress()
+        return len(self._means)
+
+    def quantile(self, q):
+        """
+        近似分位數
+
+        Args:
+            q: 0~1 的分位點 (純量或陣列)
+
+        Returns:
+            float 或 np.ndarray
+        """
+        self._compress()
+        if self.count == 0:
+            return float('nan') if np.isscalar(q) else np.full(np.shape(q), np.nan)
+        # 質心中心的累積權重位置，兩端以最小/最大值為錨點線性內插
+        centers = np.cumsum(self._weights) - self._weights / 2
+        xp = np.concatenate([[0.0], centers, [self.count]])
+        fp = np.concatenate([[self.min], self._means, [self.max]])
+        result = np.interp(np.asarray(q, dtype=np.float64) * self.count, xp, fp)
+        return float(result) if np.isscalar(q) else result
+
+
+class BoundedTopK:
+    """
+    以 min-heap 保留 key 最大的 k 筆資料 (記憶體 O(k))
+
+    Args:
+        k: 保留筆數
+        key: 由資料取出排序值的函式
+    """
+
+    def __init__(self, k, key):
+        self.k = k
+        self.key = key
+        self._heap = []
+        self._counter = 0  # 排序值相同時依加入順序，避免比較資料本身
+
+    def push(self, item):
+        entry = (self.key(item), self._counter, item)
+        self._counter += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self):
+        """依 key 由大到小排列的資料"""
+        return [entry[2] for entry in sorted(self._heap, key=lambda e: e[:2], reverse=True)]
+
+
+class StreamingSummary:
+    """
+    評估結果的串流摘要
+
+    每個欄位維護 RunningStats 與 TDigest；另以兩個 heap 保留改善量最高/最低的 top_k 個樣本
+
+    Args:
+        fields: 要統計的數值欄位
+        rank_field: 用來排序最佳/最差樣本的欄位
+        top_k: 最佳/最差樣本保留數
+        compression: t-digest 壓縮參數
+    """
+
+    QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+    def __init__(self, fields=('si_snr_noisy', 'si_snr_enhanced', 'improvement'),
+                 rank_field='improvement', top_k=5, compression=100):
+        self.fields = tuple(fields)
+        self.rank_field = rank_field
+        self.stats = {field: RunningStats() for field in self.fields}
+        self.digests = {field: TDigest(compression) for field in self.fields}
+        self.best = BoundedTopK(top_k, key=lambda r: r[rank_field])
+        self.worst = BoundedTopK(top_k, key=lambda r: -r[rank_field])
+
+    def __len__(self):
+        return self.stats[self.fields[0]].count
+
+    def update(self, rows):
+        """加入一批結果列 (dict，需包含 fields 中的欄位)"""
+        if not rows:
+            return
+        for field in self.fields:
+            values = [row[field] for row in rows]
+            self.stats[field].update(values)
+            self.digests[field].add(values)
+        for row in rows:
+            self.best.push(row)
+            self.worst.push(row)
+
+    def highlights(self):
+        """最佳與最差樣本 (合併後可直接交給 write_highlights)"""
+        return self.best.items() + self.worst.items()
+
+    def report(self):
+        """
+        Returns:
+            dict: count 與每個欄位的 mean/std/min/max 及 p1~p99 近似分位數
+        """
+        report = {'count': len(self)}
+        for field in self.fields:
+            stats = self.stats[field]
+            report[f'{field}_mean'] = stats.mean
+            report[f'{field}_std'] = stats.std
+            report[f'{field}_min'] = stats.min
+            report[f'{field}_max'] = stats.max
+            quantiles = self.digests[field].quantile(np.array(self.QUANTILES))
+            for q, value in zip(self.QUANTILES, quantiles):
+                report[f'{field}_p{int(round(q * 100))}'] = float(value)
+        return report
+
+
+class StreamingCSVWriter:
+    """
+    逐列附加寫入 CSV
+
+    Args:
+        path: 輸出路徑 (覆寫)
+        fieldnames: 欄位
+        flush_every: 每寫入幾列 flush 一次
+    """
+
+    def __init__(self, path, fieldnames, flush_every=256):
+        self.path = path
+        self.flush_every = flush_every
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+        self._writer.writeheader()
+        self._pending = 0
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+        self.rows_written += len(rows)
+        self._pending += len(rows)
+        if self._pending >= self.flush_every:
+            self._file.flush()
+            self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def run_check(num_values=1000000, chunk=1000, compression=100, seed=0):
+    """以偏態分佈的亂數比較串流統計與 numpy 精確值"""
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.normal(8.0, 3.0, num_values // 2),
+                             rng.gamma(2.0, 2.0, num_values - num_values // 2) - 5.0])
+    rng.shuffle(values)
+
+    stats = RunningStats()
+    digest = TDigest(compression)
+    start = time.perf_counter()
+    for offset in range(0, num_values, chunk):
+        stats.update(values[offset:offset + chunk])
+        digest.add(values[offset:offset + chunk])
+    elapsed = time.perf_counter() - start
+
+    print("=" * 80)
+    print(f"串流統計檢查 ({num_values} 個數值, 每批 {chunk}, compression={compression})")
+    print("=" * 80)
+    print(f"  平均:   串流 {stats.mean:>10.5f}   精確 {values.mean():>10.5f}")
+    print(f"  標準差: 串流 {stats.std:>10.5f}   精確 {values.std():>10.5f}")
+    print(f"  t-digest 質心數: {digest.num_centroids}")
+    print(f"\n  {'分位數':<8} {'t-digest':>12} {'精確':>12} {'秩誤差':>10}")
+    sorted_values = np.sort(values)
+    for q in StreamingSummary.QUANTILES:
+        approx = digest.quantile(q)
+        exact = np.quantile(values, q)
+        rank = np.searchsorted(sorted_values, approx) / num_values
+        print(f"  p{q * 100:<7g} {approx:>12.4f} {exact:>12.4f} {abs(rank - q):>10.2e}")
+    print(f"\n  處理時間: {elapsed:.2f} 秒 ({num_values / elapsed / 1e6:.2f} M 數值/秒)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='串流統計與 numpy 精確值比較')
+    parser.add_argument('--num-values', type=int, default=1000000, help='數值個數 (default: 1000000)')
+    parser.add_argument('--chunk', type=int, default=1000, help='每批數值數 (default: 1000)')
+    parser.add_argument('--compression', type=int, default=100, help='t-digest 壓縮參數 (default: 100)')
+
+    args = parser.parse_args()
+
+    run_check(args.num_values, args.chunk, args.compression)
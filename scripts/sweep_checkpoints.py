@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+多檢查點掃描評估
+驗證集音訊只讀取/重取樣一次並保留在記憶體 (或使用 waveform_cache 的快取)，
+噪音音訊的基準 SI-SNR 只計算一次；所有檢查點共用同一個模型實例，只替換權重。
+輸出每個樣本 × 每個檢查點的 SI-SNR 矩陣與各檢查點的摘要排名
+
+使用方式:
+    python scripts/sweep_checkpoints.py --checkpoints "/workspace/experiments/tfgridnetv2_rtx5090_baseline/checkpoint_epoch_*.pth"
+    python scripts/sweep_checkpoints.py --checkpoints a.pth b.pth --batch-size 16 --output-dir /workspace/experiments/sweeps
+"""
+
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import torch
+
+from evaluate_best_model import build_model, load_checkpoint_weights, AudioDataset
+from batched_inference import iter_length_buckets, pad_batch, unpad_batch
+from si_snr_metrics import batch_si_snr
+from inference_bundle import is_bundle, load_bundle_weights
+
+DEFAULT_CLEAN_SCP = '/workspace/TFG-Transfer-Package/data/scp/valid_clean_relative.scp'
+DEFAULT_NOISY_SCP = '/workspace/TFG-Transfer-Package/data/scp/valid_noisy_relative.scp'
+
+
+def expand_checkpoints(patterns):
+    """展開檢查點路徑/glob，保持指定順序並去除重複"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"⚠️  沒有符合的檢查點: {pattern}")
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def load_validation_set(dataset):
+    """
+    將驗證集一次載入記憶體
+
+    Returns:
+        list: (index, noisy, clean, uttid)，noisy/clean 已裁成相同長度
+    """
+    items = []
+    for i in range(len(dataset)):
+        try:
+            noisy, clean, uttid = dataset[i]
+        except Exception as e:
+            print(f"   ⚠️  樣本 {i} (unknown) 載入失敗: {e}")
+            continue
+        noisy = torch.as_tensor(noisy).reshape(-1).float()
+        clean = torch.as_tensor(clean).reshape(-1).float()
+        length = min(noisy.shape[0], clean.shape[0])
+        items.append((len(items), noisy[:length].contiguous(), clean[:length].contiguous(), uttid))
+    return items
+
+
+def _scores(estimates, cleans, device):
+    estimate_batch, lengths = pad_batch(estimates, device=device)
+    clean_batch, _ = pad_batch(cleans, device=device)
+    return batch_si_snr(estimate_batch, clean_batch, lengths)
+
+
+def baseline_scores(items, device, batch_size=64):
+    """噪音音訊相對乾淨音訊的 SI-SNR (與檢查點無關，只計算一次)"""
+    scores = np.full(len(items), np.nan)
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        values = _scores([item[1] for item in batch], [item[2] for item in batch], device)
+        scores[start:start + len(batch)] = values.double().cpu().numpy()
+    return scores
+
+
+def enhanced_scores(model, items, device, batch_size=8, max_batch_samples=None, length_tolerance=0):
+    """
+    以目前權重推理所有樣本並計算增強後的 SI-SNR
+
+    Returns:
+        np.ndarray: 每個樣本的 SI-SNR (失敗的樣本為 NaN)
+    """
+    scores = np.full(len(items), np.nan)
+    buckets = iter_length_buckets(items, batch_size=batch_size, max_batch_samples=max_batch_samples,
+                                  length_tolerance=length_tolerance)
+
+    def run(bucket):
+        noisy_batch, lengths = pad_batch([item[1] for item in bucket], device=device)
+        enhanced = unpad_batch(model(noisy_batch), lengths)
+        cleans = [item[2][:e.shape[0]] for item, e in zip(bucket, enhanced)]
+        values = _scores(enhanced, cleans, device).double().cpu().numpy()
+        for item, value in zip(bucket, values):
+            scores[item[0]] = value
+
+    with torch.no_grad():
+        for bucket in buckets:
+            try:
+                run(bucket)
+            except Exception as e:
+                # 整批失敗時退回逐樣本推理
+                print(f"   ⚠️  批次 ({len(bucket)} 個樣本) 推理失敗，改為逐樣本推理: {e}")
+                for item in bucket:
+                    try:
+                        run([item])
+                    except Exception as e:
+                        print(f"   ⚠️  樣本 {item[0]} ({item[3]}) 評估失敗: {e}")
+    return scores
+
+
+def load_weights(model, checkpoint_path, device, initial_state=None):
+    """
+    替換模型權重 (訓練檢查點或推理權重包)，回傳 epoch
+
+    Args:
+        initial_state: 剛建立模型時的 state_dict 副本；載入前先還原，
+                       檢查點缺少的鍵值 (strict=False) 才不會沿用上一個檢查點的權重
+    """
+    if initial_state is not None:
+        model.load_state_dict(initial_state)
+    if is_bundle(checkpoint_path):
+        return load_bundle_weights(model, checkpoint_path).get('epoch')
+    return load_checkpoint_weights(model, checkpoint_path, device).get('epoch')
+
+
+def sweep_checkpoints(checkpoint_paths, config, clean_scp=DEFAULT_CLEAN_SCP, noisy_scp=DEFAULT_NOISY_SCP,
+                      output_dir=None, batch_size=8, max_batch_samples=None, length_tolerance=0,
+                      cache_dir=None):
+    """
+    依序評估多個檢查點
+
+    Args:
+        checkpoint_paths: 檢查點路徑清單
+        config: 訓練配置
+        clean_scp, noisy_scp: 驗證集 scp
+        output_dir: 結果輸出目錄 (None 表示不寫檔)
+        batch_size, max_batch_samples, length_tolerance: 長度分桶批次推理參數
+        cache_dir: 指定時以 CachedAudioDataset 從波形快取讀取驗證集
+
+    Returns:
+        dict: uttids、checkpoints、epochs、noisy (N,)、enhanced (N, K) 與 summary
+    """
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    print(f"使用設備: {device}")
+
+    print(f"\n📊 載入驗證集 (只載入一次)...")
+    start = time.time()
+    if cache_dir is not None:
+        from waveform_cache import CachedAudioDataset
+        dataset = CachedAudioDataset(clean_scp, noisy_scp, config, cache_dir=cache_dir)
+    else:
+        dataset = AudioDataset(clean_scp_path=clean_scp, noisy_scp_path=noisy_scp, config=config)
+    items = load_validation_set(dataset)
+    noisy_scores = baseline_scores(items, device)
+    memory_mb = sum(item[1].nbytes + item[2].nbytes for item in items) / 1024 / 1024
+    print(f"   {len(items)} 個樣本, {memory_mb:.1f} MB, {time.time() - start:.1f} 秒")
+    print(f"   噪音音訊平均 SI-SNR: {np.nanmean(noisy_scores):.2f} dB")
+
+    model = build_model(config, device)
+    initial_state = {key: value.detach().clone() for key, value in model.state_dict().items()}
+    enhanced = np.full((len(items), len(checkpoint_paths)), np.nan)
+    epochs = []
+    for k, checkpoint_path in enumerate(checkpoint_paths):
+        print(f"\n🔬 [{k + 1}/{len(checkpoint_paths)}] {checkpoint_path}")
+        start = time.time()
+        try:
+            epochs.append(load_weights(model, checkpoint_path, device, initial_state))
+        except Exception as e:
+            print(f"   ❌ 載入失敗，略過: {e}")
+            epochs.append(None)
+            continue
+        enhanced[:, k] = enhanced_scores(model, items, device, batch_size, max_batch_samples,
+                                         length_tolerance)
+        improvement = enhanced[:, k] - noisy_scores
+        print(f"   平均改善: {np.nanmean(improvement):.2f} dB ({time.time() - start:.1f} 秒)")
+
+    summary = []
+    for k, checkpoint_path in enumerate(checkpoint_paths):
+        improvement = enhanced[:, k] - noisy_scores
+        valid = ~np.isnan(improvement)
+        summary.append({
+            'checkpoint': checkpoint_path,
+            'epoch': epochs[k],
+            'num_samples': int(valid.sum()),
+            'si_snr_enhanced_mean': float(np.mean(enhanced[valid, k])) if valid.any() else float('nan'),
+            'si_snr_improvement_mean': float(np.mean(improvement[valid])) if valid.any() else float('nan'),
+            'si_snr_improvement_std': float(np.std(improvement[valid])) if valid.any() else float('nan'),
+        })
+
+    results = {
+        'uttids': [item[3] for item in items],
+        'checkpoints': list(checkpoint_paths),
+        'epochs': epochs,
+        'noisy': noisy_scores,
+        'enhanced': enhanced,
+        'summary': summary,
+    }
+    print_summary(summary)
+    if output_dir is not None:
+        save_results(results, output_dir)
+    return results
+
+
+def print_summary(summary):
+    """依平均改善排序印出各檢查點結果"""
+    print("\n" + "=" * 80)
+    print("📊 檢查點排名 (依平均 SI-SNR 改善)")
+    print("=" * 80)
+    print(f"{'排名':<4} {'檢查點':<44} {'Epoch':>6} {'改善 (dB)':>10} {'標準差':>8}")
+    print("-" * 80)
+    ranked = sorted(summary, key=lambda s: -s['si_snr_improvement_mean']
+                    if not np.isnan(s['si_snr_improvement_mean']) else float('inf'))
+    for rank, s in enumerate(ranked, 1):
+        name = Path(s['checkpoint']).name
+        print(f"{rank:<4} {name:<44} {str(s['epoch']):>6} {s['si_snr_improvement_mean']:>10.2f} "
+              f"{s['si_snr_improvement_std']:>8.2f}")
+    print("=" * 80)
+
+
+def save_results(results, output_dir):
+    """
+    寫出結果：
+        sweep_matrix.csv: 每列一個樣本，欄位為 uttid、si_snr_noisy 與各檢查點的 si_snr_enhanced
+        sweep_summary.csv: 每個檢查點的摘要
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    result_dir = Path(output_dir) / f'sweep_{timestamp}'
+    result_dir.mkdir(parents=True, exist_ok=True)
+
+    columns = [Path(p).stem for p in results['checkpoints']]
+    matrix_path = result_dir / 'sweep_matrix.csv'
+    with open(matrix_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['uttid', 'si_snr_noisy'] + columns)
+        for i, uttid in enumerate(results['uttids']):
+            writer.writerow([uttid, results['noisy'][i]] + list(results['enhanced'][i]))
+
+    summary_path = result_dir / 'sweep_summary.csv'
+    with open(summary_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results['summary'][0].keys()))
+        writer.writeheader()
+        writer.writerows(results['summary'])
+
+    print(f"\n💾 結果已保存:")
+    print(f"   樣本 × 檢查點矩陣: {matrix_path}")
+    print(f"   摘要: {summary_path}")
+    return result_dir
+
+
+if __name__ == '__main__':
+    import yaml
+
+    parser = argparse.ArgumentParser(description='多檢查點掃描評估 (驗證集只載入一次)')
+    parser.add_argument('--checkpoints', type=str, nargs='+', required=True,
+                       help='檢查點路徑或 glob (可混用訓練檢查點與 .bundle.pt)')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--clean-scp', type=str, default=DEFAULT_CLEAN_SCP, help='驗證集 clean scp')
+    parser.add_argument('--noisy-scp', type=str, default=DEFAULT_NOISY_SCP, help='驗證集 noisy scp')
+    parser.add_argument('--output-dir', type=str, default='/workspace/experiments/inference_results',
+                       help='結果輸出根目錄')
+    parser.add_argument('--no-save', action='store_true', help='不寫出 CSV')
+    parser.add_argument('--batch-size', type=int, default=8, help='批次大小 (default: 8)')
+    parser.add_argument('--max-batch-samples', type=int, default=None,
+                       help='每批補零後總取樣點數上限 (default: 不限制)')
+    parser.add_argument('--length-tolerance', type=int, default=0,
+                       help='同一批次內允許的長度差，0 表示只合併等長樣本 (default: 0)')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                       help='使用 waveform_cache 的快取目錄讀取驗證集 (default: 以 AudioDataset 讀取)')
+
+    args = parser.parse_args()
+
+    checkpoint_paths = expand_checkpoints(args.checkpoints)
+    if not checkpoint_paths:
+        print("❌ 沒有可評估的檢查點")
+        sys.exit(1)
+    missing = [p for p in checkpoint_paths if not os.path.exists(p)]
+    if missing:
+        print(f"❌ 找不到檢查點: {', '.join(missing)}")
+        sys.exit(1)
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    print("=" * 80)
+    print(f"🎯 TF-GridNetV2 多檢查點掃描 ({len(checkpoint_paths)} 個檢查點)")
+    print("=" * 80)
+    sweep_checkpoints(
+        checkpoint_paths, config,
+        clean_scp=args.clean_scp,
+        noisy_scp=args.noisy_scp,
+        output_dir=None if args.no_save else args.output_dir,
+        batch_size=args.batch_size,
+        max_batch_samples=args.max_batch_samples,
+        length_tolerance=args.length_tolerance,
+        cache_dir=args.cache_dir,
+    )
+    print("\n✅ 掃描完成！")
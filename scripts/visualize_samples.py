@@ -1,207 +1,350 @@
 """
 視覺化代表性音訊樣本
-為 10 個關鍵樣本生成波形圖和頻譜圖比較
+為關鍵樣本生成波形圖和頻譜圖比較
+
+- 樣本：指定 uttid 列表，或依評估結果選出改善最多/最少的 k 個
+- 頻譜圖：STFT 參數 (n_fft / hop_length / win_length / window) 取自訓練配置，
+  每個音訊只計算一次，dB 頻譜快取在 visualizations/.spectrogram_cache (音訊或參數改變時重算)
+- 波形圖：使用 WAV 旁的 min/max 包絡 (waveform_envelope，缺少時自動建立)，只畫符合圖寬的解析度
+- 繪圖：以多行程平行輸出 (Agg 後端)
+
+使用方式:
+    python scripts/visualize_samples.py --result-dir <結果目錄>                     # 最佳/最差各 5 個
+    python scripts/visualize_samples.py --result-dir <結果目錄> --top-k 100 --bottom-k 100 --workers 8
+    python scripts/visualize_samples.py --result-dir <結果目錄> --uttids 00057 00130
 """
 
-import soundfile as sf
+import os
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import soundfile as sf
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import librosa
-import librosa.display
-from pathlib import Path
 
-# 樣本清單
-BEST_SAMPLES = ['00057', '00056', '00086', '00128', '00180']
-WORST_SAMPLES = ['00130', '00144', '00067', '00068', '00039']
+from result_store import load_results
+from waveform_envelope import load_envelope, envelope_for_width
+
+CACHE_DIR_NAME = '.spectrogram_cache'
+AUDIO_TYPES = ('noisy', 'enhanced', 'clean')
+# 固定版面 (tight_layout 與 bbox_inches='tight' 各需額外一次完整排版，佔繪圖時間大半)
+SUBPLOT_LAYOUT = {'left': 0.06, 'right': 0.98, 'bottom': 0.07, 'top': 0.95, 'hspace': 0.4}
+# PNG 壓縮等級 (預設 6 的編碼時間約為 1 的數倍，檔案只小約一成)
+PNG_KWARGS = {'pil_kwargs': {'compress_level': 1}}
 
 def load_audio(file_path):
     """載入音訊檔案"""
     audio, sr = sf.read(file_path)
     return audio, sr
 
-def plot_waveform_comparison(noisy, enhanced, clean, sr, uttid, improvement, output_path):
+def stft_params_from_config(config):
+    """訓練配置中模型使用的 STFT 參數"""
+    stft_config = config['model']['stft']
+    return {
+        'n_fft': stft_config['n_fft'],
+        'hop_length': stft_config['hop_length'],
+        'win_length': stft_config.get('win_length', stft_config['n_fft']),
+        'window': stft_config.get('window', 'hann'),
+    }
+
+def compute_spectrogram_db(audio, stft_params):
+    """幅度頻譜 (dB，以最大值為 0 dB)"""
+    import librosa
+
+    D = librosa.stft(np.asarray(audio, dtype=np.float32), n_fft=stft_params['n_fft'],
+                     hop_length=stft_params['hop_length'], win_length=stft_params['win_length'],
+                     window=stft_params['window'])
+    return librosa.amplitude_to_db(np.abs(D), ref=np.max).astype(np.float32)
+
+def _cache_key(paths, stft_params):
+    """音訊路徑、大小、修改時間與 STFT 參數的雜湊"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps(stft_params, sort_keys=True).encode())
+    for path in paths:
+        stat = os.stat(path)
+        h.update(f'{path}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    return h.hexdigest()
+
+def load_spectrograms(paths, stft_params, cache_dir=None):
+    """
+    讀取 (或計算並快取) noisy/enhanced/clean 的 dB 頻譜
+
+    Args:
+        paths: AUDIO_TYPES → 音訊路徑 (快取鍵；未命中時才載入音訊)
+
+    Returns:
+        (spectrograms, cached): AUDIO_TYPES → 頻譜陣列，以及是否命中快取
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = Path(cache_dir) / f'{_cache_key([paths[t] for t in AUDIO_TYPES], stft_params)}.npz'
+        if cache_path.exists():
+            with np.load(cache_path) as data:
+                return {t: data[t] for t in AUDIO_TYPES}, True
+
+    spectrograms = {t: compute_spectrogram_db(load_audio(paths[t])[0], stft_params) for t in AUDIO_TYPES}
+
+    if cache_path is not None:
+        tmp_path = cache_path.with_name(f'{cache_path.stem}.tmp-{os.getpid()}.npz')
+        np.savez(tmp_path, **spectrograms)
+        os.replace(tmp_path, cache_path)
+    return spectrograms, False
+
+def plot_waveform_comparison(paths, uttid, improvement, output_path, dpi=150):
     """
     繪製三個音訊的波形比較
+
+    依繪圖區域的像素寬度取用 min/max 包絡 (waveform_envelope)，
+    只畫出每個像素的振幅範圍，繪圖成本與錄音長度無關
+
+    Args:
+        paths: AUDIO_TYPES → 音訊路徑
     """
-    fig, axes = plt.subplots(3, 1, figsize=(14, 8))
-    
-    time_noisy = np.arange(len(noisy)) / sr
-    time_enhanced = np.arange(len(enhanced)) / sr
-    time_clean = np.arange(len(clean)) / sr
-    
-    # Noisy waveform
-    axes[0].plot(time_noisy, noisy, linewidth=0.5, color='#d62728')
-    axes[0].set_title(f'Noisy Audio (uttid: {uttid})', fontsize=12, fontweight='bold')
-    axes[0].set_ylabel('Amplitude')
-    axes[0].set_ylim(-1, 1)
-    axes[0].grid(True, alpha=0.3)
-    
-    # Enhanced waveform
-    axes[1].plot(time_enhanced, enhanced, linewidth=0.5, color='#2ca02c')
-    axes[1].set_title(f'Enhanced Audio (Improvement: {improvement:.2f} dB)', 
-                     fontsize=12, fontweight='bold')
-    axes[1].set_ylabel('Amplitude')
-    axes[1].set_ylim(-1, 1)
-    axes[1].grid(True, alpha=0.3)
-    
-    # Clean waveform
-    axes[2].plot(time_clean, clean, linewidth=0.5, color='#1f77b4')
-    axes[2].set_title('Clean Reference', fontsize=12, fontweight='bold')
+    figsize = (14, 8)
+    fig, axes = plt.subplots(3, 1, figsize=figsize)
+    fig.subplots_adjust(**SUBPLOT_LAYOUT)
+    num_pixels = figsize[0] * (SUBPLOT_LAYOUT['right'] - SUBPLOT_LAYOUT['left']) * dpi
+
+    panels = [
+        ('noisy', '#d62728', f'Noisy Audio (uttid: {uttid})'),
+        ('enhanced', '#2ca02c', f'Enhanced Audio (Improvement: {improvement:.2f} dB)'),
+        ('clean', '#1f77b4', 'Clean Reference'),
+    ]
+    for ax, (audio_type, color, title) in zip(axes, panels):
+        envelope = load_envelope(paths[audio_type])
+        times, lower, upper, is_raw = envelope_for_width(paths[audio_type], num_pixels, envelope=envelope)
+        if is_raw:
+            ax.plot(times, lower, linewidth=0.5, color=color)
+        else:
+            ax.fill_between(times, lower, upper, linewidth=0, color=color)
+        ax.set_xlim(0, envelope['num_samples'] / envelope['sample_rate'])
+        ax.set_title(title, fontsize=12, fontweight='bold')
+        ax.set_ylabel('Amplitude')
+        ax.set_ylim(-1, 1)
+        ax.grid(True, alpha=0.3)
     axes[2].set_xlabel('Time (seconds)')
-    axes[2].set_ylabel('Amplitude')
-    axes[2].set_ylim(-1, 1)
-    axes[2].grid(True, alpha=0.3)
-    
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    print(f"✅ 已儲存波形圖: {output_path.name}")
-
-def plot_spectrogram_comparison(noisy, enhanced, clean, sr, uttid, improvement, output_path):
+
+    fig.savefig(output_path, dpi=dpi, **PNG_KWARGS)
+    plt.close(fig)
+
+def plot_spectrogram_comparison(spectrograms, sr, hop_length, uttid, improvement, output_path, dpi=150):
     """
-    繪製三個音訊的頻譜圖比較
+    繪製三個音訊的頻譜圖比較 (使用預先計算的 dB 頻譜)
     """
     fig, axes = plt.subplots(3, 1, figsize=(14, 10))
-    
-    # 計算頻譜圖 (STFT)
-    n_fft = 512
-    hop_length = 256
-    
-    # Noisy spectrogram
-    D_noisy = librosa.stft(noisy, n_fft=n_fft, hop_length=hop_length)
-    D_noisy_db = librosa.amplitude_to_db(np.abs(D_noisy), ref=np.max)
-    img1 = librosa.display.specshow(D_noisy_db, sr=sr, hop_length=hop_length, 
-                                     x_axis='time', y_axis='hz', ax=axes[0], 
-                                     cmap='viridis')
-    axes[0].set_title(f'Noisy Spectrogram (uttid: {uttid})', fontsize=12, fontweight='bold')
-    axes[0].set_ylabel('Frequency (Hz)')
-    fig.colorbar(img1, ax=axes[0], format='%+2.0f dB')
-    
-    # Enhanced spectrogram
-    D_enhanced = librosa.stft(enhanced, n_fft=n_fft, hop_length=hop_length)
-    D_enhanced_db = librosa.amplitude_to_db(np.abs(D_enhanced), ref=np.max)
-    img2 = librosa.display.specshow(D_enhanced_db, sr=sr, hop_length=hop_length, 
-                                     x_axis='time', y_axis='hz', ax=axes[1], 
-                                     cmap='viridis')
-    axes[1].set_title(f'Enhanced Spectrogram (Improvement: {improvement:.2f} dB)', 
-                     fontsize=12, fontweight='bold')
-    axes[1].set_ylabel('Frequency (Hz)')
-    fig.colorbar(img2, ax=axes[1], format='%+2.0f dB')
-    
-    # Clean spectrogram
-    D_clean = librosa.stft(clean, n_fft=n_fft, hop_length=hop_length)
-    D_clean_db = librosa.amplitude_to_db(np.abs(D_clean), ref=np.max)
-    img3 = librosa.display.specshow(D_clean_db, sr=sr, hop_length=hop_length, 
-                                     x_axis='time', y_axis='hz', ax=axes[2], 
-                                     cmap='viridis')
-    axes[2].set_title('Clean Reference Spectrogram', fontsize=12, fontweight='bold')
+    fig.subplots_adjust(**{**SUBPLOT_LAYOUT, 'right': 1.0})
+
+    titles = {
+        'noisy': f'Noisy Spectrogram (uttid: {uttid})',
+        'enhanced': f'Enhanced Spectrogram (Improvement: {improvement:.2f} dB)',
+        'clean': 'Clean Reference Spectrogram',
+    }
+    for ax, audio_type in zip(axes, AUDIO_TYPES):
+        S_db = spectrograms[audio_type]
+        extent = [0, S_db.shape[1] * hop_length / sr, 0, sr / 2]
+        img = ax.imshow(S_db, origin='lower', aspect='auto', extent=extent,
+                        cmap='viridis', interpolation='nearest')
+        ax.set_title(titles[audio_type], fontsize=12, fontweight='bold')
+        ax.set_ylabel('Frequency (Hz)')
+        fig.colorbar(img, ax=ax, format='%+2.0f dB')
     axes[2].set_xlabel('Time (seconds)')
-    axes[2].set_ylabel('Frequency (Hz)')
-    fig.colorbar(img3, ax=axes[2], format='%+2.0f dB')
-    
-    plt.tight_layout()
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close()
-    print(f"✅ 已儲存頻譜圖: {output_path.name}")
-
-def process_sample(base_dir, uttid, improvement, output_dir):
+
+    fig.savefig(output_path, dpi=dpi, **PNG_KWARGS)
+    plt.close(fig)
+
+def process_sample(job):
     """
-    處理單一樣本：生成波形圖和頻譜圖
+    處理單一樣本：生成波形圖和頻譜圖 (在工作行程中執行)
+
+    Returns:
+        (uttid, cached, seconds)
     """
-    print(f"\n🔍 處理樣本: {uttid} (改善: {improvement:.2f} dB)")
-    
-    # 載入音訊
-    noisy_path = base_dir / 'noisy' / f'{uttid}.wav'
-    enhanced_path = base_dir / 'enhanced' / f'{uttid}.wav'
-    clean_path = base_dir / 'clean' / f'{uttid}.wav'
-    
-    noisy, sr = load_audio(noisy_path)
-    enhanced, _ = load_audio(enhanced_path)
-    clean, _ = load_audio(clean_path)
-    
+    base_dir, uttid, improvement, output_dir, stft_params, cache_dir, dpi = job
+    start = time.perf_counter()
+    paths = {t: Path(base_dir) / t / f'{uttid}.wav' for t in AUDIO_TYPES}
+
+    sr = sf.info(str(paths['noisy'])).samplerate
+    spectrograms, cached = load_spectrograms(paths, stft_params, cache_dir)
+
     # 生成波形圖
-    waveform_output = output_dir / f'{uttid}_waveform.png'
-    plot_waveform_comparison(noisy, enhanced, clean, sr, uttid, improvement, waveform_output)
-    
+    plot_waveform_comparison(paths, uttid, improvement, Path(output_dir) / f'{uttid}_waveform.png', dpi)
+
     # 生成頻譜圖
-    spectrogram_output = output_dir / f'{uttid}_spectrogram.png'
-    plot_spectrogram_comparison(noisy, enhanced, clean, sr, uttid, improvement, spectrogram_output)
+    plot_spectrogram_comparison(spectrograms, sr, stft_params['hop_length'], uttid, improvement,
+                                Path(output_dir) / f'{uttid}_spectrogram.png', dpi)
+    return uttid, cached, time.perf_counter() - start
+
+def select_samples(base_dir, uttids=None, top_k=5, bottom_k=5):
+    """
+    決定要視覺化的樣本
+
+    Args:
+        uttids: 指定的 uttid 列表 (指定時忽略 top_k/bottom_k)
+        top_k: 改善最多的樣本數
+        bottom_k: 改善最少的樣本數
+
+    Returns:
+        (sections, improvements): [(標題, uttid 列表)]，以及 uttid → 改善量
+    """
+    columns = load_results(base_dir, ['uttid', 'improvement'])
+    all_uttids = columns['uttid'].tolist()
+    all_improvements = columns['improvement']
+
+    if uttids:
+        index = {uttid: k for k, uttid in enumerate(all_uttids)}
+        missing = [uttid for uttid in uttids if uttid not in index]
+        if missing:
+            print(f"⚠️ 評估結果中找不到 {len(missing)} 個樣本: {', '.join(missing[:10])}")
+        uttids = [uttid for uttid in uttids if uttid in index]
+        improvements = {uttid: float(all_improvements[index[uttid]]) for uttid in uttids}
+        return [('🔍 指定樣本', uttids)], improvements
+
+    order = np.argsort(all_improvements, kind='stable').tolist()
+    best_idx = order[::-1][:top_k] if top_k > 0 else []
+    worst_idx = order[:bottom_k] if bottom_k > 0 else []
+    best = [all_uttids[k] for k in best_idx]
+    worst = [all_uttids[k] for k in worst_idx]
+    improvements = {all_uttids[k]: float(all_improvements[k]) for k in best_idx + worst_idx}
+    return [(f'🏆 最佳改善樣本 (Top {len(best)})', best),
+            (f'⚠️ 最差改善樣本 (Bottom {len(worst)})', worst)], improvements
+
+def render_report(base_dir, config, uttids=None, top_k=5, bottom_k=5, output_dir=None,
+                  num_workers=None, dpi=150, use_cache=True):
+    """
+    生成視覺化圖表與索引頁
+
+    Args:
+        base_dir: 推理結果目錄 (含 enhanced/noisy/clean 與評估結果)
+        config: 訓練配置 (dict)，提供 STFT 參數
+        output_dir: 圖表輸出目錄 (None 表示 base_dir/visualizations)
+        num_workers: 繪圖行程數 (None 表示 CPU 核心數)
+        dpi: 圖檔解析度
+        use_cache: 是否使用/寫入 dB 頻譜快取
+    """
+    base_dir = Path(base_dir)
+    output_dir = Path(output_dir) if output_dir else base_dir / 'visualizations'
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cache_dir = None
+    if use_cache:
+        cache_dir = output_dir / CACHE_DIR_NAME
+        cache_dir.mkdir(exist_ok=True)
+    stft_params = stft_params_from_config(config)
+
+    sections, improvements = select_samples(base_dir, uttids, top_k, bottom_k)
+    ordered = list(dict.fromkeys(uttid for _, section in sections for uttid in section))
+    num_workers = min(num_workers or os.cpu_count() or 1, max(len(ordered), 1))
 
-def main():
-    # 設定路徑
-    base_dir = Path('/workspace/experiments/inference_results/epoch_100_best_20251111_034908')
-    output_dir = base_dir / 'visualizations'
-    output_dir.mkdir(exist_ok=True)
-    
     print(f"📊 開始生成視覺化圖表...")
     print(f"輸出目錄: {output_dir}")
-    
-    # 讀取 CSV 取得改善量
-    import csv
-    csv_path = base_dir / 'evaluation_results.csv'
-    improvements = {}
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            improvements[row['uttid']] = float(row['improvement'])
-    
-    # 處理最佳樣本
-    print("\n" + "="*60)
-    print("🏆 處理最佳改善樣本 (Top 5)")
-    print("="*60)
-    for uttid in BEST_SAMPLES:
-        process_sample(base_dir, uttid, improvements[uttid], output_dir)
-    
-    # 處理最差樣本
-    print("\n" + "="*60)
-    print("⚠️ 處理最差改善樣本 (Bottom 5)")
-    print("="*60)
-    for uttid in WORST_SAMPLES:
-        process_sample(base_dir, uttid, improvements[uttid], output_dir)
-    
+    print(f"樣本數: {len(ordered)}, 繪圖行程數: {num_workers}, "
+          f"STFT: n_fft={stft_params['n_fft']} hop={stft_params['hop_length']} "
+          f"win={stft_params['win_length']} ({stft_params['window']})")
+
+    jobs = [(str(base_dir), uttid, improvements[uttid], str(output_dir), stft_params,
+             str(cache_dir) if cache_dir else None, dpi) for uttid in ordered]
+    start = time.perf_counter()
+    num_cached = 0
+    failed = []
+    if num_workers > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as pool:
+            futures = [(job[1], pool.submit(process_sample, job)) for job in jobs]
+            outcomes = []
+            for uttid, future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    failed.append((uttid, e))
+    else:
+        outcomes = []
+        for job in jobs:
+            try:
+                outcomes.append(process_sample(job))
+            except Exception as e:
+                failed.append((job[1], e))
+    for uttid, cached, seconds in outcomes:
+        num_cached += cached
+        print(f"✅ {uttid} (改善: {improvements[uttid]:+.2f} dB) "
+              f"{'頻譜快取' if cached else '計算頻譜'} {seconds:.2f} 秒")
+    for uttid, e in failed:
+        print(f"⚠️ {uttid} 視覺化失敗: {e}")
+    elapsed = time.perf_counter() - start
+
     print("\n" + "="*60)
-    print("✅ 完成！共生成 20 張圖表 (10 波形圖 + 10 頻譜圖)")
+    print(f"✅ 完成！共生成 {2 * len(outcomes)} 張圖表 ({len(outcomes)} 波形圖 + {len(outcomes)} 頻譜圖)")
+    print(f"⏱️  {elapsed:.1f} 秒 (頻譜快取命中 {num_cached}/{len(outcomes)})")
     print(f"📁 儲存位置: {output_dir}")
     print("="*60)
-    
+
     # 生成索引頁
-    create_visualization_index(output_dir, BEST_SAMPLES, WORST_SAMPLES, improvements)
+    done = {outcome[0] for outcome in outcomes}
+    sections = [(title, [uttid for uttid in section if uttid in done]) for title, section in sections]
+    create_visualization_index(output_dir, sections, improvements, base_dir.name)
+    return output_dir
 
-def create_visualization_index(output_dir, best_samples, worst_samples, improvements):
+def create_visualization_index(output_dir, sections, improvements, experiment_name=''):
     """
     生成視覺化索引 Markdown 檔案
+
+    Args:
+        sections: [(標題, uttid 列表)]
     """
     index_path = output_dir / 'VISUALIZATION_INDEX.md'
-    
+
     with open(index_path, 'w') as f:
         f.write("# 視覺化圖表索引\n\n")
-        f.write("**實驗**: rtx5090-soundfile-5000ep (Epoch 100)\n")
-        f.write("**生成日期**: 2025-11-11\n\n")
+        if experiment_name:
+            f.write(f"**實驗**: {experiment_name}\n")
+        f.write(f"**生成日期**: {time.strftime('%Y-%m-%d')}\n\n")
         f.write("---\n\n")
-        
-        # 最佳樣本
-        f.write("## 🏆 最佳改善樣本\n\n")
-        for uttid in best_samples:
-            imp = improvements[uttid]
-            f.write(f"### {uttid} (改善: {imp:+.2f} dB)\n\n")
-            f.write(f"**波形比較**:\n")
-            f.write(f"![{uttid} Waveform](./{uttid}_waveform.png)\n\n")
-            f.write(f"**頻譜圖比較**:\n")
-            f.write(f"![{uttid} Spectrogram](./{uttid}_spectrogram.png)\n\n")
-            f.write("---\n\n")
-        
-        # 最差樣本
-        f.write("## ⚠️ 最差改善樣本\n\n")
-        for uttid in worst_samples:
-            imp = improvements[uttid]
-            f.write(f"### {uttid} (改善: {imp:+.2f} dB)\n\n")
-            f.write(f"**波形比較**:\n")
-            f.write(f"![{uttid} Waveform](./{uttid}_waveform.png)\n\n")
-            f.write(f"**頻譜圖比較**:\n")
-            f.write(f"![{uttid} Spectrogram](./{uttid}_spectrogram.png)\n\n")
-            f.write("---\n\n")
-    
+
+        for title, uttids in sections:
+            if not uttids:
+                continue
+            f.write(f"## {title}\n\n")
+            for uttid in uttids:
+                imp = improvements[uttid]
+                f.write(f"### {uttid} (改善: {imp:+.2f} dB)\n\n")
+                f.write(f"**波形比較**:\n")
+                f.write(f"![{uttid} Waveform](./{uttid}_waveform.png)\n\n")
+                f.write(f"**頻譜圖比較**:\n")
+                f.write(f"![{uttid} Spectrogram](./{uttid}_spectrogram.png)\n\n")
+                f.write("---\n\n")
+
     print(f"✅ 已生成索引檔案: {index_path.name}")
 
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(description='生成關鍵樣本的波形圖與頻譜圖')
+    parser.add_argument('--result-dir', type=str,
+                       default='/workspace/experiments/inference_results/epoch_100_best_20251111_034908',
+                       help='推理結果目錄路徑')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑 (STFT 參數)')
+    parser.add_argument('--uttids', type=str, nargs='+', default=None,
+                       help='指定要視覺化的 uttid (default: 依改善量選擇)')
+    parser.add_argument('--top-k', type=int, default=5, help='改善最多的樣本數 (default: 5)')
+    parser.add_argument('--bottom-k', type=int, default=5, help='改善最少的樣本數 (default: 5)')
+    parser.add_argument('--output-dir', type=str, default=None,
+                       help='圖表輸出目錄 (default: <結果目錄>/visualizations)')
+    parser.add_argument('--workers', type=int, default=None, help='繪圖行程數 (default: CPU 核心數)')
+    parser.add_argument('--dpi', type=int, default=150, help='圖檔解析度 (default: 150)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用頻譜快取')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+
+    render_report(args.result_dir, config, uttids=args.uttids, top_k=args.top_k, bottom_k=args.bottom_k,
+                  output_dir=args.output_dir, num_workers=args.workers, dpi=args.dpi,
+                  use_cache=not args.no_cache)
+
 if __name__ == '__main__':
     main()
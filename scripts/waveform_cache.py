@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+預處理波形快取 (memory-mapped shards)
+一次性將 scp 中的音訊解碼、重取樣、正規化後寫入連續的 shard 檔，並建立 offset 索引；
+CachedAudioDataset 之後直接從 memmap 切片取樣，不需每個 epoch 重新解碼與重取樣
+
+快取以 (target_sample_rate, normalize_audio, dtype, 解析後的音訊路徑) 的雜湊為目錄名稱，
+任何一項改變 (包括同一份 scp 以不同 root 解析) 都會自動建立新的快取
+
+使用方式:
+    python scripts/waveform_cache.py --config configs/training_rtx5090.yaml --cache-dir /workspace/cache/waveforms
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+from pathlib import Path
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from audio_io import read_paired_scp, load_waveform
+
+CACHE_VERSION = 2
+INT16_SCALE = 32767.0
+DEFAULT_CACHE_DIR = '/workspace/cache/waveforms'
+
+
+def cache_key(pairs, target_sample_rate, normalize, dtype):
+    """
+    依前處理設定與解析後的音訊路徑計算快取鍵值
+
+    Args:
+        pairs: read_paired_scp 的結果 [(uttid, clean_path, noisy_path)]；使用解析後的絕對路徑，
+               同一份 scp 以不同 root (或工作目錄) 解析到不同檔案時不會共用快取
+    """
+    h = hashlib.sha256()
+    settings = {
+        'version': CACHE_VERSION,
+        'target_sample_rate': target_sample_rate,
+        'normalize_audio': bool(normalize),
+        'dtype': dtype,
+    }
+    h.update(json.dumps(settings, sort_keys=True).encode())
+    for uttid, clean_path, noisy_path in pairs:
+        h.update(f'{uttid}\t{os.path.abspath(clean_path)}\t{os.path.abspath(noisy_path)}\n'.encode())
+    return h.hexdigest()[:16]
+
+
+def _encode(audio, dtype):
+    if dtype == 'int16':
+        return np.round(np.clip(audio, -1.0, 1.0) * INT16_SCALE).astype(np.int16)
+    return audio.astype(np.float32, copy=False)
+
+
+def _preprocess_pair(job):
+    """worker: 讀取並前處理一對 clean/noisy 音訊"""
+    uttid, clean_path, noisy_path, target_sample_rate, normalize = job
+    try:
+        clean = load_waveform(clean_path, target_sample_rate, normalize)
+        noisy = load_waveform(noisy_path, target_sample_rate, normalize)
+    except Exception as e:
+        return uttid, None, None, str(e)
+    return uttid, clean, noisy, None
+
+
+def build_cache(clean_scp_path, noisy_scp_path, target_sample_rate=16000, normalize=True,
+                cache_dir=DEFAULT_CACHE_DIR, dtype='float32', shard_size_mb=512,
+                num_workers=4, root=None):
+    """
+    建立 (或沿用) 波形快取
+
+    Args:
+        clean_scp_path, noisy_scp_path: 成對的 scp 檔
+        target_sample_rate: 重取樣目標取樣率
+        normalize: 是否峰值正規化
+        cache_dir: 快取根目錄
+        dtype: 'float32' 或 'int16' (int16 佔一半空間，讀取時再轉回 float32)
+        shard_size_mb: 每個 shard 的大小上限
+        num_workers: 前處理的行程數
+        root: scp 相對路徑的基準目錄
+
+    Returns:
+        Path: 快取目錄
+    """
+    if dtype not in ('float32', 'int16'):
+        raise ValueError(f"不支援的 dtype: {dtype}")
+
+    pairs = read_paired_scp(clean_scp_path, noisy_scp_path, root)
+    key = cache_key(pairs, target_sample_rate, normalize, dtype)
+    cache_path = Path(cache_dir) / key
+    if (cache_path / 'meta.json').exists():
+        return cache_path
+
+    print(f"\n🗂️  建立波形快取: {cache_path}")
+    jobs = [(uttid, str(c), str(n), target_sample_rate, normalize) for uttid, c, n in pairs]
+
+    # 先寫到暫存目錄，完成後再改名，避免中斷時留下不完整的快取
+    tmp_path = Path(cache_dir) / f'{key}.tmp-{os.getpid()}'
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    tmp_path.mkdir(parents=True)
+
+    shard_limit = shard_size_mb * 1024 * 1024
+    shard_id, shard_bytes = 0, 0
+    shard_file = open(tmp_path / f'shard_{shard_id:05d}.bin', 'wb')
+    index = {name: [] for name in ('uttid', 'clean_shard', 'clean_offset', 'clean_length',
+                                   'noisy_shard', 'noisy_offset', 'noisy_length')}
+    skipped = []
+    itemsize = np.dtype(dtype).itemsize
+
+    try:
+        with Pool(num_workers) as pool:
+            for k, (uttid, clean, noisy, error) in enumerate(
+                    pool.imap(_preprocess_pair, jobs, chunksize=4), 1):
+                if error is not None:
+                    print(f"   ⚠️  {uttid} 前處理失敗，略過: {error}")
+                    skipped.append(uttid)
+                    continue
+
+                index['uttid'].append(uttid)
+                for kind, audio in (('clean', clean), ('noisy', noisy)):
+                    data = _encode(audio, dtype)
+                    if shard_bytes > 0 and shard_bytes + data.nbytes > shard_limit:
+                        shard_file.close()
+                        shard_id, shard_bytes = shard_id + 1, 0
+                        shard_file = open(tmp_path / f'shard_{shard_id:05d}.bin', 'wb')
+                    data.tofile(shard_file)
+                    index[f'{kind}_shard'].append(shard_id)
+                    index[f'{kind}_offset'].append(shard_bytes // itemsize)
+                    index[f'{kind}_length'].append(data.shape[0])
+                    shard_bytes += data.nbytes
+
+                if k % 500 == 0:
+                    print(f"   處理進度: {k}/{len(jobs)}")
+    finally:
+        shard_file.close()
+
+    np.savez(tmp_path / 'index.npz',
+             uttid=np.array(index['uttid'], dtype=np.str_),
+             **{name: np.array(values, dtype=np.int64)
+                for name, values in index.items() if name != 'uttid'})
+    meta = {
+        'version': CACHE_VERSION,
+        'key': key,
+        'clean_scp': str(clean_scp_path),
+        'noisy_scp': str(noisy_scp_path),
+        'root': str(root) if root is not None else None,
+        'target_sample_rate': target_sample_rate,
+        'normalize_audio': bool(normalize),
+        'dtype': dtype,
+        'num_shards': shard_id + 1,
+        'num_utterances': len(index['uttid']),
+        'skipped': skipped,
+    }
+    with open(tmp_path / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # 其他行程已先建立相同快取
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    print(f"✅ 快取完成: {meta['num_utterances']} 對音訊, {meta['num_shards']} 個 shard"
+          + (f", 略過 {len(skipped)} 個" if skipped else ""))
+    return cache_path
+
+
+class CachedAudioDataset(Dataset):
+    """
+    從波形快取讀取的資料集，介面與 AudioDataset 相同 (回傳 noisy, clean, uttid)
+
+    Args:
+        clean_scp_path, noisy_scp_path: 成對的 scp 檔
+        config: 訓練配置 (使用 data.preprocessing 的設定)
+        cache_dir: 快取根目錄，快取不存在時會自動建立
+        dtype: 快取儲存格式 'float32' 或 'int16'
+        random_crop: 超過 max_audio_length 時隨機裁切 (訓練用)；False 時從頭裁切
+        num_workers: 建立快取時的行程數
+        root: scp 相對路徑的基準目錄
+        pad_to_max: 不足 max_audio_length 時補零；搭配 dynamic_batching.TokenBudgetBatchSampler
+                    時應設為 False，回傳實際長度，由 collate_padded 補零並記錄長度
+    """
+
+    def __init__(self, clean_scp_path, noisy_scp_path, config, cache_dir=DEFAULT_CACHE_DIR,
+                 dtype='float32', random_crop=False, num_workers=4, root=None, pad_to_max=True):
+        preprocessing = config['data']['preprocessing']
+        self.max_audio_length = preprocessing.get('max_audio_length')
+        self.random_crop = random_crop
+        self.pad_to_max = pad_to_max
+        self.cache_path = build_cache(
+            clean_scp_path, noisy_scp_path,
+            target_sample_rate=preprocessing['target_sample_rate'],
+            normalize=preprocessing.get('normalize_audio', True),
+            cache_dir=cache_dir, dtype=dtype, num_workers=num_workers, root=root,
+        )
+        with open(self.cache_path / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        with np.load(self.cache_path / 'index.npz') as index:
+            self.index = {name: index[name] for name in index.files}
+        self.uttids = [str(u) for u in self.index['uttid']]
+        self.dtype = np.dtype(self.meta['dtype'])
+        self._shards = None  # 每個 DataLoader worker 第一次取樣時才開啟 memmap
+
+    def __len__(self):
+        return len(self.uttids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = None
+        return state
+
+    def _open_shards(self):
+        # mode='c' (copy-on-write) 讓切片可寫，torch.from_numpy 可直接共用記憶體
+        self._shards = [
+            np.memmap(self.cache_path / f'shard_{k:05d}.bin', dtype=self.dtype, mode='c')
+            for k in range(self.meta['num_shards'])
+        ]
+
+    def _slice(self, kind, i, start, length):
+        if self._shards is None:
+            self._open_shards()
+        shard = self._shards[self.index[f'{kind}_shard'][i]]
+        offset = int(self.index[f'{kind}_offset'][i]) + start
+        data = shard[offset:offset + length]
+        if self.dtype == np.int16:
+            data = data.astype(np.float32) / INT16_SCALE
+        return torch.from_numpy(data)
+
+    def get_length(self, i):
+        """回傳第 i 個樣本的長度 (clean/noisy 取較短者)"""
+        return int(min(self.index['clean_length'][i], self.index['noisy_length'][i]))
+
+    def __getitem__(self, i):
+        length = self.get_length(i)
+        start = 0
+        target = length
+        if self.max_audio_length is not None and length > self.max_audio_length:
+            target = self.max_audio_length
+            if self.random_crop:
+                start = int(torch.randint(0, length - target + 1, (1,)))
+
+        clean = self._slice('clean', i, start, target)
+        noisy = self._slice('noisy', i, start, target)
+
+        # 不足 max_audio_length 時補零
+        if self.pad_to_max and self.max_audio_length is not None and target < self.max_audio_length:
+            pad = self.max_audio_length - target
+            clean = torch.nn.functional.pad(clean, (0, pad))
+            noisy = torch.nn.functional.pad(noisy, (0, pad))
+
+        return noisy, clean, self.uttids[i]
+
+
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(description='建立預處理波形快取')
+    parser.add_argument('--config', type=str, default='/workspace/configs/training_rtx5090.yaml',
+                       help='訓練配置檔路徑')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR, help='快取根目錄')
+    parser.add_argument('--dtype', type=str, default='float32', choices=['float32', 'int16'],
+                       help='儲存格式 (default: float32)')
+    parser.add_argument('--workers', type=int, default=4, help='前處理行程數 (default: 4)')
+    parser.add_argument('--root', type=str, default=None, help='scp 相對路徑的基準目錄')
+    parser.add_argument('--splits', type=str, nargs='+', default=['train', 'valid'],
+                       help='要建立快取的資料集 (default: train valid)')
+
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    preprocessing = config['data']['preprocessing']
+
+    for split in args.splits:
+        clean_scp = config['data'][f'{split}_clean_scp']
+        noisy_scp = config['data'][f'{split}_noisy_scp']
+        if not os.path.exists(clean_scp) or not os.path.exists(noisy_scp):
+            print(f"❌ 找不到 {split} scp: {clean_scp}, {noisy_scp}")
+            sys.exit(1)
+        cache_path = build_cache(
+            clean_scp, noisy_scp,
+            target_sample_rate=preprocessing['target_sample_rate'],
+            normalize=preprocessing.get('normalize_audio', True),
+            cache_dir=args.cache_dir, dtype=args.dtype, num_workers=args.workers, root=args.root,
+        )
+        print(f"📁 {split}: {cache_path}")
+
+
+if __name__ == '__main__':
+    main()
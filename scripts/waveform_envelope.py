@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+波形的多解析度 min/max 包絡
+每個 WAV 旁存一個 <uttid>.envelope.npz：第 0 層每 256 個樣本取一組 (min, max)，
+之後每層以 4 倍合併，直到區塊數不超過 256；繪圖時只讀取剛好符合像素寬度的那一層，
+因此繪圖成本只取決於圖寬，與錄音長度無關
+
+包絡記錄來源檔的大小與修改時間，WAV 被覆寫後會自動重建
+
+使用方式:
+    python scripts/waveform_envelope.py --result-dir <結果目錄>           # 為 enhanced/noisy/clean 建立包絡
+    python scripts/waveform_envelope.py --result-dir <結果目錄> --force   # 全部重建
+"""
+
+import os
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from result_store import read_result_store
+
+ENVELOPE_SUFFIX = '.envelope.npz'
+BASE_BLOCK = 256
+LEVEL_FACTOR = 4
+MIN_BLOCKS = 256
+# 短於此長度的音訊不預先寫包絡：圖寬 1024 像素時 envelope_for_width 直接讀取原始樣本，用不到包絡
+MIN_ENVELOPE_SAMPLES = BASE_BLOCK * MIN_BLOCKS * 4
+# 由檔案建立包絡時每次讀取的樣本數 (BASE_BLOCK 的倍數，記憶體用量固定)
+READ_BLOCK = BASE_BLOCK * 4096
+
+
+def envelope_path(wav_path):
+    """WAV 對應的包絡檔路徑"""
+    wav_path = Path(wav_path)
+    return wav_path.with_name(wav_path.stem + ENVELOPE_SUFFIX)
+
+
+def _block_minmax(audio, block):
+    """每 block 個樣本取 min/max (最後一個區塊可不足 block)"""
+    if len(audio) == 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    starts = np.arange(0, len(audio), block)
+    return (np.minimum.reduceat(audio, starts).astype(np.float32),
+            np.maximum.reduceat(audio, starts).astype(np.float32))
+
+
+def _as_mono(audio):
+    """(下緣, 上緣) 逐樣本序列；多聲道時取各聲道的最小/最大值"""
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim == 1:
+        return audio, audio
+    return audio.min(axis=1), audio.max(axis=1)
+
+
+def _build_levels(mins, maxs):
+    """由第 0 層逐層合併出金字塔"""
+    levels = [(mins, maxs)]
+    block = BASE_BLOCK
+    block_sizes = [block]
+    while len(levels[-1][0]) > MIN_BLOCKS:
+        prev_mins, prev_maxs = levels[-1]
+        starts = np.arange(0, len(prev_mins), LEVEL_FACTOR)
+        levels.append((np.minimum.reduceat(prev_mins, starts), np.maximum.reduceat(prev_maxs, starts)))
+        block *= LEVEL_FACTOR
+        block_sizes.append(block)
+    return levels, block_sizes
+
+
+def build_envelope(audio, sample_rate):
+    """
+    由記憶體中的波形建立包絡金字塔
+
+    Args:
+        audio: 波形 (samples,) 或 (samples, channels)
+        sample_rate: 取樣率
+
+    Returns:
+        dict: block_sizes、mins/maxs (每層一個陣列)、num_samples、sample_rate
+    """
+    lower, upper = _as_mono(audio)
+    mins, _ = _block_minmax(lower, BASE_BLOCK)
+    _, maxs = _block_minmax(upper, BASE_BLOCK)
+    levels, block_sizes = _build_levels(mins, maxs)
+    return {
+        'block_sizes': block_sizes,
+        'mins': [level[0] for level in levels],
+        'maxs': [level[1] for level in levels],
+        'num_samples': len(lower),
+        'sample_rate': int(sample_rate),
+    }
+
+
+def build_envelope_from_file(wav_path):
+    """分段讀取 WAV 建立包絡 (長錄音不需整段載入)"""
+    info = sf.info(str(wav_path))
+    mins, maxs = [], []
+    num_samples = 0
+    for block in sf.blocks(str(wav_path), blocksize=READ_BLOCK, dtype='float32', always_2d=True):
+        lower, upper = _as_mono(block)
+        mins.append(_block_minmax(lower, BASE_BLOCK)[0])
+        maxs.append(_block_minmax(upper, BASE_BLOCK)[1])
+        num_samples += len(block)
+    mins = np.concatenate(mins) if mins else np.zeros(0, dtype=np.float32)
+    maxs = np.concatenate(maxs) if maxs else np.zeros(0, dtype=np.float32)
+    levels, block_sizes = _build_levels(mins, maxs)
+    return {
+        'block_sizes': block_sizes,
+        'mins': [level[0] for level in levels],
+        'maxs': [level[1] for level in levels],
+        'num_samples': num_samples,
+        'sample_rate': int(info.samplerate),
+    }
+
+
+def write_envelope(wav_path, envelope):
+    """
+    將包絡寫到 WAV 旁 (WAV 必須已寫完，以記錄其大小與修改時間)
+
+    Returns:
+        Path: 包絡檔路徑
+    """
+    stat = os.stat(wav_path)
+    path = envelope_path(wav_path)
+    offsets = np.cumsum([0] + [len(m) for m in envelope['mins']])
+    tmp_path = path.with_name(path.name + '.tmp.npz')
+    np.savez(tmp_path,
+             mins=np.concatenate(envelope['mins']) if envelope['mins'] else np.zeros(0, np.float32),
+             maxs=np.concatenate(envelope['maxs']) if envelope['maxs'] else np.zeros(0, np.float32),
+             level_offsets=offsets,
+             block_sizes=np.array(envelope['block_sizes'], dtype=np.int64),
+             num_samples=envelope['num_samples'],
+             sample_rate=envelope['sample_rate'],
+             source_size=stat.st_size,
+             source_mtime_ns=stat.st_mtime_ns)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_envelope(wav_path):
+    """
+    讀取 WAV 的包絡；不存在或 WAV 已改變時回傳 None
+
+    包絡檔不壓縮，各層以 memmap 對應，繪圖時只會讀到用到的那一段
+    """
+    path = envelope_path(wav_path)
+    if not path.exists():
+        return None
+    stat = os.stat(wav_path)
+    data, _ = read_result_store(path)
+    if int(data['source_size']) != stat.st_size or int(data['source_mtime_ns']) != stat.st_mtime_ns:
+        return None
+    offsets = data['level_offsets'].tolist()
+    mins, maxs = data['mins'], data['maxs']
+    return {
+        'block_sizes': data['block_sizes'].tolist(),
+        'mins': [mins[offsets[k]:offsets[k + 1]] for k in range(len(offsets) - 1)],
+        'maxs': [maxs[offsets[k]:offsets[k + 1]] for k in range(len(offsets) - 1)],
+        'num_samples': int(data['num_samples']),
+        'sample_rate': int(data['sample_rate']),
+    }
+
+
+def load_envelope(wav_path, build=True):
+    """
+    讀取包絡，缺少或過期時由 WAV 重建並寫回
+
+    Args:
+        wav_path: WAV 路徑
+        build: 缺少時是否建立 (False 時回傳 None)
+    """
+    envelope = read_envelope(wav_path)
+    if envelope is None and build:
+        envelope = build_envelope_from_file(wav_path)
+        try:
+            write_envelope(wav_path, envelope)
+        except OSError:
+            pass  # 唯讀目錄仍可使用記憶體中的包絡
+    return envelope
+
+
+def _bucket_minmax(mins, maxs, num_buckets):
+    """將區塊再合併為 num_buckets 個等寬桶"""
+    starts = np.unique(np.linspace(0, len(mins), num_buckets, endpoint=False).astype(np.int64))
+    return starts, np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+
+
+def envelope_for_width(wav_path, num_pixels, start=0, end=None, envelope=None):
+    """
+    取得適合 num_pixels 像素寬的波形繪圖資料
+
+    樣本數不到像素數兩倍時回傳原始樣本；區塊比像素細時讀取原始片段
+    (最多 BASE_BLOCK × num_pixels 個樣本)；否則使用區塊數不少於像素數的最粗一層，
+    讀取量都只與 num_pixels 有關
+
+    Args:
+        wav_path: WAV 路徑
+        num_pixels: 繪圖區域的像素寬度
+        start, end: 樣本範圍 (end 為 None 表示到結尾)
+        envelope: 已載入的包絡 (None 表示自動讀取/建立)
+
+    Returns:
+        (times, lower, upper, is_raw): 時間 (秒)、下緣、上緣；is_raw 時 lower 與 upper 相同
+    """
+    envelope = envelope or load_envelope(wav_path)
+    sr = envelope['sample_rate']
+    end = envelope['num_samples'] if end is None else min(end, envelope['num_samples'])
+    start = max(0, min(start, end))
+    num_pixels = max(1, int(num_pixels))
+    length = end - start
+    samples_per_pixel = length / num_pixels
+    if length == 0:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty, empty, empty, True
+
+    if samples_per_pixel < envelope['block_sizes'][0]:
+        audio, _ = sf.read(str(wav_path), start=start, stop=end, dtype='float32', always_2d=True)
+        lower, upper = _as_mono(audio)
+        if samples_per_pixel <= 2:
+            return (start + np.arange(len(lower))) / sr, lower, upper, True
+        starts, lower, upper = _bucket_minmax(lower, upper, num_pixels)
+        return (start + starts) / sr, lower, upper, False
+
+    level = max(k for k, block in enumerate(envelope['block_sizes']) if block <= samples_per_pixel)
+    block = envelope['block_sizes'][level]
+    first, last = start // block, -(-end // block)
+    mins = envelope['mins'][level][first:last]
+    maxs = envelope['maxs'][level][first:last]
+    starts, lower, upper = _bucket_minmax(mins, maxs, num_pixels)
+    return (first + starts) * block / sr, lower, upper, False
+
+
+def build_result_dir_envelopes(result_dir, force=False, audio_types=('enhanced', 'noisy', 'clean')):
+    """
+    為結果目錄中的所有 WAV 建立包絡
+
+    Returns:
+        (num_built, num_skipped)
+    """
+    num_built = num_skipped = 0
+    for audio_type in audio_types:
+        audio_dir = Path(result_dir) / audio_type
+        if not audio_dir.is_dir():
+            continue
+        for wav_path in sorted(audio_dir.glob('*.wav')):
+            if not force and read_envelope(wav_path) is not None:
+                num_skipped += 1
+                continue
+            write_envelope(wav_path, build_envelope_from_file(wav_path))
+            num_built += 1
+    return num_built, num_skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='建立波形的多解析度 min/max 包絡')
+    parser.add_argument('--result-dir', type=str, required=True, help='推理結果目錄路徑')
+    parser.add_argument('--force', action='store_true', help='忽略既有包絡，全部重建')
+
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print(f"📈 建立波形包絡: {args.result_dir}")
+    print("=" * 80)
+    start = time.perf_counter()
+    num_built, num_skipped = build_result_dir_envelopes(args.result_dir, args.force)
+    print(f"✅ 建立 {num_built} 個，沿用 {num_skipped} 個 ({time.perf_counter() - start:.1f}s)")